@@ -0,0 +1,19 @@
+# Generated by Django 4.2.26 on 2026-10-19 06:59
+
+from django.db import migrations, models
+import utils.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_article_sanitized_content_alter_article_content'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='article',
+            name='featured_image',
+            field=models.ImageField(blank=True, null=True, upload_to='articles/', validators=[utils.images.validate_image_dimensions]),
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 from django.utils import timezone
 import bleach
+from utils.images import validate_image_dimensions, downscale_image_field
 
 User = get_user_model()
 
@@ -39,7 +40,10 @@ class Article(models.Model):
     is_published = models.BooleanField(default=False)
     published_at = models.DateTimeField(null=True, blank=True)
     read_time = models.PositiveIntegerField(help_text="Reading time in minutes", default=5)
-    featured_image = models.ImageField(upload_to='articles/', null=True, blank=True)
+    featured_image = models.ImageField(
+        upload_to='articles/', null=True, blank=True,
+        validators=[validate_image_dimensions]
+    )
     meta_description = models.CharField(max_length=160, blank=True, help_text="SEO description")
     
     # Timestamps
@@ -89,6 +93,9 @@ class Article(models.Model):
         if not self.meta_description and self.excerpt:
             self.meta_description = self.excerpt[:160]
         
+        # Shrink oversized uploads before they are written to storage
+        downscale_image_field(self.featured_image)
+        
         super().save(*args, **kwargs)
     
     def calculate_read_time(self):
@@ -1,7 +1,6 @@
 #contact/admin.py
 from django.contrib import admin
 from django.utils.html import format_html
-from django.utils import timezone
 from .models import ContactMessage, ContactSetting
 
 
@@ -25,7 +24,8 @@ class ContactMessageAdmin(admin.ModelAdmin):
     search_fields = ('name', 'email', 'subject', 'message', 'company')
     readonly_fields = (
         'created_at', 'updated_at', 'ip_address', 'user_agent', 
-        'referrer', 'response_sent_at', 'short_message_display'
+        'referrer', 'response_sent_at', 'short_message_display',
+        'notification_sent_at', 'auto_response_sent_at'
     )
     date_hierarchy = 'created_at'
     actions = ['mark_as_read', 'mark_as_replied', 'mark_as_spam']
@@ -41,7 +41,10 @@ class ContactMessageAdmin(admin.ModelAdmin):
             'fields': ('status', 'priority', 'is_processed', 'assigned_to')
         }),
         ('Response', {
-            'fields': ('response_sent', 'response_notes', 'response_sent_at')
+            'fields': (
+                'response_sent', 'response_notes', 'response_sent_at',
+                'notification_sent_at', 'auto_response_sent_at'
+            )
         }),
         ('Internal Notes', {
             'fields': ('internal_notes',)
@@ -76,22 +79,23 @@ class ContactMessageAdmin(admin.ModelAdmin):
         # Contact messages should only be created via API
         return False
 
+    def save_model(self, request, obj, form, change):
+        if 'status' in form.changed_data:
+            obj.confirm_status()
+        super().save_model(request, obj, form, change)
+
     def mark_as_read(self, request, queryset):
-        updated = queryset.update(status='read', is_processed=True)
+        updated = queryset.update(**ContactMessage.status_update_values('read'))
         self.message_user(request, f'{updated} messages marked as read.')
     mark_as_read.short_description = "Mark selected messages as read"
 
     def mark_as_replied(self, request, queryset):
-        updated = queryset.update(
-            status='replied', 
-            response_sent=True, 
-            response_sent_at=timezone.now()
-        )
+        updated = queryset.update(**ContactMessage.status_update_values('replied'))
         self.message_user(request, f'{updated} messages marked as replied.')
     mark_as_replied.short_description = "Mark selected messages as replied"
 
     def mark_as_spam(self, request, queryset):
-        updated = queryset.update(status='spam', is_processed=True)
+        updated = queryset.update(**ContactMessage.status_update_values('spam'))
         self.message_user(request, f'{updated} messages marked as spam.')
     mark_as_spam.short_description = "Mark selected messages as spam"
 
@@ -0,0 +1,125 @@
+"""
+Near-duplicate detection for contact messages.
+
+Every message gets a MinHash signature of its word set: SIGNATURE_SIZE
+independent hash minimums, where the fraction of positions two signatures
+share estimates the Jaccard similarity of the messages. The signature is
+cut into BANDS bands of ROWS values, and each band's hash goes into an
+indexed table (locality-sensitive hashing). Messages that share any band
+become candidates through BANDS equality lookups, and candidates are then
+confirmed against CONTACT_DUPLICATE_SIMILARITY with the full signature.
+
+With 8 bands of 4 rows, a pair at 0.75 similarity becomes a candidate
+about 95% of the time, and a pair at 0.2 about 1% of the time.
+"""
+
+import re
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ContactMessage, MessageFingerprintBand
+
+BANDS = 8
+ROWS = 4
+SIGNATURE_SIZE = BANDS * ROWS
+
+# Short messages ("Hi, can you call me?") look alike without being duplicates
+MIN_WORDS = 8
+
+WORD_RE = re.compile(r'\w+')
+
+# Universal hash family h(x) = (a * x + b) mod p over 32-bit word hashes.
+# The seed is fixed so signatures stay comparable across processes and releases.
+_PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 2 ** 32 - 1, SIGNATURE_SIZE, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 32 - 1, SIGNATURE_SIZE, dtype=np.uint64)
+
+
+def minhash(subject, message):
+    """MinHash signature of a message as bytes, or None if it's too short to compare"""
+    words = set(WORD_RE.findall(f"{subject} {message}".lower()))
+    if len(words) < MIN_WORDS:
+        return None
+    hashes = np.fromiter((zlib.crc32(word.encode()) for word in words), dtype=np.uint64, count=len(words))
+    signature = ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+    return signature.astype('<u4').tobytes()
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(np.frombuffer(signature, '<u4') == np.frombuffer(bytes(other), '<u4')))
+
+
+def bands(signature):
+    band_size = ROWS * 4
+    return [
+        (band, zlib.crc32(signature[band * band_size:(band + 1) * band_size]))
+        for band in range(BANDS)
+    ]
+
+
+def find_near_duplicate(signature, email):
+    """
+    Get the earliest message from `email` in the duplicate window similar
+    enough to `signature`. Only the same sender's messages are considered,
+    so nobody's submission is folded into a stranger's.
+    """
+    since = timezone.now() - timedelta(hours=settings.CONTACT_DUPLICATE_WINDOW_HOURS)
+    band_query = Q()
+    for band, value in bands(signature):
+        band_query |= Q(band=band, value=value)
+    candidates = set(
+        MessageFingerprintBand.objects.filter(band_query, created_at__gte=since)
+        .values_list('message_id', flat=True)
+    )
+    if not candidates:
+        return None
+
+    threshold = settings.CONTACT_DUPLICATE_SIMILARITY
+    matches = ContactMessage.objects.filter(
+        pk__in=candidates, email__iexact=email, fingerprint__isnull=False
+    ).order_by('created_at')
+    for message in matches.only('id', 'fingerprint', 'created_at'):
+        if similarity(signature, message.fingerprint) >= threshold:
+            return message
+    return None
+
+
+def band_rows(message, signature):
+    """Unsaved band rows for a saved message"""
+    return [
+        MessageFingerprintBand(message=message, band=band, value=value, created_at=message.created_at)
+        for band, value in bands(signature)
+    ]
+
+
+def record_fingerprint(message, signature):
+    """Store a new message's signature and its bands"""
+    ContactMessage.objects.filter(pk=message.pk).update(fingerprint=signature)
+    message.fingerprint = signature
+    MessageFingerprintBand.objects.bulk_create(band_rows(message, signature))
+
+
+def fold_duplicate(original):
+    """Count a resubmission against the original message instead of storing it"""
+    with transaction.atomic():
+        message = ContactMessage.objects.select_for_update().only('id', 'metadata').get(pk=original.pk)
+        metadata = message.metadata or {}
+        metadata['duplicate_count'] = metadata.get('duplicate_count', 0) + 1
+        metadata['last_duplicate_at'] = timezone.now().isoformat()
+        ContactMessage.objects.filter(pk=message.pk).update(metadata=metadata)
+    return metadata['duplicate_count']
+
+
+def prune_fingerprint_bands():
+    """Delete bands older than the duplicate window; they can no longer match"""
+    cutoff = timezone.now() - timedelta(hours=settings.CONTACT_DUPLICATE_WINDOW_HOURS)
+    deleted, _ = MessageFingerprintBand.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
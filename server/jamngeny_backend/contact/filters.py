@@ -0,0 +1,12 @@
+import django_filters
+from .models import ContactMessage
+
+
+class ContactMessageFilter(django_filters.FilterSet):
+    """Inbox filters, shared by the message list and bulk updates"""
+    created_after = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = ContactMessage
+        fields = ['status', 'priority', 'source', 'category', 'is_processed', 'assigned_to']
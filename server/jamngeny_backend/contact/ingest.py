@@ -0,0 +1,242 @@
+"""
+Write-behind ingestion for the contact form.
+
+With CONTACT_WRITE_BEHIND on, the create view validates a submission,
+appends it to a Redis stream and answers 202 without touching the
+database. drain_submissions() reads the stream through a consumer group
+and saves each batch with one bulk_create, together with the spam scoring,
+duplicate folding and email queueing that the synchronous path does per
+request. Entries are acknowledged only after their batch commits. Entries
+held by a drainer that died are claimed again after CLAIM_IDLE_MS. Message
+ids are assigned when the submission is buffered, so a replayed entry is
+recognised and skipped rather than saved twice.
+
+When a batch fails, its entries are saved one at a time so one bad entry
+doesn't hold back the rest. An entry that still fails is left pending and
+retried after CLAIM_IDLE_MS; once it has been delivered MAX_DELIVERIES
+times it is moved to DEAD_LETTER_STREAM with the error and acknowledged.
+
+bulk_create doesn't call ContactMessage.save() or send post_save, so
+buffered messages get no automatic audit entry.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .dedup import band_rows, find_near_duplicate, fold_duplicate, minhash, similarity
+from .models import ContactMessage, MessageFingerprintBand
+from .spam import classify_submission
+from .tasks import enqueue_contact_emails
+
+logger = logging.getLogger(__name__)
+
+STREAM = 'contact:submissions'
+GROUP = 'contact-drainers'
+DEAD_LETTER_STREAM = 'contact:submissions:dead'
+
+# Deliveries of a failing entry before it's moved to the dead-letter stream
+MAX_DELIVERIES = 5
+
+# Pending entries idle this long belong to a drainer that stopped mid-batch
+CLAIM_IDLE_MS = 5 * 60 * 1000
+
+# Seconds to answer synchronously after Redis fails before trying it again
+REDIS_RETRY_INTERVAL = 30
+
+
+class SubmissionBuffer:
+    """The Redis stream that buffered submissions wait in"""
+
+    def __init__(self, redis_url):
+        import redis
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        self.consumer = f'{socket.gethostname()}-{os.getpid()}'
+        self._group_ready = False
+        self._down_until = 0
+
+    def append(self, fields):
+        """Buffer a submission; returns False if Redis can't take it right now"""
+        import redis
+        if time.time() < self._down_until:
+            return False
+        try:
+            self.client.xadd(STREAM, {'data': json.dumps(fields, cls=DjangoJSONEncoder)})
+            return True
+        except redis.RedisError as e:
+            logger.warning("Contact submission buffer unavailable, saving directly: %s", e)
+            self._down_until = time.time() + REDIS_RETRY_INTERVAL
+            return False
+
+    def _ensure_group(self):
+        import redis
+        if self._group_ready:
+            return
+        try:
+            self.client.xgroup_create(STREAM, GROUP, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def read(self, count):
+        """Next entries for this consumer, starting with abandoned ones, as (id, raw data) pairs"""
+        self._ensure_group()
+        _, entries, *_ = self.client.xautoclaim(
+            STREAM, GROUP, self.consumer, min_idle_time=CLAIM_IDLE_MS, count=count
+        )
+        if not entries:
+            response = self.client.xreadgroup(GROUP, self.consumer, {STREAM: '>'}, count=count)
+            entries = response[0][1] if response else []
+        # Entries deleted after being read have no fields
+        return [(entry_id, fields[b'data'] if fields else None) for entry_id, fields in entries]
+
+    def acknowledge(self, entry_ids):
+        pipe = self.client.pipeline()
+        pipe.xack(STREAM, GROUP, *entry_ids)
+        pipe.xdel(STREAM, *entry_ids)
+        pipe.execute()
+
+    def deliveries(self, entry_id):
+        """How many times an entry has been handed to a drainer"""
+        pending = self.client.xpending_range(STREAM, GROUP, min=entry_id, max=entry_id, count=1)
+        return pending[0]['times_delivered'] if pending else 0
+
+    def dead_letter(self, entry_id, data, error):
+        """Move an entry that can't be saved to the dead-letter stream"""
+        pipe = self.client.pipeline()
+        pipe.xadd(DEAD_LETTER_STREAM, {'entry_id': entry_id, 'data': data, 'error': error})
+        pipe.xack(STREAM, GROUP, entry_id)
+        pipe.xdel(STREAM, entry_id)
+        pipe.execute()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_submission_buffer():
+    """Get the process-wide submission buffer"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = SubmissionBuffer(settings.CONTACT_INGEST_REDIS_URL)
+    return _buffer
+
+
+def buffer_submission(serializer):
+    """Queue a validated submission for the drainer; returns its message id, or None if it can't be queued"""
+    fields = dict(serializer.validated_data)
+    fields.pop('recaptcha_token', None)
+    fields.update(serializer.request_fields())
+    fields['id'] = str(uuid.uuid4())
+    fields['received_at'] = timezone.now()
+    if not get_submission_buffer().append(fields):
+        return None
+    return fields['id']
+
+
+def save_submissions(submissions):
+    """Save buffered submissions in one transaction; returns the messages created"""
+    threshold = settings.CONTACT_DUPLICATE_SIMILARITY
+    ids = [submission['id'] for submission in submissions]
+
+    with transaction.atomic():
+        # Entries replayed after a crash between commit and acknowledgement
+        existing = {str(pk) for pk in ContactMessage.objects.filter(pk__in=ids).values_list('pk', flat=True)}
+
+        messages = []
+        for submission in submissions:
+            if submission['id'] in existing:
+                continue
+            submission = dict(submission)
+            received_at = submission.pop('received_at')
+            classification = classify_submission(submission)
+            message = ContactMessage(source='website', **submission, **classification)
+            message.metadata = {**(message.metadata or {}), 'received_at': received_at}
+
+            message.fingerprint = minhash(message.subject, message.message)
+            if message.fingerprint is not None:
+                # Resubmissions fold into the sender's earlier message, whether stored or in this batch
+                original = next(
+                    (other for other in messages if other.fingerprint is not None
+                     and other.email.lower() == message.email.lower()
+                     and similarity(message.fingerprint, other.fingerprint) >= threshold),
+                    None
+                )
+                if original is not None:
+                    original.metadata['duplicate_count'] = original.metadata.get('duplicate_count', 0) + 1
+                    original.metadata['last_duplicate_at'] = received_at
+                    continue
+                original = find_near_duplicate(message.fingerprint, message.email)
+                if original is not None:
+                    fold_duplicate(original)
+                    continue
+            messages.append(message)
+
+        ContactMessage.objects.bulk_create(messages)
+        MessageFingerprintBand.objects.bulk_create([
+            band for message in messages if message.fingerprint is not None
+            for band in band_rows(message, message.fingerprint)
+        ])
+        if messages:
+            enqueue_contact_emails(*messages)
+    return messages
+
+
+def _save_entry(buffer, entry_id, data):
+    """Save one entry on its own; returns True if it's done with (saved or dead-lettered)"""
+    try:
+        save_submissions([json.loads(data)])
+    except Exception as e:
+        deliveries = buffer.deliveries(entry_id)
+        # Undecodable data won't get better with retries
+        if deliveries < MAX_DELIVERIES and not isinstance(e, ValueError):
+            logger.exception("Could not save contact submission %s (delivery %d)", entry_id, deliveries)
+            return False
+        logger.exception("Moving contact submission %s to %s", entry_id, DEAD_LETTER_STREAM)
+        buffer.dead_letter(entry_id, data, repr(e))
+        return True
+    buffer.acknowledge([entry_id])
+    return True
+
+
+def drain_submissions(batch_size=200, max_batches=None):
+    """Save buffered submissions until the stream is empty; returns how many were read"""
+    buffer = get_submission_buffer()
+    read = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        entries = buffer.read(batch_size)
+        if not entries:
+            break
+        read += len(entries)
+        batches += 1
+
+        deleted = [entry_id for entry_id, data in entries if data is None]
+        if deleted:
+            buffer.acknowledge(deleted)
+        entries = [(entry_id, data) for entry_id, data in entries if data is not None]
+        if not entries:
+            continue
+        try:
+            save_submissions([json.loads(data) for _, data in entries])
+        except Exception:
+            logger.exception("Could not save a batch of %d contact submissions; saving them one at a time", len(entries))
+            failed = [entry_id for entry_id, data in entries if not _save_entry(buffer, entry_id, data)]
+            if len(failed) == len(entries):
+                # Nothing could be saved (the database is likely down); retry after CLAIM_IDLE_MS
+                break
+            continue
+        buffer.acknowledge([entry_id for entry_id, _ in entries])
+    return read
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from contact.retention import apply_retention
+
+
+class Command(BaseCommand):
+    help = "Move contact messages past their status's retention period into the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Messages moved per transaction"
+        )
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help="Stop after this many batches per status"
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        archived = apply_retention(batch_size=options['batch_size'], max_batches=options['max_batches'])
+        summary = ', '.join(f"{count} {status}" for status, count in archived.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {summary} messages in {time.monotonic() - started:.1f}s"
+        ))
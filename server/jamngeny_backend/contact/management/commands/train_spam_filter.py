@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from contact.spam import train_spam_filter
+
+
+class Command(BaseCommand):
+    help = "Train the contact spam filter on messages labelled spam, read or replied"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Messages read per batch"
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Discard the current counts and train from scratch"
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        trained = train_spam_filter(batch_size=options['batch_size'], rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained spam filter on {trained} messages in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.26 on 2026-10-19 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contact', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contactmessage',
+            name='auto_response_sent_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='contactmessage',
+            name='notification_sent_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
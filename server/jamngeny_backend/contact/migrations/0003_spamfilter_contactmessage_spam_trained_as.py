@@ -0,0 +1,32 @@
+# Generated by Django 4.2.26 on 2026-10-19 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contact', '0002_contactmessage_auto_response_sent_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamFilter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_counts', models.BinaryField(blank=True)),
+                ('ham_documents', models.PositiveIntegerField(default=0)),
+                ('spam_documents', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Spam Filter',
+                'verbose_name_plural': 'Spam Filter',
+            },
+        ),
+        migrations.AddField(
+            model_name='contactmessage',
+            name='spam_trained_as',
+            field=models.CharField(blank=True, editable=False, max_length=4),
+        ),
+    ]
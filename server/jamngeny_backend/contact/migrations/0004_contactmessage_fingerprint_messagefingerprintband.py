@@ -0,0 +1,32 @@
+# Generated by Django 4.2.26 on 2026-10-19 07:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contact', '0003_spamfilter_contactmessage_spam_trained_as'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contactmessage',
+            name='fingerprint',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='MessageFingerprintBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('value', models.BigIntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint_bands', to='contact.contactmessage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'value', 'created_at'], name='contact_mes_band_d449e5_idx'), models.Index(fields=['created_at'], name='contact_mes_created_cea085_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.26 on 2026-10-19 07:09
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+BACKFILL_BATCH_SIZE = 5000
+
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('english', coalesce({row}.subject, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}.name, '') || ' ' || coalesce({row}.email, '') || ' ' || coalesce({row}.company, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce({row}.message, '')), 'C')
+"""
+
+CREATE_TRIGGER_SQL = f"""
+CREATE FUNCTION contact_message_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR_SQL.format(row='NEW')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER contact_message_search_vector_trigger
+BEFORE INSERT OR UPDATE OF subject, name, email, company, message
+ON contact_contactmessage
+FOR EACH ROW EXECUTE FUNCTION contact_message_search_vector_update();
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS contact_message_search_vector_trigger ON contact_contactmessage;
+DROP FUNCTION IF EXISTS contact_message_search_vector_update();
+"""
+
+
+def backfill_search_vectors(apps, schema_editor):
+    # Short batches so existing rows are never locked for long
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                f"""
+                UPDATE contact_contactmessage AS m
+                SET search_vector = {SEARCH_VECTOR_SQL.format(row='m')}
+                WHERE m.id IN (
+                    SELECT id FROM contact_contactmessage
+                    WHERE search_vector IS NULL
+                    LIMIT %s
+                )
+                """,
+                [BACKFILL_BATCH_SIZE],
+            )
+            if cursor.rowcount < BACKFILL_BATCH_SIZE:
+                break
+
+
+class Migration(migrations.Migration):
+    # Backfill in separate transactions and build the index without locking writes
+    atomic = False
+
+    dependencies = [
+        ('contact', '0004_contactmessage_fingerprint_messagefingerprintband'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contactmessage',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER_SQL, DROP_TRIGGER_SQL),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='contactmessage',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='contact_message_search_gin'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.26 on 2026-10-19 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contact', '0005_contactmessage_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedContactMessage',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('email', models.EmailField(db_index=True, max_length=254)),
+                ('status', models.CharField(choices=[('new', 'New'), ('read', 'Read'), ('replied', 'Replied'), ('archived', 'Archived'), ('spam', 'Spam')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Archived Contact Message',
+                'verbose_name_plural': 'Archived Contact Messages',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['archived_at'], name='contact_arc_archive_a1195d_idx')],
+            },
+        ),
+    ]
@@ -1,12 +1,29 @@
 #contact/models.py
 import uuid
 from django.db import models
+from django.db.models import F, Func, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import SearchVectorField
+from django.contrib.postgres.indexes import GinIndex
+from utils.singletons import SingletonCache
 
 User = get_user_model()
 
 
+class JSONRemovePath(Func):
+    """The jsonb document with the value at `path` removed (the #- operator)"""
+    template = '(%(expressions)s)'
+    arg_joiner = ' #- '
+    output_field = models.JSONField()
+
+
+# Set by the spam filter on messages it flagged, until a person confirms a status
+AUTO_FLAGGED_PATH = Value(['spam', 'auto_flagged'], output_field=ArrayField(models.TextField()))
+
+
 class ContactMessage(models.Model):
     SOURCE_CHOICES = [
         ('website', 'Website Form'),
@@ -70,6 +87,19 @@ class ContactMessage(models.Model):
     response_notes = models.TextField(blank=True, help_text="Notes about the response sent")
     response_sent_at = models.DateTimeField(null=True, blank=True)
     
+    # Email Delivery (set by the background dispatcher)
+    notification_sent_at = models.DateTimeField(null=True, blank=True, editable=False)
+    auto_response_sent_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Spam Filtering ('spam' or 'ham' once the message has been used for training)
+    spam_trained_as = models.CharField(max_length=4, blank=True, editable=False)
+    
+    # Near-duplicate detection (MinHash signature, see contact.dedup)
+    fingerprint = models.BinaryField(null=True, blank=True, editable=False)
+    
+    # Full-text search, kept up to date by a database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     # Technical Information
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
@@ -103,6 +133,7 @@ class ContactMessage(models.Model):
             models.Index(fields=['email', 'created_at']),
             models.Index(fields=['source', 'created_at']),
             models.Index(fields=['is_processed', 'created_at']),
+            GinIndex(fields=['search_vector'], name='contact_message_search_gin'),
         ]
         verbose_name = 'Contact Message'
         verbose_name_plural = 'Contact Messages'
@@ -136,6 +167,26 @@ class ContactMessage(models.Model):
         """Get truncated message for listings"""
         return self.message[:100] + "..." if len(self.message) > 100 else self.message
 
+    def confirm_status(self):
+        """Record that a person chose the status, so the spam filter may learn from it"""
+        spam = (self.metadata or {}).get('spam')
+        if spam:
+            spam.pop('auto_flagged', None)
+
+    @staticmethod
+    def status_update_values(status):
+        """Field values that go with moving messages to `status`, for queryset updates"""
+        # Statuses set this way are chosen by a person; see confirm_status()
+        values = {'status': status, 'metadata': JSONRemovePath(F('metadata'), AUTO_FLAGGED_PATH)}
+        if status in ('read', 'replied', 'archived', 'spam'):
+            values['is_processed'] = True
+        if status == 'replied':
+            values['response_sent'] = True
+            values['response_sent_at'] = Coalesce(
+                F('response_sent_at'), Value(timezone.now(), output_field=models.DateTimeField())
+            )
+        return values
+
     def mark_as_read(self):
         """Mark message as read"""
         self.status = 'read'
@@ -150,6 +201,29 @@ class ContactMessage(models.Model):
         self.save()
 
 
+class MessageFingerprintBand(models.Model):
+    """
+    One band of a contact message's MinHash signature, for near-duplicate lookups
+    """
+    message = models.ForeignKey(
+        ContactMessage,
+        on_delete=models.CASCADE,
+        related_name='fingerprint_bands'
+    )
+    band = models.PositiveSmallIntegerField()
+    value = models.BigIntegerField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'value', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"Band {self.band}={self.value} of {self.message_id}"
+
+
 class ContactSetting(models.Model):
     """
     Singleton model for contact form settings
@@ -223,9 +297,15 @@ class ContactSetting(models.Model):
 
     @classmethod
     def get_instance(cls):
-        """Get or create the singleton instance"""
-        if cls.objects.exists():
-            return cls.objects.first()
+        """Get the singleton instance from the process cache"""
+        return contact_setting_cache.get()
+
+    @classmethod
+    def load_instance(cls):
+        """Get or create the singleton instance from the database"""
+        instance = cls.objects.first()
+        if instance:
+            return instance
         else:
             return cls.objects.create(
                 auto_response_subject='Thank you for your message',
@@ -238,4 +318,53 @@ class ContactSetting(models.Model):
         """Get notification emails as list"""
         if self.notification_emails:
             return [email.strip() for email in self.notification_emails.split(',')]
-        return []
\ No newline at end of file
+        return []
+
+
+contact_setting_cache = SingletonCache(ContactSetting, ContactSetting.load_instance)
+
+
+class SpamFilter(models.Model):
+    """
+    Singleton holding the token counts of the naive-Bayes spam filter
+    """
+    # zlib-compressed NumPy array of shape (2, features): ham counts, spam counts
+    token_counts = models.BinaryField(blank=True)
+    ham_documents = models.PositiveIntegerField(default=0)
+    spam_documents = models.PositiveIntegerField(default=0)
+    
+    # Timestamps
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Spam Filter'
+        verbose_name_plural = 'Spam Filter'
+
+    def __str__(self):
+        return f"Spam Filter ({self.spam_documents} spam / {self.ham_documents} ham)"
+
+
+class ArchivedContactMessage(models.Model):
+    """
+    A contact message moved out of the inbox by the retention job
+    """
+    # Same id as the original message, so links to it keep resolving
+    id = models.UUIDField(primary_key=True, editable=False)
+    email = models.EmailField(db_index=True)
+    status = models.CharField(max_length=20, choices=ContactMessage.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    # zlib-compressed JSON of every field of the original row
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['archived_at']),
+        ]
+        verbose_name = 'Archived Contact Message'
+        verbose_name_plural = 'Archived Contact Messages'
+
+    def __str__(self):
+        return f"Archived message from {self.email} ({self.created_at:%Y-%m-%d})"
@@ -0,0 +1,110 @@
+"""
+Email notifications and auto-responses for contact messages.
+
+Emails are sent from Celery, never from the request. Each dispatch opens a
+single SMTP connection for the whole batch. Each email is claimed before it
+is sent, by stamping its *_sent_at field with a conditional UPDATE, so the
+periodic sweep and the per-message task never both send it. A failed send
+clears the stamp again for the retry.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ContactMessage, ContactSetting
+
+logger = logging.getLogger(__name__)
+
+
+def build_notification(message, recipients):
+    """Build the email telling the team about a new message"""
+    lines = [
+        f"Name: {message.name}",
+        f"Email: {message.email}",
+    ]
+    if message.phone:
+        lines.append(f"Phone: {message.phone}")
+    if message.company:
+        lines.append(f"Company: {message.company}")
+    if message.category:
+        lines.append(f"Category: {message.category}")
+    lines += ['', message.message]
+
+    return EmailMessage(
+        subject=f"New contact message: {message.display_subject}",
+        body='\n'.join(lines),
+        to=recipients,
+        reply_to=[message.email],
+    )
+
+
+def build_auto_response(message, contact_settings):
+    """Build the acknowledgement sent back to the person who wrote in"""
+    return EmailMessage(
+        subject=contact_settings.auto_response_subject or 'Thank you for your message',
+        body=f"Hi {message.name},\n\n{contact_settings.auto_response_message}",
+        to=[message.email],
+    )
+
+
+def pending_email_filter(contact_settings):
+    """Q matching messages that still need an email under the current settings"""
+    query = Q()
+    if contact_settings.notify_on_new_message and contact_settings.notification_emails_list:
+        query |= Q(notification_sent_at__isnull=True)
+    if contact_settings.auto_response_enabled and contact_settings.auto_response_message:
+        query |= Q(auto_response_sent_at__isnull=True)
+    return query
+
+
+def send_contact_emails(message_ids=None, max_age_hours=24):
+    """
+    Send pending notifications and auto-responses over one SMTP connection.
+    With `message_ids` only those messages are considered, otherwise every
+    message from the last `max_age_hours`. Returns the number of emails sent.
+    """
+    contact_settings = ContactSetting.get_instance()
+    query = pending_email_filter(contact_settings)
+    if not query:
+        return 0
+
+    messages = ContactMessage.objects.filter(query).exclude(status='spam')
+    if message_ids is not None:
+        messages = messages.filter(pk__in=message_ids)
+    else:
+        messages = messages.filter(created_at__gte=timezone.now() - timedelta(hours=max_age_hours))
+
+    recipients = contact_settings.notification_emails_list
+    outgoing = []
+    for message in messages.order_by('created_at'):
+        if (contact_settings.notify_on_new_message and recipients
+                and message.notification_sent_at is None):
+            outgoing.append((message.pk, 'notification_sent_at', build_notification(message, recipients)))
+        if (contact_settings.auto_response_enabled and contact_settings.auto_response_message
+                and message.auto_response_sent_at is None):
+            outgoing.append((message.pk, 'auto_response_sent_at', build_auto_response(message, contact_settings)))
+
+    if not outgoing:
+        return 0
+
+    sent = 0
+    with get_connection() as connection:
+        for pk, field, email in outgoing:
+            claimed_at = timezone.now()
+            # Another dispatch may have claimed it since the read above
+            if not ContactMessage.objects.filter(pk=pk, **{f'{field}__isnull': True}).update(**{field: claimed_at}):
+                continue
+            email.connection = connection
+            try:
+                email.send()
+            except Exception:
+                # Release the claim; the error propagates so the task retries
+                ContactMessage.objects.filter(pk=pk, **{field: claimed_at}).update(**{field: None})
+                raise
+            sent += 1
+    logger.info("Sent %d contact emails", sent)
+    return sent
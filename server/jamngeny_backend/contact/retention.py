@@ -0,0 +1,114 @@
+"""
+Retention for contact messages that have left the inbox.
+
+CONTACT_RETENTION_DAYS maps a status to how many days a message may sit in
+it (counted from its last update) before it is moved out of the
+ContactMessage table. Each batch copies the rows into
+ArchivedContactMessage as zlib-compressed JSON and deletes them from the
+inbox in one short transaction, so the inbox indexes only carry live rows
+and no long-running lock is held however large the backlog is.
+"""
+
+import datetime
+import json
+import logging
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedContactMessage, ContactMessage
+
+logger = logging.getLogger(__name__)
+
+# Derived data that is rebuilt from the other fields or only matters in the inbox
+SKIPPED_FIELDS = {'fingerprint', 'search_vector'}
+
+
+def archived_fields():
+    return [
+        field.attname for field in ContactMessage._meta.concrete_fields
+        if field.name not in SKIPPED_FIELDS
+    ]
+
+
+class ArchiveJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder that keeps the microseconds it drops from datetimes"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def compress_row(row):
+    return zlib.compress(json.dumps(row, cls=ArchiveJSONEncoder, separators=(',', ':')).encode())
+
+
+def decompress_row(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def archive_batch(status, cutoff, batch_size):
+    """Move one batch of messages in `status` last updated before `cutoff`; returns how many"""
+    fields = archived_fields()
+    with transaction.atomic():
+        rows = list(
+            ContactMessage.objects.filter(status=status, updated_at__lt=cutoff)
+            .select_for_update(skip_locked=True)
+            .order_by('updated_at')
+            .values(*fields)[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        # ignore_conflicts makes a rerun after a partial failure harmless
+        ArchivedContactMessage.objects.bulk_create([
+            ArchivedContactMessage(
+                id=row['id'],
+                email=row['email'].lower(),
+                status=row['status'],
+                created_at=row['created_at'],
+                data=compress_row(row),
+            )
+            for row in rows
+        ], ignore_conflicts=True)
+        ContactMessage.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def apply_retention(batch_size=500, max_batches=None):
+    """Archive every message past its status's retention period; returns counts by status"""
+    now = timezone.now()
+    archived = {}
+    for status, days in settings.CONTACT_RETENTION_DAYS.items():
+        cutoff = now - datetime.timedelta(days=days)
+        archived[status] = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            moved = archive_batch(status, cutoff, batch_size)
+            archived[status] += moved
+            batches += 1
+            if moved < batch_size:
+                break
+        if archived[status]:
+            logger.info("Archived %d %s contact messages", archived[status], status)
+    return archived
+
+
+def find_archived_messages(message_id=None, email=None, limit=100):
+    """Archived messages with the given id or sender address, newest first, as dicts"""
+    queryset = ArchivedContactMessage.objects.all()
+    if message_id:
+        queryset = queryset.filter(pk=message_id)
+    if email:
+        queryset = queryset.filter(email=email.lower())
+
+    messages = []
+    for archived in queryset.order_by('-created_at')[:limit]:
+        message = decompress_row(archived.data)
+        message['archived_at'] = archived.archived_at
+        messages.append(message)
+    return messages
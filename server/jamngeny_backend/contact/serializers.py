@@ -1,7 +1,11 @@
 #contact/serializers.py
 from rest_framework import serializers
 from django.core.validators import validate_email
+from django.contrib.auth import get_user_model
 from .models import ContactMessage, ContactSetting
+from .filters import ContactMessageFilter
+
+User = get_user_model()
 
 
 class ContactMessageCreateSerializer(serializers.ModelSerializer):
@@ -32,14 +36,21 @@ class ContactMessageCreateSerializer(serializers.ModelSerializer):
         validated_data.pop('recaptcha_token', None)
         
         # Get IP address and user agent from request
-        request = self.context.get('request')
-        if request:
-            validated_data['ip_address'] = self.get_client_ip(request)
-            validated_data['user_agent'] = request.META.get('HTTP_USER_AGENT', '')
-            validated_data['referrer'] = request.META.get('HTTP_REFERER', '')
+        validated_data.update(self.request_fields())
         
         return ContactMessage.objects.create(**validated_data)
 
+    def request_fields(self):
+        """Fields recorded from the submitting request rather than the form"""
+        request = self.context.get('request')
+        if not request:
+            return {}
+        return {
+            'ip_address': self.get_client_ip(request),
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'referrer': request.META.get('HTTP_REFERER', ''),
+        }
+
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
@@ -93,9 +104,51 @@ class ContactMessageUpdateSerializer(serializers.ModelSerializer):
             from django.utils import timezone
             instance.response_sent_at = timezone.now()
         
+        if 'status' in validated_data:
+            instance.confirm_status()
         return super().update(instance, validated_data)
 
 
+class ContactMessageBulkUpdateSerializer(serializers.Serializer):
+    """Select messages by id list or inbox filters and describe the change to apply"""
+    ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=False)
+    filters = serializers.DictField(required=False)
+    
+    status = serializers.ChoiceField(choices=ContactMessage.STATUS_CHOICES, required=False)
+    priority = serializers.ChoiceField(choices=ContactMessage.PRIORITY_CHOICES, required=False)
+    assigned_to = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False, allow_null=True)
+    archive = serializers.BooleanField(required=False)
+
+    def validate_filters(self, value):
+        filterset = ContactMessageFilter(data=value, queryset=ContactMessage.objects.all())
+        if not filterset.is_valid():
+            raise serializers.ValidationError(filterset.errors)
+        unknown = set(value) - set(filterset.filters)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown filters: {', '.join(sorted(unknown))}")
+        return value
+
+    def validate(self, data):
+        if ('ids' in data) == ('filters' in data):
+            raise serializers.ValidationError("Provide either 'ids' or 'filters'.")
+        if data.get('archive'):
+            if data.get('status', 'archived') != 'archived':
+                raise serializers.ValidationError("'archive' can't be combined with another status.")
+            data['status'] = 'archived'
+        data.pop('archive', None)
+        if not any(field in data for field in ('status', 'priority', 'assigned_to')):
+            raise serializers.ValidationError("Provide at least one of 'status', 'priority', 'assigned_to' or 'archive'.")
+        return data
+
+    def get_queryset(self):
+        """Messages selected by the validated ids or filters"""
+        if 'ids' in self.validated_data:
+            return ContactMessage.objects.filter(pk__in=self.validated_data['ids'])
+        return ContactMessageFilter(
+            data=self.validated_data['filters'], queryset=ContactMessage.objects.all()
+        ).qs
+
+
 class ContactSettingSerializer(serializers.ModelSerializer):
     notification_emails_list = serializers.ListField(
         child=serializers.EmailField(),
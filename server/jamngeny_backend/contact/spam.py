@@ -0,0 +1,184 @@
+"""
+Naive-Bayes spam scoring for contact messages.
+
+Tokens are hashed into FEATURES buckets, so the model is two fixed-size
+count arrays however large the vocabulary grows. Scoring indexes a
+precomputed log-likelihood-ratio array with the message's token hashes and
+sums the result, which takes a few microseconds per message.
+
+Training is incremental. Each message records the label it was counted
+under (spam_trained_as). A relabelled message moves its counts to the new
+class instead of being counted twice.
+"""
+
+import io
+import logging
+import math
+import re
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, F, Value, When
+
+from utils.singletons import SingletonCache
+from .models import ContactMessage, SpamFilter
+
+logger = logging.getLogger(__name__)
+
+FEATURE_BITS = 18
+FEATURES = 1 << FEATURE_BITS
+HAM, SPAM = 0, 1
+LABELS = {'ham': HAM, 'spam': SPAM}
+
+# Documents needed in each class before the filter starts flagging messages
+MIN_DOCUMENTS = 20
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'_-]{1,29}")
+URL_HOST_RE = re.compile(r'https?://([^/\s:?#]+)', re.IGNORECASE)
+
+
+def message_tokens(subject, message, email=''):
+    """Split a message into the tokens the filter counts"""
+    tokens = TOKEN_RE.findall(f"{subject}\n{message}".lower())
+    # Subject words and link targets are strong signals on their own
+    tokens += ['subject:' + token for token in TOKEN_RE.findall(subject.lower())]
+    tokens += ['url:' + host.lower() for host in URL_HOST_RE.findall(message)]
+    if '@' in email:
+        tokens.append('domain:' + email.rsplit('@', 1)[1].lower())
+    return tokens
+
+
+def hash_tokens(tokens):
+    """Map tokens to feature indexes"""
+    crc32 = zlib.crc32
+    hashes = np.fromiter((crc32(token.encode()) for token in tokens), dtype=np.uint32, count=len(tokens))
+    return (hashes & (FEATURES - 1)).astype(np.intp)
+
+
+def load_counts(spam_filter):
+    if spam_filter is None or not spam_filter.token_counts:
+        return np.zeros((2, FEATURES), dtype=np.int32)
+    return np.load(io.BytesIO(zlib.decompress(bytes(spam_filter.token_counts))))
+
+
+def dump_counts(counts):
+    buffer = io.BytesIO()
+    np.save(buffer, counts, allow_pickle=False)
+    return zlib.compress(buffer.getvalue())
+
+
+class SpamClassifier:
+    """Multinomial naive Bayes over hashed token counts"""
+
+    def __init__(self, counts, ham_documents, spam_documents):
+        self.ready = min(ham_documents, spam_documents) >= MIN_DOCUMENTS
+        totals = counts.sum(axis=1, dtype=np.float64)
+        # Laplace-smoothed log P(token | class)
+        log_probs = np.log(counts + 1.0) - np.log(totals + FEATURES)[:, None]
+        self.weights = (log_probs[SPAM] - log_probs[HAM]).astype(np.float32)
+        self.prior = math.log((spam_documents + 1) / (ham_documents + 1))
+
+    @classmethod
+    def from_filter(cls, spam_filter):
+        if spam_filter is None:
+            return cls(load_counts(None), 0, 0)
+        return cls(load_counts(spam_filter), spam_filter.ham_documents, spam_filter.spam_documents)
+
+    def score(self, tokens):
+        """Probability that a message is spam, or None if the filter isn't trained yet"""
+        if not self.ready or not tokens:
+            return None
+        log_odds = self.prior + float(self.weights[hash_tokens(tokens)].sum())
+        log_odds = max(-50.0, min(50.0, log_odds))
+        return 1.0 / (1.0 + math.exp(-log_odds))
+
+
+classifier_cache = SingletonCache(
+    SpamFilter,
+    lambda: SpamClassifier.from_filter(SpamFilter.objects.first()),
+    copy_result=False,
+)
+
+
+def classify_submission(data):
+    """Score a validated submission and return the ContactMessage fields to save with it"""
+    tokens = message_tokens(data.get('subject', ''), data.get('message', ''), data.get('email', ''))
+    score = classifier_cache.get().score(tokens)
+    if score is None:
+        return {}
+
+    spam_metadata = {'score': round(score, 4)}
+    fields = {'metadata': {'spam': spam_metadata}}
+    if score >= settings.CONTACT_SPAM_THRESHOLD:
+        spam_metadata['auto_flagged'] = True
+        fields.update(status='spam', priority='low')
+    return fields
+
+
+def train_spam_filter(batch_size=500, rebuild=False):
+    """
+    Fold labelled messages into the filter: 'spam' as spam, 'read' and
+    'replied' as ham. Only messages whose label changed since they were
+    last counted are read, unless `rebuild` starts over from zero.
+    Returns the number of messages counted.
+    """
+    label = Case(
+        When(status='spam', then=Value('spam')),
+        When(status__in=['read', 'replied'], then=Value('ham')),
+        default=Value(''),
+        output_field=CharField(),
+    )
+
+    with transaction.atomic():
+        # Serialize training runs; scoring keeps using the cached classifier meanwhile
+        spam_filter = SpamFilter.objects.select_for_update().first() or SpamFilter.objects.create()
+        if rebuild:
+            ContactMessage.objects.exclude(spam_trained_as='').update(spam_trained_as='')
+            counts = load_counts(None)
+            documents = [0, 0]
+        else:
+            counts = load_counts(spam_filter)
+            documents = [spam_filter.ham_documents, spam_filter.spam_documents]
+
+        # The filter's own verdicts are only learnt from once a person confirms
+        # them (ContactMessage.confirm_status clears the flag)
+        pending = ContactMessage.objects.annotate(label=label).exclude(label='').exclude(
+            label=F('spam_trained_as')
+        ).exclude(metadata__contains={'spam': {'auto_flagged': True}}).order_by('pk')
+
+        trained = 0
+        last_pk = None
+        while True:
+            batch_queryset = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+            batch = list(batch_queryset.values_list(
+                'pk', 'subject', 'message', 'email', 'spam_trained_as', 'label'
+            )[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            updates = {'spam': [], 'ham': [], '': []}
+            for pk, subject, message, email, trained_as, new_label in batch:
+                indexes = hash_tokens(message_tokens(subject, message, email))
+                if trained_as:
+                    np.subtract.at(counts[LABELS[trained_as]], indexes, 1)
+                    documents[LABELS[trained_as]] -= 1
+                if new_label:
+                    np.add.at(counts[LABELS[new_label]], indexes, 1)
+                    documents[LABELS[new_label]] += 1
+                updates[new_label].append(pk)
+                trained += 1
+
+            for new_label, pks in updates.items():
+                if pks:
+                    ContactMessage.objects.filter(pk__in=pks).update(spam_trained_as=new_label)
+
+        if trained or rebuild:
+            spam_filter.token_counts = dump_counts(counts)
+            spam_filter.ham_documents, spam_filter.spam_documents = documents
+            spam_filter.save()
+
+    logger.info("Spam filter trained on %d messages", trained)
+    return trained
@@ -0,0 +1,63 @@
+import logging
+import smtplib
+
+from celery import shared_task
+from django.db import transaction
+
+from .dedup import prune_fingerprint_bands
+from .notifications import send_contact_emails
+from .retention import apply_retention
+from .spam import train_spam_filter
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(
+    autoretry_for=(smtplib.SMTPException, OSError),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_kwargs={'max_retries': 6},
+)
+def dispatch_contact_emails(message_ids=None):
+    """Send notifications and auto-responses for the given messages, or all pending ones"""
+    return send_contact_emails(message_ids)
+
+
+@shared_task
+def train_spam_filter_incrementally():
+    """Periodically fold newly labelled messages into the spam filter"""
+    return train_spam_filter()
+
+
+@shared_task
+def prune_duplicate_fingerprints():
+    """Periodically drop fingerprint bands that are past the duplicate window"""
+    return prune_fingerprint_bands()
+
+
+@shared_task
+def drain_contact_submissions():
+    """Save contact form submissions buffered by write-behind ingestion"""
+    # Imported here because ingestion queues email tasks from this module
+    from .ingest import drain_submissions
+    return drain_submissions()
+
+
+@shared_task
+def archive_old_contact_messages():
+    """Daily move of messages past their retention period into the archive table"""
+    return apply_retention()
+
+
+def enqueue_contact_emails(*messages):
+    """Queue emails for new messages once the surrounding transaction commits"""
+    message_ids = [str(message.pk) for message in messages]
+
+    def enqueue():
+        try:
+            # Don't retry publishing; the periodic sweep picks up anything missed
+            dispatch_contact_emails.apply_async(args=[message_ids], retry=False)
+        except Exception as e:
+            logger.warning("Could not queue contact emails for %s: %s", ', '.join(message_ids), e)
+
+    transaction.on_commit(enqueue)
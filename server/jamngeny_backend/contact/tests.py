@@ -1,3 +1,395 @@
-from django.test import TestCase
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import redis
+from django.conf import settings
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from utils.models import AuditLog
+from utils.ratelimit import RateLimiter
+
+from . import ingest, notifications, spam
+from .admin import ContactMessageAdmin
+from .models import ArchivedContactMessage, ContactMessage, ContactSetting, SpamFilter, contact_setting_cache
+from .retention import apply_retention, find_archived_messages
+
+MESSAGE = 'We would like a quote for a penetration test of our customer portal and internal network please'
+
+
+@override_settings(CONTACT_WRITE_BEHIND=False, API_REQUEST_LOG_ENABLED=False)
+@mock.patch('contact.views.enqueue_contact_emails')
+class NearDuplicateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        limiter = mock.patch('utils.ratelimit._limiter', RateLimiter())
+        limiter.start()
+        self.addCleanup(limiter.stop)
+
+    def submit(self, email):
+        return self.client.post('/api/contact/messages/create/', {
+            'name': email.split('@')[0], 'email': email, 'message': MESSAGE, 'consent_given': True,
+        }, format='json')
+
+    def test_same_sender_is_folded(self, enqueue):
+        self.assertEqual(self.submit('alice@example.com').status_code, 201)
+        response = self.submit('Alice@example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('id', response.json()['data'])
+        self.assertEqual(ContactMessage.objects.count(), 1)
+        self.assertEqual(ContactMessage.objects.get().metadata['duplicate_count'], 1)
+
+    def test_other_senders_are_kept(self, enqueue):
+        self.assertEqual(self.submit('alice@example.com').status_code, 201)
+        self.assertEqual(self.submit('bob@example.com').status_code, 201)
+        self.assertEqual(
+            set(ContactMessage.objects.values_list('email', flat=True)), {'alice@example.com', 'bob@example.com'}
+        )
+
+
+@override_settings(CONTACT_WRITE_BEHIND=False, API_REQUEST_LOG_ENABLED=False)
+@mock.patch('contact.views.enqueue_contact_emails')
+class ContactRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        contact_settings = ContactSetting.get_instance()
+        contact_settings.rate_limit_enabled = True
+        contact_settings.rate_limit_count = 2
+        contact_settings.rate_limit_period = 3600
+        contact_settings.save()
+        # The cached copy would outlive the rolled back test transaction
+        self.addCleanup(contact_setting_cache.invalidate)
+        limiter = mock.patch('utils.ratelimit._limiter', RateLimiter())
+        limiter.start()
+        self.addCleanup(limiter.stop)
+
+    def submit(self, index, **extra):
+        return APIClient().post('/api/contact/messages/create/', {
+            'name': 'Sender', 'email': f'sender{index}@example.com', 'message': f'{MESSAGE} {index}',
+            'consent_given': True,
+        }, format='json', **extra)
+
+    def test_limit_per_ip(self, enqueue):
+        self.assertEqual([self.submit(i).status_code for i in range(2)], [201, 201])
+        response = self.submit(2)
+        self.assertEqual(response.status_code, 429)
+        error = response.json()['error']
+        self.assertEqual(error['code'], 'RATE_LIMITED')
+        self.assertEqual(response['Retry-After'], str(error['details']['retry_after']))
+        # Another client has its own allowance
+        self.assertEqual(self.submit(3, REMOTE_ADDR='203.0.113.5').status_code, 201)
+
+    def test_disabled_limit(self, enqueue):
+        contact_settings = ContactSetting.get_instance()
+        contact_settings.rate_limit_enabled = False
+        contact_settings.save()
+        self.assertEqual([self.submit(i).status_code for i in range(3)], [201, 201, 201])
+
+
+class NotificationClaimTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        contact_settings = ContactSetting.get_instance()
+        contact_settings.notify_on_new_message = True
+        contact_settings.notification_emails = 'team@example.com'
+        contact_settings.auto_response_enabled = False
+        contact_settings.save()
+        self.addCleanup(contact_setting_cache.invalidate)
+        self.message = ContactMessage.objects.create(
+            name='Alice', email='alice@example.com', message=MESSAGE, consent_given=True
+        )
+
+    def test_email_claimed_by_another_dispatch_is_not_sent(self):
+        build = notifications.build_notification
+
+        def claimed_elsewhere(message, recipients):
+            # The other dispatch claims it between our read and our send
+            ContactMessage.objects.filter(pk=message.pk).update(notification_sent_at=timezone.now())
+            return build(message, recipients)
+
+        with mock.patch('contact.notifications.build_notification', claimed_elsewhere):
+            self.assertEqual(notifications.send_contact_emails([self.message.pk]), 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_failed_send_releases_the_claim(self):
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError):
+            with self.assertRaises(OSError):
+                notifications.send_contact_emails([self.message.pk])
+        self.message.refresh_from_db()
+        self.assertIsNone(self.message.notification_sent_at)
+
+        self.assertEqual(notifications.send_contact_emails([self.message.pk]), 1)
+        self.assertEqual(notifications.send_contact_emails([self.message.pk]), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+SPAM_TEXT = 'Cheap casino bonus, win crypto prizes now at lucky-spins example'
+HAM_TEXT = 'Could you send a proposal for auditing our payroll application next quarter'
+
+
+class SpamFilterTests(TestCase):
+    def create(self, message, status, **fields):
+        return ContactMessage.objects.create(
+            name='Sender', email='sender@example.com', message=message, consent_given=True, status=status, **fields
+        )
+
+    def train_base(self):
+        for index in range(spam.MIN_DOCUMENTS):
+            self.create(f'{SPAM_TEXT} {index}', 'spam')
+            self.create(f'{HAM_TEXT} {index}', 'read')
+        self.assertEqual(spam.train_spam_filter(), 2 * spam.MIN_DOCUMENTS)
+
+    def classify(self, message):
+        classifier = spam.SpamClassifier.from_filter(SpamFilter.objects.first())
+        with mock.patch.object(spam.classifier_cache, 'get', return_value=classifier):
+            return spam.classify_submission({'message': message, 'email': 'someone@example.com'})
+
+    def test_untrained_filter_does_not_classify(self):
+        self.assertEqual(self.classify(SPAM_TEXT), {})
+
+    def test_training_and_classification(self):
+        self.train_base()
+        flagged = self.classify(SPAM_TEXT)
+        self.assertEqual(flagged['status'], 'spam')
+        self.assertTrue(flagged['metadata']['spam']['auto_flagged'])
+        self.assertNotIn('status', self.classify(HAM_TEXT))
+        # Nothing changed since the last run
+        self.assertEqual(spam.train_spam_filter(), 0)
+
+    def test_relabel_moves_counts(self):
+        self.train_base()
+        message = ContactMessage.objects.filter(status='spam').first()
+        ContactMessage.objects.filter(pk=message.pk).update(**ContactMessage.status_update_values('read'))
+        self.assertEqual(spam.train_spam_filter(), 1)
+        spam_filter = SpamFilter.objects.get()
+        self.assertEqual((spam_filter.ham_documents, spam_filter.spam_documents), (21, 19))
+
+    def test_auto_flagged_messages_are_learnt_once_confirmed(self):
+        self.train_base()
+        message = self.create(SPAM_TEXT, 'spam', metadata=self.classify(SPAM_TEXT)['metadata'])
+        self.assertEqual(spam.train_spam_filter(), 0)
+
+        admin = ContactMessageAdmin(ContactMessage, AdminSite())
+        with mock.patch.object(admin, 'message_user'):
+            admin.mark_as_spam(None, ContactMessage.objects.filter(pk=message.pk))
+        message.refresh_from_db()
+        self.assertNotIn('auto_flagged', message.metadata['spam'])
+        self.assertEqual(spam.train_spam_filter(), 1)
+        self.assertEqual(SpamFilter.objects.get().spam_documents, 21)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'The search trigger is PostgreSQL only')
+@override_settings(API_REQUEST_LOG_ENABLED=False)
+class ContactSearchTests(TestCase):
+    def setUp(self):
+        admin = get_user_model().objects.create_user('inbox', email='inbox@example.com', password='x', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        self.audit = ContactMessage.objects.create(
+            name='Alice', email='alice@example.com', subject='Payroll audit', message='Please quote for next quarter'
+        )
+        self.portal = ContactMessage.objects.create(
+            name='Bob', email='bob@example.com', subject='Portal', status='read',
+            message='A penetration test and an audit of the portal',
+        )
+
+    def search(self, terms, **params):
+        response = self.client.get('/api/contact/messages/', {'search': terms, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['data']['results']['results']]
+
+    def test_trigger_maintains_the_search_vector(self):
+        self.assertEqual(self.search('quarterly'), [str(self.audit.pk)])
+        self.assertEqual(self.search('carol'), [])
+
+        ContactMessage.objects.filter(pk=self.portal.pk).update(name='Carol')
+        self.assertEqual(self.search('carol'), [str(self.portal.pk)])
+
+        self.portal.message = 'Nothing to see here'
+        self.portal.save()
+        self.assertEqual(self.search('penetration'), [])
+
+    def test_web_search_syntax_ranking_and_filters(self):
+        # Subject matches outrank matches in the message body
+        self.assertEqual(self.search('audit'), [str(self.audit.pk), str(self.portal.pk)])
+        self.assertEqual(self.search('audit', ordering='-created_at'), [str(self.portal.pk), str(self.audit.pk)])
+        self.assertEqual(self.search('audit -portal'), [str(self.audit.pk)])
+        self.assertEqual(self.search('"penetration test"'), [str(self.portal.pk)])
+        self.assertEqual(self.search('"test penetration"'), [])
+        self.assertEqual(self.search('audit', status='read'), [str(self.portal.pk)])
+
+
+@override_settings(API_REQUEST_LOG_ENABLED=False)
+class BulkUpdateTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user('bulk', email='bulk@example.com', password='x', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.new = [
+            ContactMessage.objects.create(name='New', email=f'new{index}@example.com', message=MESSAGE)
+            for index in range(2)
+        ]
+        self.read = ContactMessage.objects.create(name='Read', email='read@example.com', message=MESSAGE, status='read')
+
+    def bulk(self, **data):
+        return self.client.post('/api/contact/messages/bulk/', data, format='json')
+
+    def bulk_audits(self):
+        return AuditLog.objects.filter(entity='contact_message', payload__bulk=True)
+
+    def test_only_changed_rows_are_updated_and_audited(self):
+        response = self.bulk(filters={'status': 'new'}, status='read', assigned_to=self.admin.pk)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['data'], {'matched': 2, 'updated': 2, 'unchanged': 0})
+        self.assertEqual(
+            set(ContactMessage.objects.values_list('status', 'is_processed', 'assigned_to')),
+            {('read', True, self.admin.pk), ('read', False, None)},
+        )
+        audit = self.bulk_audits().get(entity_id=str(self.new[0].pk))
+        self.assertEqual(audit.changes, {'status': ['new', 'read'], 'assigned_to_id': [None, str(self.admin.pk)]})
+
+        response = self.bulk(ids=[str(message.pk) for message in (*self.new, self.read)], status='read')
+        self.assertEqual(response.json()['data'], {'matched': 3, 'updated': 0, 'unchanged': 3})
+        self.assertEqual(self.bulk_audits().count(), 2)
+
+        response = self.bulk(ids=[str(self.read.pk)], archive=True)
+        self.assertEqual(response.json()['data']['updated'], 1)
+        self.read.refresh_from_db()
+        self.assertEqual(self.read.status, 'archived')
+
+    def test_invalid_and_oversized_selections_are_rejected(self):
+        for data in [
+            {'status': 'read'},
+            {'ids': [str(self.read.pk)], 'filters': {'status': 'new'}, 'status': 'read'},
+            {'filters': {'colour': 'blue'}, 'status': 'read'},
+            {'filters': {'status': 'new'}},
+            {'ids': [str(self.read.pk)], 'archive': True, 'status': 'spam'},
+        ]:
+            response = self.bulk(**data)
+            self.assertEqual(response.status_code, 400, data)
+            self.assertEqual(response.json()['error']['code'], 'VALIDATION_ERROR')
+
+        with override_settings(CONTACT_BULK_UPDATE_LIMIT=1):
+            response = self.bulk(filters={'status': 'new'}, priority='high')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error']['code'], 'TOO_MANY_MESSAGES')
+        self.assertFalse(ContactMessage.objects.filter(priority='high').exists())
+
+
+@override_settings(API_REQUEST_LOG_ENABLED=False, CONTACT_RETENTION_DAYS={'spam': 30, 'archived': 365})
+class RetentionTests(TestCase):
+    def create(self, status, days_old, **fields):
+        message = ContactMessage.objects.create(
+            name='Alice', email='Alice@Example.com', message=MESSAGE, status=status, **fields
+        )
+        ContactMessage.objects.filter(pk=message.pk).update(updated_at=timezone.now() - timedelta(days=days_old))
+        return message
+
+    def test_expired_messages_round_trip_through_the_archive(self):
+        old_spam = self.create('spam', 40, subject='Casino', metadata={'spam': {'probability': 0.99}})
+        self.create('spam', 10)
+        self.create('read', 400)
+        old_archived = [self.create('archived', 400) for _ in range(3)]
+
+        with self.assertLogs('contact.retention', 'INFO'):
+            self.assertEqual(apply_retention(batch_size=2), {'spam': 1, 'archived': 3})
+        self.assertEqual(sorted(ContactMessage.objects.values_list('status', flat=True)), ['read', 'spam'])
+        self.assertEqual(ArchivedContactMessage.objects.count(), 4)
+        # Nothing left to move
+        self.assertEqual(apply_retention(), {'spam': 0, 'archived': 0})
+
+        [restored] = find_archived_messages(message_id=old_spam.pk)
+        self.assertEqual(restored['id'], str(old_spam.pk))
+        self.assertEqual(restored['subject'], 'Casino')
+        self.assertEqual(restored['message'], MESSAGE)
+        self.assertEqual(restored['metadata'], {'spam': {'probability': 0.99}})
+        self.assertEqual(parse_datetime(restored['created_at']), old_spam.created_at)
+        self.assertNotIn('search_vector', restored)
+        self.assertEqual(len(find_archived_messages(email='alice@example.com')), 4)
+
+        client = APIClient()
+        client.force_authenticate(
+            get_user_model().objects.create_user('archivist', email='archivist@example.com', is_staff=True)
+        )
+        response = client.get('/api/contact/archive/', {'email': 'ALICE@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['count'], 4)
+        response = client.get('/api/contact/archive/', {'id': str(old_archived[0].pk)})
+        self.assertEqual([row['id'] for row in response.json()['data']['results']], [str(old_archived[0].pk)])
+        self.assertEqual(client.get('/api/contact/archive/', {'id': 'nope'}).status_code, 400)
+
+
+def ingest_redis_available():
+    try:
+        return redis.Redis.from_url(settings.CONTACT_INGEST_REDIS_URL, socket_connect_timeout=0.25).ping()
+    except (redis.RedisError, ValueError):
+        return False
+
+
+@unittest.skipUnless(ingest_redis_available(), 'Needs the Redis server at CONTACT_INGEST_REDIS_URL')
+@override_settings(CONTACT_WRITE_BEHIND=True, API_REQUEST_LOG_ENABLED=False)
+@mock.patch('contact.ingest.enqueue_contact_emails')
+class WriteBehindIngestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.buffer = ingest.SubmissionBuffer(settings.CONTACT_INGEST_REDIS_URL)
+        self.buffer.client.delete(ingest.STREAM, ingest.DEAD_LETTER_STREAM)
+        self.addCleanup(self.buffer.client.delete, ingest.STREAM, ingest.DEAD_LETTER_STREAM)
+        for patcher in (
+            mock.patch('contact.ingest._buffer', self.buffer),
+            mock.patch('utils.ratelimit._limiter', RateLimiter()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def submit(self, email, message=MESSAGE):
+        return APIClient().post('/api/contact/messages/create/', {
+            'name': 'Sender', 'email': email, 'message': message, 'consent_given': True,
+        }, format='json')
+
+    def test_buffered_submissions_are_saved_in_a_batch(self, enqueue):
+        response = self.submit('alice@example.com')
+        self.assertEqual(response.status_code, 202)
+        message_id = response.json()['data']['id']
+        self.assertEqual(self.submit('Alice@example.com').status_code, 202)
+        self.assertEqual(self.submit('bob@example.com', HAM_TEXT).status_code, 202)
+        self.assertFalse(ContactMessage.objects.exists())
+
+        self.assertEqual(ingest.drain_submissions(), 3)
+        alice = ContactMessage.objects.get(email='alice@example.com')
+        self.assertEqual(str(alice.pk), message_id)
+        self.assertEqual(alice.metadata['duplicate_count'], 1)
+        self.assertEqual(ContactMessage.objects.count(), 2)
+        enqueue.assert_called_once()
+        self.assertEqual(self.buffer.client.xlen(ingest.STREAM), 0)
+
+        # An entry replayed after its batch committed is not saved twice
+        self.buffer.append({
+            'id': message_id, 'received_at': timezone.now(), 'name': 'Sender', 'email': 'alice@example.com',
+            'message': MESSAGE,
+        })
+        self.assertEqual(ingest.drain_submissions(), 1)
+        self.assertEqual(ContactMessage.objects.count(), 2)
+
+    def test_bad_entry_is_dead_lettered_without_losing_the_batch(self, enqueue):
+        self.assertEqual(self.submit('alice@example.com').status_code, 202)
+        self.buffer.client.xadd(ingest.STREAM, {'data': 'not json'})
+        self.assertEqual(self.submit('bob@example.com', HAM_TEXT).status_code, 202)
+
+        with self.assertLogs('contact.ingest', 'ERROR'):
+            self.assertEqual(ingest.drain_submissions(), 3)
+        self.assertEqual(
+            set(ContactMessage.objects.values_list('email', flat=True)), {'alice@example.com', 'bob@example.com'}
+        )
+        self.assertEqual(self.buffer.client.xlen(ingest.STREAM), 0)
+        [(_, dead)] = self.buffer.client.xrange(ingest.DEAD_LETTER_STREAM)
+        self.assertEqual(dead[b'data'], b'not json')
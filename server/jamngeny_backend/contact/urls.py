@@ -3,7 +3,8 @@ from django.urls import path
 from .views import (
     ContactMessageCreateView, ContactMessageListView, ContactMessageDetailView,
     ContactMessageUpdateView, ContactMessageDeleteView, ContactSettingView,
-    contact_form_config, contact_stats
+    contact_form_config, contact_stats, contact_messages_bulk_update,
+    archived_contact_messages
 )
 
 app_name = 'contact'
@@ -15,9 +16,11 @@ urlpatterns = [
     
     # Admin endpoints
     path('messages/', ContactMessageListView.as_view(), name='message-list'),
+    path('messages/bulk/', contact_messages_bulk_update, name='message-bulk-update'),
     path('messages/<uuid:pk>/', ContactMessageDetailView.as_view(), name='message-detail'),
     path('messages/<uuid:pk>/update/', ContactMessageUpdateView.as_view(), name='message-update'),
     path('messages/<uuid:pk>/delete/', ContactMessageDeleteView.as_view(), name='message-delete'),
+    path('archive/', archived_contact_messages, name='archive-lookup'),
     path('settings/', ContactSettingView.as_view(), name='settings'),
     path('stats/', contact_stats, name='stats'),
 ]
\ No newline at end of file
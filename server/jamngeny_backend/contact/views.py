@@ -1,24 +1,41 @@
 #contact/views.py
+import uuid
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.conf import settings
+from utils.audit import write_entries
+from utils.export import StreamingExportMixin
+from utils.ratelimit import rate_limit, ContactFormThrottle
+from utils.search import FullTextSearchFilter
+from .filters import ContactMessageFilter
 from .models import ContactMessage, ContactSetting
+from .retention import find_archived_messages
+from .ingest import buffer_submission
+from .dedup import minhash, find_near_duplicate, fold_duplicate, record_fingerprint
+from .spam import classify_submission
+from .tasks import enqueue_contact_emails
 from .serializers import (
     ContactMessageCreateSerializer, ContactMessageListSerializer,
     ContactMessageDetailSerializer, ContactMessageUpdateSerializer,
-    ContactSettingSerializer, ContactFormConfigSerializer
+    ContactSettingSerializer, ContactFormConfigSerializer, ContactMessageBulkUpdateSerializer
 )
 
 
 class ContactMessageCreateView(generics.CreateAPIView):
     serializer_class = ContactMessageCreateSerializer
     permission_classes = [permissions.AllowAny]
+    # The contact form has its own, stricter limit
+    throttle_classes = []
 
+    @method_decorator(rate_limit(
+        ContactFormThrottle, message='Too many contact attempts. Please try again later.'
+    ))
     def create(self, request, *args, **kwargs):
         # Get contact settings
         contact_settings = ContactSetting.get_instance()
@@ -33,21 +50,6 @@ class ContactMessageCreateView(generics.CreateAPIView):
                 }
             }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         
-        # Rate limiting
-        if contact_settings.rate_limit_enabled:
-            ip_address = self.get_client_ip(request)
-            cache_key = f'contact_rate_limit_{ip_address}'
-            request_count = cache.get(cache_key, 0)
-            
-            if request_count >= contact_settings.rate_limit_count:
-                return Response({
-                    'status': 'error',
-                    'error': {
-                        'code': 'RATE_LIMITED',
-                        'message': 'Too many contact attempts. Please try again later.'
-                    }
-                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
-        
         # Validate required fields
         serializer = self.get_serializer(data=request.data)
         if not serializer.is_valid():
@@ -60,17 +62,43 @@ class ContactMessageCreateView(generics.CreateAPIView):
                 }
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        # Under write-behind ingestion the message is saved later, in a batch
+        if settings.CONTACT_WRITE_BEHIND:
+            message_id = buffer_submission(serializer)
+            if message_id:
+                return Response({
+                    'status': 'success',
+                    'message': 'Thank you for your message. We will get back to you soon.',
+                    'data': {
+                        'id': message_id
+                    }
+                }, status=status.HTTP_202_ACCEPTED)
+        
         # Create the message
         try:
-            self.perform_create(serializer)
+            # Fold near-identical resubmissions into the message they copy
+            fingerprint = minhash(
+                serializer.validated_data.get('subject', ''), serializer.validated_data['message']
+            )
+            original = find_near_duplicate(
+                fingerprint, serializer.validated_data['email']
+            ) if fingerprint is not None else None
+            if original:
+                fold_duplicate(original)
+                return Response({
+                    'status': 'success',
+                    'message': 'Thank you for your message. We will get back to you soon.',
+                    'data': {
+                        'duplicate': True
+                    }
+                }, status=status.HTTP_200_OK)
             
-            # Update rate limit counter
-            if contact_settings.rate_limit_enabled:
-                cache_key = f'contact_rate_limit_{ip_address}'
-                cache.set(cache_key, request_count + 1, contact_settings.rate_limit_period)
+            self.perform_create(serializer)
+            if fingerprint is not None:
+                record_fingerprint(serializer.instance, fingerprint)
             
-            # TODO: Send notifications if enabled
-            # TODO: Send auto-response if enabled
+            # Notifications and the auto-response are sent in the background
+            enqueue_contact_emails(serializer.instance)
             
             return Response({
                 'status': 'success',
@@ -90,25 +118,26 @@ class ContactMessageCreateView(generics.CreateAPIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def perform_create(self, serializer):
-        serializer.save(source='website')
-
-    def get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        # Score against the spam filter; likely spam is saved as such and not emailed about
+        serializer.save(source='website', **classify_submission(serializer.validated_data))
 
 
-class ContactMessageListView(generics.ListAPIView):
+class ContactMessageListView(StreamingExportMixin, generics.ListAPIView):
     serializer_class = ContactMessageListSerializer
     permission_classes = [permissions.IsAdminUser]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['status', 'priority', 'source', 'category', 'is_processed']
+    # Full-text search runs last so its relevance ordering isn't overridden
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
+    filterset_class = ContactMessageFilter
     search_fields = ['name', 'email', 'subject', 'message', 'company']
+    search_vector_field = 'search_vector'
     ordering_fields = ['created_at', 'updated_at', 'priority']
     ordering = ['-created_at']
+    export_fields = [
+        'id', 'created_at', 'name', 'email', 'phone', 'company', 'subject', 'message',
+        'category', 'source', 'status', 'priority', 'is_processed', 'assigned_to__email',
+        'response_sent', 'response_sent_at', 'consent_given', 'newsletter_subscribed', 'ip_address',
+    ]
+    export_filename = 'contact-messages'
 
     def get_queryset(self):
         return ContactMessage.objects.all().select_related('assigned_to')
@@ -163,6 +192,90 @@ class ContactMessageDeleteView(generics.DestroyAPIView):
         }, status=status.HTTP_204_NO_CONTENT)
 
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def contact_messages_bulk_update(request):
+    """Apply a status, priority or assignment change to many messages at once"""
+    serializer = ContactMessageBulkUpdateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'status': 'error',
+            'error': {
+                'code': 'VALIDATION_ERROR',
+                'message': 'Please check your input',
+                'details': serializer.errors
+            }
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    values = {}
+    if 'status' in data:
+        values.update(ContactMessage.status_update_values(data['status']))
+    if 'priority' in data:
+        values['priority'] = data['priority']
+    if 'assigned_to' in data:
+        values['assigned_to'] = data['assigned_to']
+    # Audited fields and their new values, as stored in the row
+    new_values = {field: values[field] for field in ('status', 'priority') if field in values}
+    if 'assigned_to' in values:
+        new_values['assigned_to_id'] = values['assigned_to'].pk if values['assigned_to'] else None
+    tracked = list(new_values)
+    limit = settings.CONTACT_BULK_UPDATE_LIMIT
+
+    with transaction.atomic():
+        # Lock the selection so the audit trail's old values stay accurate
+        rows = list(
+            serializer.get_queryset().select_for_update().order_by().values_list('pk', *tracked)[:limit + 1]
+        )
+        if len(rows) > limit:
+            return Response({
+                'status': 'error',
+                'error': {
+                    'code': 'TOO_MANY_MESSAGES',
+                    'message': f'A bulk update can change at most {limit} messages. Narrow the selection.'
+                }
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only rows that actually change are updated and audited
+        changed = {}
+        for pk, *old_values in rows:
+            changes = {
+                field: [str(old) if old is not None else None,
+                        str(new_values[field]) if new_values[field] is not None else None]
+                for field, old in zip(tracked, old_values)
+                if old != new_values[field]
+            }
+            if changes:
+                changed[pk] = changes
+
+        updated = 0
+        if changed:
+            updated = ContactMessage.objects.filter(pk__in=list(changed)).update(
+                updated_at=timezone.now(), **values
+            )
+
+            # Queryset updates bypass the audit signals, so record the changes here
+            write_entries([
+                {
+                    'action': 'update',
+                    'entity': 'contact_message',
+                    'entity_id': str(pk),
+                    'payload': {'bulk': True, 'matched': len(rows)},
+                    'changes': changes,
+                }
+                for pk, changes in changed.items()
+            ])
+
+    return Response({
+        'status': 'success',
+        'data': {
+            'matched': len(rows),
+            'updated': updated,
+            'unchanged': len(rows) - len(changed),
+        }
+    })
+
+
 class ContactSettingView(generics.RetrieveUpdateAPIView):
     queryset = ContactSetting.objects.all()
     serializer_class = ContactSettingSerializer
@@ -245,4 +358,38 @@ def contact_stats(request):
             'status_breakdown': status_counts,
             'source_breakdown': source_counts,
         }
-    })
\ No newline at end of file
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def archived_contact_messages(request):
+    """Look up messages moved out of the inbox by the retention job"""
+    message_id = request.query_params.get('id', '').strip()
+    email = request.query_params.get('email', '').strip()
+    errors = {}
+    if not message_id and not email:
+        errors['non_field_errors'] = ["Provide an 'id' or an 'email'."]
+    if message_id:
+        try:
+            message_id = uuid.UUID(message_id)
+        except ValueError:
+            errors['id'] = ['Must be a valid UUID.']
+    if errors:
+        return Response({
+            'status': 'error',
+            'error': {
+                'code': 'VALIDATION_ERROR',
+                'message': 'Please check your input',
+                'details': errors
+            }
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    results = find_archived_messages(message_id=message_id or None, email=email or None)
+    return Response({
+        'status': 'success',
+        'data': {
+            'results': results,
+            'count': len(results)
+        }
+    })
@@ -3,6 +3,7 @@ from django.db import models
 from django.core.exceptions import ValidationError
 from django.utils.text import slugify
 from django.utils import timezone
+from utils.singletons import SingletonCache
 
 
 class About(models.Model):
@@ -104,6 +105,11 @@ class About(models.Model):
         
         super().save(*args, **kwargs)
 
+    @classmethod
+    def get_cached(cls):
+        """Get the singleton instance from the process cache, or None if there isn't one"""
+        return about_cache.get()
+
     @classmethod
     def get_instance(cls):
         """Get or create the singleton instance"""
@@ -141,6 +147,10 @@ class About(models.Model):
                 })
         return links
 
+
+about_cache = SingletonCache(About, lambda: About.objects.first())
+
+
 class Service(models.Model):
     """
     Model for services offered
@@ -14,9 +14,8 @@ class AboutDetailView(generics.RetrieveAPIView):
     permission_classes = [permissions.AllowAny]
 
     def get_object(self):
-        try:
-            return About.objects.get()
-        except About.DoesNotExist:
+        about = About.get_cached()
+        if about is None:
             # Return a default About instance if none exists
             return About(
                 name="Robert Jamngeny",
@@ -24,6 +23,7 @@ class AboutDetailView(generics.RetrieveAPIView):
                 sanitized_bio="Connecting Technology, Strategy, and Storytelling for a Secure Digital Future.",
                 experience_years=15
             )
+        return about
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import File, FileUploadRequest
+from .models import File, FileUploadRequest, StorageUsage
 
 
 @admin.register(File)
@@ -206,4 +206,24 @@ class FileUploadRequestAdmin(admin.ModelAdmin):
     resulting_file_link.short_description = 'Resulting File'
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('uploaded_by', 'resulting_file')
\ No newline at end of file
+        return super().get_queryset(request).select_related('uploaded_by', 'resulting_file')
+
+
+@admin.register(StorageUsage)
+class StorageUsageAdmin(admin.ModelAdmin):
+    list_display = ('user', 'category', 'file_count', 'total_size_display', 'updated_at')
+    list_filter = ('category',)
+    search_fields = ('user__email',)
+    readonly_fields = ('user', 'category', 'file_count', 'total_size', 'updated_at')
+
+    def total_size_display(self, obj):
+        return f"{obj.total_size / (1024 * 1024):.1f} MB"
+    total_size_display.short_description = 'Size'
+    total_size_display.admin_order_field = 'total_size'
+
+    def has_add_permission(self, request):
+        # Usage rows are maintained from File changes
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
@@ -0,0 +1,88 @@
+"""
+Garbage collection for the files app.
+
+Removes expired upload requests and stored blobs under files/ that no File
+row points at any more (admin bulk deletes, cascades from uploaded_by, ...).
+Storage is walked as a stream (os.scandir locally, paginated listings on
+object storage) and compared against the database in fixed-size chunks, so
+memory use doesn't grow with the number of files.
+"""
+
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import File, FileUploadRequest
+from .storage import iter_stored_files, delete_files
+
+logger = logging.getLogger(__name__)
+
+FILES_DIRECTORY = 'files'
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def delete_expired_upload_requests(batch_size=1000, dry_run=False):
+    """
+    Delete upload requests that expired unused, and used requests older than
+    FILE_UPLOAD_REQUEST_RETENTION_DAYS. Returns the number of rows deleted
+    (or that would be deleted in a dry run).
+    """
+    now = timezone.now()
+    retention_cutoff = now - timedelta(days=settings.FILE_UPLOAD_REQUEST_RETENTION_DAYS)
+    expired = FileUploadRequest.objects.filter(
+        Q(is_used=False, expires_at__lt=now) |
+        Q(is_used=True, created_at__lt=retention_cutoff)
+    )
+
+    if dry_run:
+        return expired.count()
+
+    deleted = 0
+    while True:
+        ids = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        count, _ = FileUploadRequest.objects.filter(pk__in=ids).delete()
+        deleted += count
+    return deleted
+
+
+def collect_orphaned_files(batch_size=1000, dry_run=False, min_age_seconds=3600):
+    """
+    Delete stored files under files/ that no File row references.
+    Returns (orphan_count, orphan_bytes).
+    """
+    orphan_count = 0
+    orphan_bytes = 0
+    for batch in _batched(iter_stored_files(FILES_DIRECTORY, min_age_seconds), batch_size):
+        names = [name for name, _ in batch]
+        referenced = set(
+            File.objects.filter(file__in=names).values_list('file', flat=True)
+        )
+        # Objects uploaded directly to storage whose upload hasn't been completed yet
+        referenced.update(
+            FileUploadRequest.objects.filter(
+                storage_key__in=names, is_used=False, expires_at__gte=timezone.now()
+            ).values_list('storage_key', flat=True)
+        )
+
+        orphans = [(name, size) for name, size in batch if name not in referenced]
+        for name, size in orphans:
+            orphan_count += 1
+            orphan_bytes += size
+            logger.info("%s orphaned file %s (%d bytes)", "Would delete" if dry_run else "Deleting", name, size)
+        if orphans and not dry_run:
+            delete_files([name for name, _ in orphans])
+    return orphan_count, orphan_bytes
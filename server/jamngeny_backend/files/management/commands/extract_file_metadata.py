@@ -0,0 +1,43 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from files.metadata import extract_pending_metadata
+
+
+class Command(BaseCommand):
+    help = "Extract image, PDF and document metadata into File.metadata"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help="Files read and written per batch"
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Extraction processes (0 to extract inline)"
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Stop after this many files"
+        )
+        parser.add_argument(
+            '--timeout', type=int, default=None,
+            help="Seconds a worker may spend on one file (default FILE_METADATA_TIMEOUT)"
+        )
+        parser.add_argument(
+            '--reprocess', action='store_true',
+            help="Re-extract files that already have metadata"
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        processed = extract_pending_metadata(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            limit=options['limit'],
+            reprocess=options['reprocess'],
+            timeout=options['timeout'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Extracted metadata for {processed} files in {time.monotonic() - started:.1f}s"
+        ))
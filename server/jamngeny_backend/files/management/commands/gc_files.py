@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from files.cleanup import delete_expired_upload_requests, collect_orphaned_files
+
+
+class Command(BaseCommand):
+    help = "Delete expired upload requests and stored files with no File record"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would be deleted without deleting anything"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Rows/paths handled per database round trip"
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help="Ignore stored files modified within this many seconds"
+        )
+        parser.add_argument(
+            '--skip-tokens', action='store_true',
+            help="Don't clean up expired upload requests"
+        )
+        parser.add_argument(
+            '--skip-orphans', action='store_true',
+            help="Don't scan storage for orphaned files"
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        prefix = "[dry run] Would delete" if dry_run else "Deleted"
+
+        if not options['skip_tokens']:
+            deleted = delete_expired_upload_requests(
+                batch_size=options['batch_size'], dry_run=dry_run
+            )
+            self.stdout.write(f"{prefix} {deleted} expired upload requests")
+
+        if not options['skip_orphans']:
+            count, size = collect_orphaned_files(
+                batch_size=options['batch_size'],
+                dry_run=dry_run,
+                min_age_seconds=options['min_age'],
+            )
+            self.stdout.write(f"{prefix} {count} orphaned files ({size / (1024 * 1024):.2f} MB)")
+
+        self.stdout.write(self.style.SUCCESS("File garbage collection complete"))
@@ -0,0 +1,427 @@
+"""
+Metadata extraction for stored files.
+
+Each file is opened from storage once and handed to the extractor for its
+type. Results are merged into File.metadata together with an `extracted_at`
+marker, which is what makes a backfill resumable: files that already carry
+the marker are skipped on the next run.
+"""
+
+import logging
+import multiprocessing
+import re
+import struct
+import time
+import wave
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FIRST_PAGE_TEXT_LIMIT = 2000
+
+EXIF_FIELDS = {
+    'Make', 'Model', 'Orientation', 'DateTime', 'DateTimeOriginal',
+    'ExposureTime', 'FNumber', 'ISOSpeedRatings', 'FocalLength',
+    'Software', 'Artist', 'Copyright',
+}
+
+DOCX_TEXT_RE = re.compile(r'<w:t[^>]*>([^<]*)</w:t>')
+
+# How far past the ID3 tag to look for the first MPEG audio frame
+MPEG_FRAME_SEARCH = 64 * 1024
+
+# MPEG audio header fields, keyed by (MPEG-1, layer)
+MPEG_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MPEG_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),  # MPEG-2.5
+}
+
+
+def _json_safe(value):
+    """Convert EXIF values into something JSONField can store"""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace').strip('\x00')
+    if isinstance(value, (int, float, str)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def extract_image_metadata(fh):
+    """Read dimensions and EXIF from the image header without decoding pixels"""
+    from PIL import Image, ExifTags
+
+    with Image.open(fh) as image:
+        metadata = {
+            'width': image.width,
+            'height': image.height,
+            'format': image.format,
+            'mode': image.mode,
+        }
+        exif = {}
+        for tag, value in image.getexif().items():
+            name = ExifTags.TAGS.get(tag)
+            if name in EXIF_FIELDS:
+                exif[name] = _json_safe(value)
+        if exif:
+            metadata['exif'] = exif
+    return metadata
+
+
+def extract_pdf_metadata(fh):
+    """Read page count, title and first-page text from a PDF"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(fh)
+    metadata = {'page_count': len(reader.pages)}
+    info = reader.metadata
+    if info and info.title:
+        metadata['title'] = str(info.title)
+    if reader.pages:
+        text = reader.pages[0].extract_text() or ''
+        metadata['first_page_text'] = text[:FIRST_PAGE_TEXT_LIMIT].strip()
+    return metadata
+
+
+def extract_docx_metadata(fh):
+    """Read the opening text of a Word document"""
+    with zipfile.ZipFile(fh) as archive:
+        with archive.open('word/document.xml') as document:
+            # Only the start of the body is needed for a first-page preview
+            xml = document.read(256 * 1024).decode('utf-8', errors='ignore')
+    text = ' '.join(DOCX_TEXT_RE.findall(xml))
+    return {'first_page_text': text[:FIRST_PAGE_TEXT_LIMIT].strip()}
+
+
+def extract_text_metadata(fh):
+    """Read the opening text of a plain text document"""
+    text = fh.read(FIRST_PAGE_TEXT_LIMIT * 4).decode('utf-8', errors='replace')
+    return {'first_page_text': text[:FIRST_PAGE_TEXT_LIMIT].strip()}
+
+
+def extract_wav_metadata(fh):
+    """Read duration and format of a WAV file from its header"""
+    with wave.open(fh) as audio:
+        frame_rate = audio.getframerate()
+        return {
+            'duration': round(audio.getnframes() / frame_rate, 3) if frame_rate else 0,
+            'channels': audio.getnchannels(),
+            'sample_rate': frame_rate,
+        }
+
+
+def _mpeg_frame_header(data, offset):
+    """Decode the MPEG audio frame header at `offset`, or None if there isn't one"""
+    if data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[offset + 1] >> 3) & 3
+    layer = 4 - ((data[offset + 1] >> 1) & 3)
+    bitrate_index = data[offset + 2] >> 4
+    rate_index = (data[offset + 2] >> 2) & 3
+    if version not in MPEG_SAMPLE_RATES or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 2 or mpeg1:
+        samples_per_frame = 1152
+    else:
+        samples_per_frame = 576
+    return {
+        'mpeg1': mpeg1,
+        'layer': layer,
+        'bitrate': MPEG_BITRATES[(mpeg1, layer)][bitrate_index] * 1000,
+        'sample_rate': MPEG_SAMPLE_RATES[version][rate_index],
+        'channels': 1 if data[offset + 3] >> 6 == 3 else 2,
+        'samples_per_frame': samples_per_frame,
+    }
+
+
+def extract_mp3_metadata(fh):
+    """Read duration and format of an MPEG audio file from its first frame"""
+    head = fh.read(10)
+    audio_start = 0
+    if head[:3] == b'ID3' and len(head) == 10:
+        # Tag size is a 28-bit syncsafe integer, plus a footer when flagged
+        audio_start = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9])
+        if head[5] & 0x10:
+            audio_start += 10
+    fh.seek(audio_start)
+    data = fh.read(MPEG_FRAME_SEARCH)
+
+    for offset in range(len(data) - 3):
+        frame = _mpeg_frame_header(data, offset)
+        if frame:
+            break
+    else:
+        raise ValueError('No MPEG audio frame found')
+
+    # VBR files carry the frame count in a Xing/Info header in the first frame
+    frames = None
+    if frame['layer'] == 3:
+        if frame['mpeg1']:
+            xing = offset + 4 + (17 if frame['channels'] == 1 else 32)
+        else:
+            xing = offset + 4 + (9 if frame['channels'] == 1 else 17)
+        if data[xing:xing + 4] in (b'Xing', b'Info') and struct.unpack('>I', data[xing + 4:xing + 8])[0] & 1:
+            frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+
+    if frames is not None:
+        duration = frames * frame['samples_per_frame'] / frame['sample_rate']
+    else:
+        # Constant bitrate: the audio length follows from its size
+        fh.seek(0, 2)
+        duration = (fh.tell() - audio_start - offset) * 8 / frame['bitrate']
+    return {
+        'duration': round(duration, 3),
+        'channels': frame['channels'],
+        'sample_rate': frame['sample_rate'],
+        'bitrate': frame['bitrate'],
+    }
+
+
+def _iter_boxes(fh, end):
+    """Yield (type, payload start, box end) for the ISO media boxes up to `end`"""
+    position = fh.tell()
+    while position + 8 <= end:
+        fh.seek(position)
+        size, box_type = struct.unpack('>I4s', fh.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', fh.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            # Last box, runs to the end of the file
+            size = end - position
+        if size < header_size:
+            break
+        yield box_type, position + header_size, position + size
+        position += size
+
+
+def extract_mp4_metadata(fh):
+    """Read duration and video size of an MP4/QuickTime file from its moov box"""
+    fh.seek(0, 2)
+    end = fh.tell()
+    fh.seek(0)
+
+    metadata = {}
+    for box_type, start, box_end in _iter_boxes(fh, end):
+        if box_type != b'moov':
+            continue
+        fh.seek(start)
+        for child_type, child_start, child_end in _iter_boxes(fh, box_end):
+            if child_type == b'mvhd':
+                fh.seek(child_start)
+                payload = fh.read(child_end - child_start)
+                if payload[0] == 1:
+                    timescale, duration = struct.unpack('>IQ', payload[20:32])
+                else:
+                    timescale, duration = struct.unpack('>II', payload[12:20])
+                if timescale:
+                    metadata['duration'] = round(duration / timescale, 3)
+            elif child_type == b'trak' and 'width' not in metadata:
+                fh.seek(child_start)
+                for track_type, track_start, track_end in _iter_boxes(fh, child_end):
+                    if track_type == b'tkhd':
+                        # Width and height are the last two 16.16 fixed point fields
+                        fh.seek(track_end - 8)
+                        width, height = struct.unpack('>II', fh.read(8))
+                        if width and height:
+                            metadata['width'] = width >> 16
+                            metadata['height'] = height >> 16
+                        break
+        break
+
+    if 'duration' not in metadata:
+        raise ValueError('No movie header found')
+    return metadata
+
+
+MIME_EXTRACTORS = {
+    'application/pdf': extract_pdf_metadata,
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': extract_docx_metadata,
+    'text/plain': extract_text_metadata,
+    'text/csv': extract_text_metadata,
+    'audio/wav': extract_wav_metadata,
+    'audio/mpeg': extract_mp3_metadata,
+    'video/mp4': extract_mp4_metadata,
+    'video/quicktime': extract_mp4_metadata,
+}
+
+
+def get_extractor(category, mime_type):
+    """Get the extractor function for a file, or None if there isn't one"""
+    # SVG is XML and has no raster header for Pillow to read
+    if category == 'image' and mime_type != 'image/svg+xml':
+        return extract_image_metadata
+    return MIME_EXTRACTORS.get(mime_type)
+
+
+def extract_file_metadata(name, category, mime_type):
+    """Open a stored file once and extract its metadata"""
+    metadata = {}
+    extractor = get_extractor(category, mime_type)
+    if extractor:
+        try:
+            with default_storage.open(name, 'rb') as fh:
+                metadata.update(extractor(fh))
+        except Exception as e:
+            logger.warning("Metadata extraction failed for %s: %s", name, e)
+            metadata['extraction_error'] = str(e)[:500]
+    metadata['extracted_at'] = timezone.now().isoformat()
+    return metadata
+
+
+def _extract_row(row):
+    pk, name, category, mime_type = row
+    return pk, extract_file_metadata(name, category, mime_type)
+
+
+def _init_worker():
+    # Spawned workers start from a clean interpreter
+    django.setup()
+
+
+class ExtractionPool:
+    """
+    Process pool that gives each file `timeout` seconds of a worker's time.
+
+    Only as many files as there are workers are handed to the pool at once,
+    so a file's clock starts when a worker takes it. A file that runs out
+    of time is recorded with an extraction error, and the pool is replaced
+    to get rid of the hung worker; files the other workers had in hand are
+    queued again.
+    """
+
+    def __init__(self, workers, timeout, extract=_extract_row):
+        self.workers = workers
+        self.timeout = timeout
+        self.extract = extract
+        self.pool = None
+        self._start()
+
+    def _start(self):
+        # Spawn rather than fork so workers don't inherit DB connections
+        connections.close_all()
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        )
+
+    def shutdown(self, kill=False):
+        # shutdown() waits for running calls, so hung workers are killed first
+        processes = list((getattr(self.pool, '_processes', None) or {}).values()) if kill else []
+        for process in processes:
+            process.terminate()
+        self.pool.shutdown(wait=not kill, cancel_futures=kill)
+
+    def map(self, rows):
+        """Extract (pk, name, category, mime_type) rows; returns {pk: metadata}"""
+        results = {}
+        queued = list(reversed(rows))
+        running = {}
+        while queued or running:
+            while queued and len(running) < self.workers:
+                row = queued.pop()
+                running[self.pool.submit(self.extract, row)] = (row, time.monotonic() + self.timeout)
+
+            next_deadline = min(deadline for _, deadline in running.values())
+            done, _ = wait(running, timeout=max(0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                pk, metadata = future.result()
+                results[pk] = metadata
+
+            now = time.monotonic()
+            expired = [future for future, (_, deadline) in running.items() if deadline <= now]
+            if not expired:
+                continue
+            for future in expired:
+                (pk, name, _, _), _ = running.pop(future)
+                logger.warning("Metadata extraction timed out for %s", name)
+                results[pk] = {
+                    'extraction_error': f'Timed out after {self.timeout} seconds',
+                    'extracted_at': timezone.now().isoformat(),
+                }
+            queued.extend(row for row, _ in running.values())
+            running.clear()
+            self.shutdown(kill=True)
+            self._start()
+        return results
+
+
+def extract_pending_metadata(batch_size=100, workers=0, limit=None, reprocess=False, timeout=None):
+    """
+    Extract metadata for files that don't have it yet.
+
+    Files are walked in primary key order in batches of `batch_size`; each
+    batch is written back with a single bulk_update before the next one is
+    read, so an interrupted run loses at most one batch. With `workers` > 0
+    extraction runs in an ExtractionPool that stops any one file after
+    `timeout` seconds (FILE_METADATA_TIMEOUT by default), otherwise inline.
+
+    Returns the number of files processed.
+    """
+    from .models import File
+
+    queryset = File.objects.order_by('pk')
+    if not reprocess:
+        queryset = queryset.exclude(metadata__has_key='extracted_at')
+
+    pool = None
+    if workers:
+        pool = ExtractionPool(workers, settings.FILE_METADATA_TIMEOUT if timeout is None else timeout)
+
+    processed = 0
+    last_pk = None
+    try:
+        while limit is None or processed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - processed)
+            batch_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(batch_queryset.values_list(
+                'pk', 'file', 'category', 'mime_type', 'metadata'
+            )[:size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            rows = [(pk, name, category, mime_type) for pk, name, category, mime_type, _ in batch]
+            if pool:
+                results = pool.map(rows)
+            else:
+                results = dict(map(_extract_row, rows))
+
+            File.objects.bulk_update(
+                [
+                    File(pk=pk, metadata={**(existing or {}), **results[pk]})
+                    for pk, _, _, _, existing in batch
+                ],
+                ['metadata'],
+            )
+            processed += len(batch)
+            logger.info("Extracted metadata for %d files", processed)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    return processed
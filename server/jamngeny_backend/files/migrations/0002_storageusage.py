@@ -0,0 +1,53 @@
+# Generated by Django 4.2.26 on 2026-10-19 06:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_storage_usage(apps, schema_editor):
+    File = apps.get_model('files', 'File')
+    StorageUsage = apps.get_model('files', 'StorageUsage')
+    rows = File.objects.values('uploaded_by_id', 'category').annotate(
+        file_count=models.Count('id'), total_size=models.Sum('file_size')
+    ).order_by()
+    StorageUsage.objects.bulk_create([
+        StorageUsage(
+            user_id=row['uploaded_by_id'],
+            category=row['category'],
+            file_count=row['file_count'],
+            total_size=row['total_size'] or 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('files', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('document', 'Document'), ('image', 'Image'), ('pdf', 'PDF'), ('archive', 'Archive'), ('video', 'Video'), ('audio', 'Audio'), ('other', 'Other')], max_length=20)),
+                ('file_count', models.BigIntegerField(default=0)),
+                ('total_size', models.BigIntegerField(default=0, help_text='Total size in bytes')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='storage_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Storage Usage',
+                'verbose_name_plural': 'Storage Usage',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='storageusage',
+            constraint=models.UniqueConstraint(fields=('user', 'category'), name='unique_storage_usage_user_category'),
+        ),
+        migrations.RunPython(populate_storage_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-19 06:53
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Build the index without locking writes on a large files table
+    atomic = False
+
+    dependencies = [
+        ('files', '0002_storageusage'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='file',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tags'], name='files_file_tags_gin', opclasses=['jsonb_path_ops']),
+        ),
+    ]
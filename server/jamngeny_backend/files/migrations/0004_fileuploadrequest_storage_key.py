@@ -0,0 +1,23 @@
+# Generated by Django 4.2.26 on 2026-10-19 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_file_tags_gin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileuploadrequest',
+            name='checksum_sha256',
+            field=models.CharField(blank=True, help_text='Hex SHA-256 declared by the client, verified on completion', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='fileuploadrequest',
+            name='storage_key',
+            field=models.CharField(blank=True, help_text='Storage path the client uploads to', max_length=500),
+        ),
+    ]
@@ -1,9 +1,12 @@
 import uuid
 import os
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.contrib.postgres.indexes import GinIndex
+from utils.images import validate_image_dimensions, downscale_image_field
+from .sniffing import resolve_mime_type
 
 User = get_user_model()
 
@@ -26,6 +29,46 @@ class File(models.Model):
         ('other', 'Other'),
     ]
 
+    ALLOWED_EXTENSIONS = {
+        'jpg', 'jpeg', 'png', 'gif', 'webp', 'svg',
+        'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx',
+        'txt', 'csv', 'zip', 'rar', 'mp3', 'wav', 'mp4', 'mov', 'avi'
+    }
+
+    EXTENSION_MIME_MAP = {
+        'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png',
+        'gif': 'image/gif', 'webp': 'image/webp', 'svg': 'image/svg+xml',
+        'pdf': 'application/pdf', 'doc': 'application/msword',
+        'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'xls': 'application/vnd.ms-excel',
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'ppt': 'application/vnd.ms-powerpoint',
+        'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        'zip': 'application/zip', 'rar': 'application/x-rar-compressed',
+        'mp3': 'audio/mpeg', 'wav': 'audio/wav', 'mp4': 'video/mp4',
+        'mov': 'video/quicktime', 'avi': 'video/x-msvideo',
+        'txt': 'text/plain', 'csv': 'text/csv',
+    }
+
+    MIME_CATEGORY_MAP = {
+        'application/pdf': 'pdf',
+        'application/zip': 'archive',
+        'application/x-rar-compressed': 'archive',
+        'application/msword': 'document',
+        'application/vnd.ms-excel': 'document',
+        'application/vnd.ms-powerpoint': 'document',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'document',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'document',
+        'application/vnd.openxmlformats-officedocument.presentationml.presentation': 'document',
+    }
+
+    MIME_MAJOR_TYPE_CATEGORY_MAP = {
+        'image': 'image',
+        'video': 'video',
+        'audio': 'audio',
+        'text': 'document',
+    }
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     
     # File Information
@@ -93,13 +136,31 @@ class File(models.Model):
             models.Index(fields=['category', 'is_public', 'is_approved']),
             models.Index(fields=['uploaded_by', 'created_at']),
             models.Index(fields=['mime_type']),
+            # Serves tags @> '["x"]' containment filters
+            GinIndex(fields=['tags'], name='files_file_tags_gin', opclasses=['jsonb_path_ops']),
         ]
         verbose_name = 'File'
         verbose_name_plural = 'Files'
 
+    # Fields (by attname) the storage usage ledger depends on
+    USAGE_FIELDS = ('uploaded_by_id', 'category', 'file_size')
+
     def __str__(self):
         return self.original_filename
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the usage ledger counted this file under, so the
+        # counts can be moved if the owner, category or size changes
+        if all(name in field_names for name in cls.USAGE_FIELDS):
+            instance._loaded_usage = instance.get_usage_key()
+        return instance
+
+    def get_usage_key(self):
+        """The (user id, category, size) this file is counted under in StorageUsage"""
+        return tuple(getattr(self, name) for name in self.USAGE_FIELDS)
+
     def save(self, *args, **kwargs):
         # Set original filename on first save
         if not self.original_filename and self.file:
@@ -109,10 +170,23 @@ class File(models.Model):
         if self.file and not self.file_extension:
             self.file_extension = self.get_file_extension()
         
+        # Prefer the type detected from the upload stream over the extension
+        sniffed_type = self.get_sniffed_mime_type()
+        if sniffed_type:
+            resolved_type = resolve_mime_type(
+                self.file_extension, sniffed_type, self.EXTENSION_MIME_MAP
+            )
+            if resolved_type:
+                self.mime_type = resolved_type
+        
         # Set MIME type if not provided
         if self.file and not self.mime_type:
             self.mime_type = self.guess_mime_type()
         
+        # Shrink oversized images before they are written to storage
+        if self.is_pending_image() and downscale_image_field(self.file):
+            self.file_size = self.file.size
+        
         # Set file size
         if self.file and not self.file_size:
             try:
@@ -128,7 +202,9 @@ class File(models.Model):
         if not self.title and self.original_filename:
             self.title = os.path.splitext(self.original_filename)[0]
         
-        super().save(*args, **kwargs)
+        # The storage usage ledger is updated from post_save; keep both in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def get_file_extension(self):
         """Extract file extension from filename"""
@@ -138,61 +214,66 @@ class File(models.Model):
 
     def guess_mime_type(self):
         """Guess MIME type based on file extension"""
-        extension_mime_map = {
-            'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png',
-            'gif': 'image/gif', 'webp': 'image/webp', 'svg': 'image/svg+xml',
-            'pdf': 'application/pdf', 'doc': 'application/msword',
-            'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'xls': 'application/vnd.ms-excel',
-            'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'ppt': 'application/vnd.ms-powerpoint',
-            'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            'zip': 'application/zip', 'rar': 'application/x-rar-compressed',
-            'mp3': 'audio/mpeg', 'wav': 'audio/wav', 'mp4': 'video/mp4',
-            'mov': 'video/quicktime', 'avi': 'video/x-msvideo',
-            'txt': 'text/plain', 'csv': 'text/csv',
-        }
-        return extension_mime_map.get(self.file_extension, 'application/octet-stream')
+        return self.EXTENSION_MIME_MAP.get(self.file_extension, 'application/octet-stream')
 
     def guess_category(self):
         """Guess file category based on MIME type"""
-        mime_to_category = {
-            'image/': 'image',
-            'video/': 'video',
-            'audio/': 'audio',
-            'application/pdf': 'pdf',
-            'application/zip': 'archive',
-            'application/x-rar-compressed': 'archive',
-            'text/': 'document',
-            'application/msword': 'document',
-            'application/vnd.openxmlformats-officedocument': 'document',
-            'application/vnd.ms-excel': 'document',
-            'application/vnd.ms-powerpoint': 'document',
-        }
-        
-        for mime_prefix, category in mime_to_category.items():
-            if self.mime_type.startswith(mime_prefix):
-                return category
-        
-        return 'other'
+        category = self.MIME_CATEGORY_MAP.get(self.mime_type)
+        if category:
+            return category
+        return self.MIME_MAJOR_TYPE_CATEGORY_MAP.get(self.mime_type.split('/', 1)[0], 'other')
+
+    def is_raster_image(self):
+        """Check if the file's content type is a raster image"""
+        mime_type = self.get_sniffed_mime_type() or self.mime_type or self.guess_mime_type()
+        return mime_type.startswith('image/') and mime_type != 'image/svg+xml'
+
+    def is_pending_image(self):
+        """Check if the file is a raster image that hasn't been written to storage yet"""
+        if not self.file or self.file._committed:
+            return False
+        return self.is_raster_image()
+
+    def get_sniffed_mime_type(self):
+        """Get the content type detected from the upload stream, if any"""
+        # Set directly when the bytes were sniffed elsewhere (direct-to-storage uploads)
+        if getattr(self, 'sniffed_content_type', None):
+            return self.sniffed_content_type
+        # Otherwise only a pending upload carries the annotation from the upload handler.
+        # Never fall through to FieldFile.file on a committed file, which would
+        # open it from storage.
+        if self.file and not self.file._committed:
+            return getattr(self.file.file, 'sniffed_content_type', None)
+        return None
 
     def clean(self):
         """Validate file before saving"""
         if self.file:
+            if not self.file_extension:
+                self.file_extension = self.get_file_extension()
+            
             # Check file size (max 50MB)
             max_size = 50 * 1024 * 1024  # 50MB
             if self.file_size > max_size:
                 raise ValidationError(f"File size cannot exceed 50MB. Current size: {self.file_size} bytes")
             
             # Check allowed file types
-            allowed_extensions = {
-                'jpg', 'jpeg', 'png', 'gif', 'webp', 'svg',
-                'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx',
-                'txt', 'csv', 'zip', 'rar', 'mp3', 'wav', 'mp4', 'mov', 'avi'
-            }
-            if self.file_extension not in allowed_extensions:
+            if self.file_extension not in self.ALLOWED_EXTENSIONS:
                 raise ValidationError(f"File type '{self.file_extension}' is not allowed.")
 
+            # Check the uploaded bytes match the extension
+            sniffed_type = self.get_sniffed_mime_type()
+            if sniffed_type and not resolve_mime_type(
+                self.file_extension, sniffed_type, self.EXTENSION_MIME_MAP
+            ):
+                raise ValidationError(
+                    f"File content ({sniffed_type}) does not match the '{self.file_extension}' extension."
+                )
+
+            # Check image dimensions from the header, before anything decodes it
+            if self.is_pending_image():
+                validate_image_dimensions(self.file.file)
+
     @property
     def file_url(self):
         """Get file URL"""
@@ -251,6 +332,18 @@ class FileUploadRequest(models.Model):
     mime_type = models.CharField(max_length=100)
     file_extension = models.CharField(max_length=10)
     
+    # Storage
+    storage_key = models.CharField(
+        max_length=500,
+        blank=True,
+        help_text="Storage path the client uploads to"
+    )
+    checksum_sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Hex SHA-256 declared by the client, verified on completion"
+    )
+    
     # Security
     upload_token = models.CharField(max_length=100, unique=True)
     is_used = models.BooleanField(default=False)
@@ -286,4 +379,87 @@ class FileUploadRequest(models.Model):
     @property
     def is_valid(self):
         """Check if upload request is still valid"""
-        return not self.is_used and not self.is_expired
\ No newline at end of file
+        return not self.is_used and not self.is_expired
+
+
+class StorageUsage(models.Model):
+    """
+    Materialized storage usage per user and file category.
+
+    Maintained by the File signal handlers in the same transaction as the
+    File insert/delete, so quota checks and dashboards never scan File.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='storage_usage')
+    category = models.CharField(max_length=20, choices=File.FILE_CATEGORIES)
+    file_count = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0, help_text="Total size in bytes")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='unique_storage_usage_user_category'),
+        ]
+        verbose_name = 'Storage Usage'
+        verbose_name_plural = 'Storage Usage'
+
+    def __str__(self):
+        return f"{self.user_id} - {self.category}: {self.total_size} bytes"
+
+    @classmethod
+    def record(cls, user_id, category, count_delta, size_delta):
+        """Apply a delta to the usage row for user/category"""
+        updated = cls.objects.filter(user_id=user_id, category=category).update(
+            file_count=models.F('file_count') + count_delta,
+            total_size=models.F('total_size') + size_delta,
+            updated_at=timezone.now(),
+        )
+        # Rows are only created on uploads; a delete with no row (e.g. during
+        # a cascade from the user) has nothing to decrement
+        if updated or count_delta <= 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_id=user_id, category=category,
+                    file_count=count_delta, total_size=size_delta
+                )
+        except IntegrityError:
+            # Another transaction created the row first
+            cls.objects.filter(user_id=user_id, category=category).update(
+                file_count=models.F('file_count') + count_delta,
+                total_size=models.F('total_size') + size_delta,
+                updated_at=timezone.now(),
+            )
+
+    @classmethod
+    def get_user_total(cls, user):
+        """Get the total bytes stored by a user (one indexed read of at most one row per category)"""
+        return cls.objects.filter(user=user).aggregate(
+            total=models.Sum('total_size')
+        )['total'] or 0
+
+    @classmethod
+    def get_quota(cls, user):
+        """Get the storage quota in bytes for a user, or None if unlimited"""
+        from django.conf import settings
+        if user.is_admin:
+            return None
+        return settings.FILE_STORAGE_QUOTA
+
+    @classmethod
+    def check_quota(cls, user, additional_bytes, lock=False):
+        """
+        Check whether a user can store `additional_bytes` more.
+        Returns (allowed, used_bytes, quota_bytes).
+
+        With `lock` the user's row is locked first, so concurrent uploads by
+        the same user are checked one at a time. Call it that way inside the
+        transaction that saves the File.
+        """
+        quota = cls.get_quota(user)
+        if quota is None:
+            return True, None, None
+        if lock:
+            User.objects.select_for_update().only('pk').get(pk=user.pk)
+        used = cls.get_user_total(user)
+        return used + additional_bytes <= quota, used, quota
@@ -1,7 +1,20 @@
 from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from .models import File, FileUploadRequest
 
 
+def build_file_url(obj, context):
+    """Absolute URL for a stored file (object storage already returns absolute URLs)"""
+    url = obj.file_url
+    if not url or url.startswith(('http://', 'https://')):
+        return url
+    request = context.get('request')
+    if request:
+        return request.build_absolute_uri(url)
+    return f"{settings.BASE_URL}{url}"
+
+
 class FileListSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     display_size = serializers.ReadOnlyField()
@@ -17,6 +30,9 @@ class FileListSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id', 'created_at')
 
+    def get_file_url(self, obj):
+        return build_file_url(obj, self.context)
+
 
 class FileDetailSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
@@ -35,6 +51,9 @@ class FileDetailSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
 
+    def get_file_url(self, obj):
+        return build_file_url(obj, self.context)
+
 
 class FileCreateSerializer(serializers.ModelSerializer):
     tags = serializers.ListField(child=serializers.CharField(), required=False)
@@ -49,6 +68,17 @@ class FileCreateSerializer(serializers.ModelSerializer):
             'file': {'required': True},
         }
 
+    def validate(self, attrs):
+        # Run the model's size, extension and content checks before saving
+        uploaded_file = attrs.get('file')
+        if uploaded_file:
+            instance = File(file=uploaded_file, file_size=uploaded_file.size)
+            try:
+                instance.clean()
+            except DjangoValidationError as e:
+                raise serializers.ValidationError({'file': e.messages})
+        return attrs
+
     def create(self, validated_data):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
@@ -72,21 +102,46 @@ class FileUploadRequestSerializer(serializers.ModelSerializer):
         model = FileUploadRequest
         fields = (
             'id', 'original_filename', 'file_size', 'mime_type',
-            'file_extension', 'purpose', 'expires_at', 'upload_token'
+            'file_extension', 'checksum_sha256', 'purpose', 'expires_at', 'upload_token'
         )
         read_only_fields = ('id', 'upload_token', 'expires_at')
 
+    def validate_file_extension(self, value):
+        value = value.lower().lstrip('.')
+        if value not in File.ALLOWED_EXTENSIONS:
+            raise serializers.ValidationError(f"File type '{value}' is not allowed.")
+        return value
+
+    def validate_checksum_sha256(self, value):
+        value = value.lower()
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value)):
+            raise serializers.ValidationError("Expected a hex-encoded SHA-256 digest.")
+        return value
+
 
 class PresignedUploadResponseSerializer(serializers.Serializer):
-    upload_url = serializers.URLField()
+    upload_url = serializers.CharField()
+    upload_method = serializers.CharField()
     upload_token = serializers.CharField()
     expires_at = serializers.DateTimeField()
     fields = serializers.DictField(child=serializers.CharField())
 
 
+class FileUploadMetadataSerializer(serializers.ModelSerializer):
+    """Descriptive fields supplied when completing a direct upload"""
+    tags = serializers.ListField(child=serializers.CharField(), required=False)
+
+    class Meta:
+        model = File
+        fields = (
+            'title', 'description', 'alt_text', 'category',
+            'tags', 'is_public', 'is_featured'
+        )
+
+
 class FileUploadCompleteSerializer(serializers.Serializer):
     upload_token = serializers.CharField()
-    file_data = serializers.DictField()
+    file_data = serializers.DictField(required=False, default=dict)
 
     def validate_upload_token(self, value):
         try:
@@ -95,4 +150,15 @@ class FileUploadCompleteSerializer(serializers.Serializer):
                 raise serializers.ValidationError("Upload token is invalid or expired.")
             return value
         except FileUploadRequest.DoesNotExist:
-            raise serializers.ValidationError("Invalid upload token.")
\ No newline at end of file
+            raise serializers.ValidationError("Invalid upload token.")
+
+
+class FileArchiveRequestSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.UUIDField(), required=False)
+    tag = serializers.ListField(child=serializers.CharField(), required=False)
+    category = serializers.ChoiceField(choices=File.FILE_CATEGORIES, required=False)
+
+    def validate(self, attrs):
+        if not (attrs.get('ids') or attrs.get('tag') or attrs.get('category')):
+            raise serializers.ValidationError("Provide file ids, a tag or a category.")
+        return attrs
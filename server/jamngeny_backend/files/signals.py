@@ -0,0 +1,38 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import File, StorageUsage
+
+
+@receiver(post_save, sender=File)
+def record_file_usage(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Keep the storage usage ledger in step with new and changed files"""
+    if raw:
+        return
+    usage = instance.get_usage_key()
+    if created:
+        StorageUsage.record(usage[0], usage[1], 1, usage[2])
+        instance._loaded_usage = usage
+        return
+
+    loaded = getattr(instance, '_loaded_usage', None)
+    if loaded is None:
+        return
+    if update_fields is not None:
+        # Fields left out of update_fields keep their stored values
+        field_names = {File._meta.get_field(name).attname for name in update_fields}
+        usage = tuple(
+            value if name in field_names else stored
+            for name, value, stored in zip(File.USAGE_FIELDS, usage, loaded)
+        )
+    if usage != loaded:
+        # Owner, category or size changed: move the file between ledger rows
+        StorageUsage.record(loaded[0], loaded[1], -1, -loaded[2])
+        StorageUsage.record(usage[0], usage[1], 1, usage[2])
+        instance._loaded_usage = usage
+
+
+@receiver(post_delete, sender=File)
+def release_file_usage(sender, instance, **kwargs):
+    """Release a deleted file's bytes from the storage usage ledger"""
+    user_id, category, file_size = getattr(instance, '_loaded_usage', None) or instance.get_usage_key()
+    StorageUsage.record(user_id, category, -1, -file_size)
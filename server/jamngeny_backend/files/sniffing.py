@@ -0,0 +1,167 @@
+"""
+Content type detection from the leading bytes of a file.
+
+Only the first SNIFF_SIZE bytes are ever inspected, so detection can run while
+an upload is still streaming in and never needs the stored file.
+"""
+
+import codecs
+import re
+
+SNIFF_SIZE = 8 * 1024
+
+OCTET_STREAM = 'application/octet-stream'
+OLE_STORAGE = 'application/x-ole-storage'
+
+OOXML_MIME_TYPES = {
+    b'word/': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    b'xl/': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    b'ppt/': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+
+# Fixed signatures at offset 0
+MAGIC_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'Rar!\x1a\x07\x00', 'application/x-rar-compressed'),
+    (b'Rar!\x1a\x07\x01\x00', 'application/x-rar-compressed'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', OLE_STORAGE),
+    (b'ID3', 'audio/mpeg'),
+]
+
+# RIFF containers are identified by the form type at offset 8
+RIFF_FORM_TYPES = {
+    b'WEBP': 'image/webp',
+    b'WAVE': 'audio/wav',
+    b'AVI ': 'video/x-msvideo',
+}
+
+# Top-level QuickTime atoms that may appear before (or instead of) 'ftyp'
+QUICKTIME_ATOMS = {b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot'}
+
+# Byte order marks of text files; UTF-32 first, its LE mark starts like UTF-16's
+TEXT_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+
+# Share of printable characters needed to accept text in a legacy 8-bit encoding
+MIN_PRINTABLE_RATIO = 0.95
+
+# An SVG document: an <svg> root after an optional XML declaration, comments and doctype
+SVG_ROOT_RE = re.compile(
+    r'\s*(?:<\?xml[^>]*>\s*)?(?:(?:<!--.*?-->|<!DOCTYPE[^>]*>)\s*)*<svg[\s>/]',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Detected types that are acceptable for an extension besides its own MIME type.
+# Container formats can't always be narrowed down from the first few KB.
+COMPATIBLE_TYPES = {
+    'docx': {'application/zip'},
+    'xlsx': {'application/zip'},
+    'pptx': {'application/zip'},
+    'doc': {OLE_STORAGE},
+    'xls': {OLE_STORAGE},
+    'ppt': {OLE_STORAGE},
+    'csv': {'text/plain'},
+    'mov': {'video/mp4'},
+    'mp4': {'video/quicktime'},
+}
+
+
+def _sniff_zip(head):
+    """Tell OOXML documents apart from plain zip archives"""
+    if b'[Content_Types].xml' in head:
+        for part_prefix, mime_type in OOXML_MIME_TYPES.items():
+            if part_prefix in head:
+                return mime_type
+    return 'application/zip'
+
+
+def _sniff_iso_media(head):
+    """Detect MP4/QuickTime from the ISO base media box header"""
+    box_type = head[4:8]
+    if box_type == b'ftyp':
+        major_brand = head[8:12]
+        return 'video/quicktime' if major_brand == b'qt  ' else 'video/mp4'
+    if box_type in QUICKTIME_ATOMS:
+        return 'video/quicktime'
+    return None
+
+
+def _decode_text(head):
+    """Decode the head of a text file, or return None if it isn't text"""
+    for bom, encoding in TEXT_BOMS:
+        if head.startswith(bom):
+            # An incremental decoder keeps a character cut off at the end of the head
+            return codecs.getincrementaldecoder(encoding)(errors='replace').decode(head[len(bom):])
+    if b'\x00' in head:
+        return None
+    try:
+        return codecs.getincrementaldecoder('utf-8')().decode(head)
+    except UnicodeDecodeError:
+        pass
+    # Legacy 8-bit encodings (Latin-1, Windows-1252) can't be told apart; accept
+    # anything that decodes to mostly printable characters
+    text = head.decode('cp1252', errors='replace')
+    printable = sum(
+        (char.isprintable() and char != '\ufffd') or char in '\t\r\n\f' for char in text
+    )
+    return text if printable >= MIN_PRINTABLE_RATIO * len(text) else None
+
+
+def _sniff_text(head):
+    """Detect plain text and SVG documents"""
+    text = _decode_text(head)
+    if text is None:
+        return None
+    if SVG_ROOT_RE.match(text):
+        return 'image/svg+xml'
+    return 'text/plain'
+
+
+def sniff_mime_type(head):
+    """Detect the MIME type of a file from its leading bytes"""
+    if not head:
+        return OCTET_STREAM
+
+    for signature, mime_type in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+
+    if head.startswith(b'PK\x03\x04') or head.startswith(b'PK\x05\x06'):
+        return _sniff_zip(head)
+
+    if head.startswith(b'RIFF') and head[8:12] in RIFF_FORM_TYPES:
+        return RIFF_FORM_TYPES[head[8:12]]
+
+    # A UTF-16 LE byte order mark would otherwise pass for an MPEG frame sync
+    if any(head.startswith(bom) for bom, _ in TEXT_BOMS):
+        return _sniff_text(head) or OCTET_STREAM
+
+    # MPEG audio frame sync without an ID3 tag
+    if len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0:
+        return 'audio/mpeg'
+
+    return _sniff_iso_media(head) or _sniff_text(head) or OCTET_STREAM
+
+
+def resolve_mime_type(extension, sniffed_type, extension_mime_map):
+    """
+    Reconcile a sniffed type with a file extension.
+
+    Returns the MIME type to record for the file, or None when the content
+    does not match what the extension claims.
+    """
+    expected = extension_mime_map.get(extension)
+    if expected is None:
+        return None
+    if sniffed_type == expected or sniffed_type in COMPATIBLE_TYPES.get(extension, ()):
+        return expected
+    return None
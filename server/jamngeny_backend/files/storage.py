@@ -0,0 +1,219 @@
+"""
+Storage helpers that work on both the local filesystem and S3-compatible
+object storage (AWS S3, MinIO, ...).
+
+With FILE_STORAGE_BACKEND=s3 the default storage is django-storages'
+S3Storage; clients then upload straight to the bucket with a presigned POST
+and Django only ever sees object metadata. The local backend keeps working
+for development, with uploads going through the upload-direct endpoint.
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import time
+from contextlib import closing
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+READ_CHUNK_SIZE = 64 * 1024
+DELETE_BATCH_SIZE = 1000
+
+
+def is_object_storage(storage=default_storage):
+    """Check whether a storage is an S3-compatible bucket"""
+    from storages.backends.s3 import S3Storage
+    return isinstance(storage, S3Storage)
+
+
+def _client(storage):
+    return storage.connection.meta.client
+
+
+def _object_key(storage, name):
+    # Apply the storage's LOCATION prefix the same way S3Storage does
+    from storages.utils import clean_name
+    return storage._normalize_name(clean_name(name))
+
+
+def _hex_to_base64(hex_digest):
+    return base64.b64encode(binascii.unhexlify(hex_digest)).decode('ascii')
+
+
+def _base64_to_hex(b64_digest):
+    return binascii.hexlify(base64.b64decode(b64_digest)).decode('ascii')
+
+
+def generate_presigned_upload(name, content_type, file_size, checksum_sha256='',
+                              expires_in=3600, storage=default_storage):
+    """
+    Generate a presigned POST that lets a client upload exactly `file_size`
+    bytes to `name`. If a SHA-256 is given, the bucket rejects any body that
+    doesn't match it. Returns {'url': ..., 'fields': {...}}, or None when
+    the storage can't accept direct uploads.
+    """
+    if not is_object_storage(storage):
+        return None
+
+    fields = {'Content-Type': content_type}
+    conditions = [
+        {'Content-Type': content_type},
+        ['content-length-range', file_size, file_size],
+    ]
+    if checksum_sha256:
+        checksum = _hex_to_base64(checksum_sha256)
+        fields.update({'x-amz-checksum-algorithm': 'SHA256', 'x-amz-checksum-sha256': checksum})
+        conditions += [
+            {'x-amz-checksum-algorithm': 'SHA256'},
+            {'x-amz-checksum-sha256': checksum},
+        ]
+
+    return _client(storage).generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=_object_key(storage, name),
+        Fields=fields,
+        Conditions=conditions,
+        ExpiresIn=expires_in,
+    )
+
+
+def stat_object(name, storage=default_storage):
+    """
+    Get {'size': ..., 'checksum_sha256': ...} for a stored object.
+    The checksum is None when the backend doesn't record one.
+    Raises FileNotFoundError if the object doesn't exist.
+    """
+    if not is_object_storage(storage):
+        if not storage.exists(name):
+            raise FileNotFoundError(name)
+        return {'size': storage.size(name), 'checksum_sha256': None}
+
+    from botocore.exceptions import ClientError
+    try:
+        head = _client(storage).head_object(
+            Bucket=storage.bucket_name,
+            Key=_object_key(storage, name),
+            ChecksumMode='ENABLED',
+        )
+    except ClientError as e:
+        if e.response['ResponseMetadata']['HTTPStatusCode'] == 404:
+            raise FileNotFoundError(name)
+        raise
+    checksum = head.get('ChecksumSHA256')
+    # Multipart uploads report a checksum-of-checksums ("...-N"), which isn't comparable
+    if checksum and '-' not in checksum:
+        checksum = _base64_to_hex(checksum)
+    else:
+        checksum = None
+    return {'size': head['ContentLength'], 'checksum_sha256': checksum}
+
+
+def open_stream(name, storage=default_storage):
+    """
+    Open a stored file for sequential reading without buffering it locally.
+    S3Storage.open() spools the whole object to a temporary file, so objects
+    are read from the GetObject body instead.
+    """
+    if is_object_storage(storage):
+        response = _client(storage).get_object(
+            Bucket=storage.bucket_name, Key=_object_key(storage, name)
+        )
+        return closing(response['Body'])
+    return storage.open(name, 'rb')
+
+
+def read_head(name, length, storage=default_storage):
+    """Read the first `length` bytes of a stored file"""
+    if is_object_storage(storage):
+        response = _client(storage).get_object(
+            Bucket=storage.bucket_name,
+            Key=_object_key(storage, name),
+            Range=f'bytes=0-{length - 1}',
+        )
+        with closing(response['Body']) as body:
+            return body.read()
+    with storage.open(name, 'rb') as fh:
+        return fh.read(length)
+
+
+def compute_sha256(name, storage=default_storage):
+    """Hash a stored file by streaming it"""
+    digest = hashlib.sha256()
+    with open_stream(name, storage) as fh:
+        while True:
+            chunk = fh.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_stored_files(prefix, min_age_seconds=0, storage=default_storage):
+    """
+    Yield (name, size) for every stored file under `prefix`, one directory
+    entry or listing page at a time. Files modified in the last
+    `min_age_seconds` are skipped so in-flight uploads are left alone.
+    """
+    if is_object_storage(storage):
+        yield from _iter_bucket_objects(prefix, min_age_seconds, storage)
+        return
+
+    cutoff = time.time() - min_age_seconds
+    root = storage.path(prefix)
+    base = storage.path('')
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    name = os.path.relpath(entry.path, base).replace(os.sep, '/')
+                    yield name, stat.st_size
+
+
+def _iter_bucket_objects(prefix, min_age_seconds, storage):
+    cutoff = timezone.now() - timedelta(seconds=min_age_seconds)
+    location = storage.location.strip('/')
+    key_prefix = _object_key(storage, prefix).rstrip('/') + '/'
+    paginator = _client(storage).get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=storage.bucket_name, Prefix=key_prefix):
+        for obj in page.get('Contents', []):
+            if obj['LastModified'] > cutoff:
+                continue
+            name = obj['Key']
+            if location:
+                name = name[len(location) + 1:]
+            yield name, obj['Size']
+
+
+def delete_files(names, storage=default_storage):
+    """Delete stored files, batching requests on object storage"""
+    if not is_object_storage(storage):
+        for name in names:
+            storage.delete(name)
+        return
+
+    names = list(names)
+    for start in range(0, len(names), DELETE_BATCH_SIZE):
+        _client(storage).delete_objects(
+            Bucket=storage.bucket_name,
+            Delete={
+                'Objects': [
+                    {'Key': _object_key(storage, name)}
+                    for name in names[start:start + DELETE_BATCH_SIZE]
+                ],
+                'Quiet': True,
+            },
+        )
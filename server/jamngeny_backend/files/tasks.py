@@ -0,0 +1,26 @@
+from celery import shared_task
+from django.conf import settings
+from .cleanup import delete_expired_upload_requests, collect_orphaned_files
+from .metadata import extract_pending_metadata
+
+
+@shared_task
+def extract_pending_file_metadata():
+    """Periodically extract metadata for newly uploaded files"""
+    # Celery workers are daemonic and can't host a process pool, so extract inline
+    return extract_pending_metadata(
+        batch_size=settings.FILE_METADATA_BATCH_SIZE,
+        limit=settings.FILE_METADATA_BATCH_SIZE,
+    )
+
+
+@shared_task
+def gc_files():
+    """Periodically remove expired upload requests and orphaned stored files"""
+    deleted_requests = delete_expired_upload_requests()
+    orphan_count, orphan_bytes = collect_orphaned_files()
+    return {
+        'deleted_upload_requests': deleted_requests,
+        'orphaned_files': orphan_count,
+        'orphaned_bytes': orphan_bytes,
+    }
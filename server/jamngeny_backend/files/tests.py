@@ -1,3 +1,452 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import boto3
+import requests
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from moto import mock_aws
+from rest_framework.test import APIClient
+
+from . import views
+from .cleanup import collect_orphaned_files, delete_expired_upload_requests
+from .metadata import ExtractionPool, extract_mp3_metadata, extract_mp4_metadata
+from .models import File, FileUploadRequest, StorageUsage
+from .sniffing import OCTET_STREAM, resolve_mime_type, sniff_mime_type
+from .storage import (
+    compute_sha256, delete_files, generate_presigned_upload, iter_stored_files, read_head, stat_object,
+)
+
+BUCKET = 'test-uploads'
+
+S3_STORAGES = {
+    'default': {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+
+SVG = b'<?xml version="1.0"?>\n<!-- logo -->\n<svg xmlns="http://www.w3.org/2000/svg" width="1" height="1"/>'
+
+
+class SniffingTests(SimpleTestCase):
+    def test_binary_signatures(self):
+        for head, expected in [
+            (b'\xff\xd8\xff\xe0' + b'\x00' * 20, 'image/jpeg'),
+            (b'%PDF-1.7\n', 'application/pdf'),
+            (b'PK\x03\x04' + b'[Content_Types].xml word/document.xml', File.EXTENSION_MIME_MAP['docx']),
+            (b'RIFF\x00\x00\x00\x00WAVEfmt ', 'audio/wav'),
+            (b'\x00\x00\x00\x18ftypqt  ', 'video/quicktime'),
+            (b'ID3\x04', 'audio/mpeg'),
+            (b'\x00\x01\x02\x03', OCTET_STREAM),
+        ]:
+            self.assertEqual(sniff_mime_type(head), expected, head)
+
+    def test_text_encodings(self):
+        text = 'Name,City\nZoë,Zürich\n'
+        for head in [
+            text.encode('utf-8'),
+            # A multi-byte character cut off at the end of the sniffed bytes
+            text.encode('utf-8') + 'ë'.encode('utf-8')[:1],
+            b'\xef\xbb\xbf' + text.encode('utf-8'),
+            text.encode('utf-16'),
+            b'\xfe\xff' + text.encode('utf-16-be'),
+            text.encode('latin-1'),
+            'Quote: \u201cdone\u201d'.encode('cp1252'),
+        ]:
+            self.assertEqual(sniff_mime_type(head), 'text/plain', head)
+
+    def test_svg_needs_an_svg_root(self):
+        self.assertEqual(sniff_mime_type(SVG), 'image/svg+xml')
+        self.assertEqual(sniff_mime_type(b'<svg viewBox="0 0 1 1"></svg>'), 'image/svg+xml')
+        self.assertEqual(sniff_mime_type(b'Notes on embedding an <svg> tag in HTML'), 'text/plain')
+
+    def test_resolve_against_extension(self):
+        mime_map = File.EXTENSION_MIME_MAP
+        self.assertEqual(resolve_mime_type('csv', 'text/plain', mime_map), 'text/csv')
+        self.assertEqual(resolve_mime_type('mov', 'video/mp4', mime_map), 'video/quicktime')
+        self.assertIsNone(resolve_mime_type('txt', 'application/pdf', mime_map))
+        self.assertIsNone(resolve_mime_type('svg', 'text/plain', mime_map))
+        self.assertIsNone(resolve_mime_type('exe', 'text/plain', mime_map))
+
+
+@override_settings(API_REQUEST_LOG_ENABLED=False)
+class SniffedUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user('sniffer', email='sniffer@example.com', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, content, content_type):
+        return self.client.post('/api/files/files/create/', {
+            'file': SimpleUploadedFile(name, content, content_type=content_type), 'title': name,
+        }, format='multipart')
+
+    def test_spoofed_content_type_is_rejected(self):
+        # The client claims a PDF but sends an executable
+        response = self.upload('invoice.pdf', b'MZ\x90\x00\x03\x00\x00\x00', 'application/pdf')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(File.objects.exists())
+
+    def test_mismatched_extension_is_rejected(self):
+        response = self.upload('notes.txt', b'%PDF-1.4 not really notes', 'text/plain')
+        self.assertEqual(response.status_code, 400)
+
+    def test_legacy_encoded_text_is_accepted(self):
+        response = self.upload('contacts.csv', 'Zoë,Zürich\n'.encode('latin-1'), 'application/octet-stream')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(File.objects.get().mime_type, 'text/csv')
+
+
+@override_settings(API_REQUEST_LOG_ENABLED=False)
+class FileTagTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('tagger', email='tagger@example.com', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_limit_is_clamped(self):
+        for limit in ('-1', '0', '5000', 'abc'):
+            response = self.client.get('/api/files/tags/', {'limit': limit})
+            self.assertEqual(response.status_code, 200, limit)
+
+
+class StorageUsageTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create_user('alice', email='alice@example.com', password='x')
+        self.bob = User.objects.create_user('bob', email='bob@example.com', password='x')
+
+    def usage(self):
+        return {
+            (row.user_id, row.category): (row.file_count, row.total_size)
+            for row in StorageUsage.objects.all()
+            if row.file_count or row.total_size
+        }
+
+    def create_file(self):
+        file_obj = File.objects.create(
+            file='files/report.pdf', original_filename='report.pdf', file_size=100,
+            mime_type='application/pdf', file_extension='pdf', category='pdf', uploaded_by=self.alice,
+        )
+        return File.objects.get(pk=file_obj.pk)
+
+    def test_size_owner_and_category_changes_move_usage(self):
+        file_obj = self.create_file()
+        self.assertEqual(self.usage(), {(self.alice.pk, 'pdf'): (1, 100)})
+
+        file_obj.file_size = 250
+        file_obj.save()
+        self.assertEqual(self.usage(), {(self.alice.pk, 'pdf'): (1, 250)})
+
+        file_obj.uploaded_by = self.bob
+        file_obj.category = 'document'
+        file_obj.save()
+        self.assertEqual(self.usage(), {(self.bob.pk, 'document'): (1, 250)})
+
+        file_obj.delete()
+        self.assertEqual(self.usage(), {})
+
+    def test_fields_outside_update_fields_are_not_counted(self):
+        file_obj = self.create_file()
+        file_obj.file_size = 999
+        file_obj.title = 'Renamed'
+        file_obj.save(update_fields=['title'])
+        self.assertEqual(self.usage(), {(self.alice.pk, 'pdf'): (1, 100)})
+
+        file_obj.save(update_fields=['file_size'])
+        self.assertEqual(self.usage(), {(self.alice.pk, 'pdf'): (1, 999)})
+
+
+class FileCleanupTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = get_user_model().objects.create_user('cleaner', email='cleaner@example.com', password='x')
+
+    def upload_request(self, token, expires_in, storage_key='', is_used=False, age_days=0):
+        upload_request = FileUploadRequest.objects.create(
+            original_filename='a.bin', file_size=1, mime_type='application/octet-stream', file_extension='bin',
+            storage_key=storage_key, upload_token=token, is_used=is_used, uploaded_by=self.user,
+            expires_at=timezone.now() + timedelta(seconds=expires_in),
+        )
+        FileUploadRequest.objects.filter(pk=upload_request.pk).update(
+            created_at=timezone.now() - timedelta(days=age_days)
+        )
+        return upload_request
+
+    def store(self, name, content=b'data'):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as stored:
+            stored.write(content)
+
+    def test_expired_and_old_used_requests_are_deleted(self):
+        self.upload_request('expired', expires_in=-60)
+        self.upload_request('old-used', expires_in=-60, is_used=True, age_days=60)
+        self.upload_request('recently-used', expires_in=-60, is_used=True, age_days=1)
+        self.upload_request('pending', expires_in=600)
+
+        self.assertEqual(delete_expired_upload_requests(dry_run=True), 2)
+        self.assertEqual(delete_expired_upload_requests(batch_size=1), 2)
+        self.assertEqual(
+            set(FileUploadRequest.objects.values_list('upload_token', flat=True)), {'recently-used', 'pending'}
+        )
+
+    def test_only_unreferenced_files_are_collected(self):
+        File.objects.create(
+            file='files/kept.pdf', original_filename='kept.pdf', file_size=4, mime_type='application/pdf',
+            file_extension='pdf', category='pdf', uploaded_by=self.user,
+        )
+        self.upload_request('pending', expires_in=600, storage_key='files/pending.bin')
+        self.upload_request('abandoned', expires_in=-60, storage_key='files/abandoned.bin')
+        for name in ('files/kept.pdf', 'files/pending.bin', 'files/abandoned.bin', 'files/2024/orphan.bin'):
+            self.store(name)
+
+        # Files younger than min_age_seconds may be uploads still in flight
+        self.assertEqual(collect_orphaned_files(), (0, 0))
+        with self.assertLogs('files.cleanup', 'INFO'):
+            self.assertEqual(collect_orphaned_files(batch_size=2, dry_run=True, min_age_seconds=0), (2, 8))
+            self.assertEqual(collect_orphaned_files(batch_size=2, min_age_seconds=0), (2, 8))
+
+        remaining = {name for name, _ in iter_stored_files('files')}
+        self.assertEqual(remaining, {'files/kept.pdf', 'files/pending.bin'})
+
+
+@override_settings(API_REQUEST_LOG_ENABLED=False)
+class ArchiveDownloadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        User = get_user_model()
+        self.user = User.objects.create_user('archiver', email='archiver@example.com', password='x')
+        self.other = User.objects.create_user('other', email='other@example.com', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_file(self, name, original_filename, content, owner=None, category='document', mime_type='text/plain'):
+        os.makedirs(os.path.join(self.media_root, 'files'), exist_ok=True)
+        with open(os.path.join(self.media_root, 'files', name), 'wb') as stored:
+            stored.write(content)
+        return File.objects.create(
+            file=f'files/{name}', original_filename=original_filename, file_size=len(content),
+            mime_type=mime_type, file_extension=original_filename.rsplit('.', 1)[-1], category=category,
+            uploaded_by=owner or self.user,
+        )
+
+    def test_archive_streams_accessible_files(self):
+        notes = self.create_file('a.txt', 'notes.txt', b'first notes ' * 100)
+        copy = self.create_file('b.txt', 'notes.txt', b'second notes')
+        photo = self.create_file('c.jpg', 'photo.jpg', b'\xff\xd8\xff not really a jpeg', category='image',
+                                 mime_type='image/jpeg')
+        private = self.create_file('d.txt', 'secret.txt', b'not yours', owner=self.other)
+
+        response = self.client.get('/api/files/archive/', {'id': [notes.pk, copy.pk, photo.pk, private.pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(sorted(archive.namelist()), ['notes (1).txt', 'notes.txt', 'photo.jpg'])
+            self.assertEqual(
+                {archive.read('notes.txt'), archive.read('notes (1).txt')}, {b'first notes ' * 100, b'second notes'}
+            )
+            self.assertEqual(archive.getinfo('photo.jpg').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(archive.getinfo('notes.txt').compress_type, zipfile.ZIP_DEFLATED)
+
+        self.assertEqual(File.objects.get(pk=notes.pk).download_count, 1)
+        self.assertEqual(File.objects.get(pk=private.pk).download_count, 0)
+
+    def test_inaccessible_and_oversized_selections_are_rejected(self):
+        private = self.create_file('d.txt', 'secret.txt', b'not yours', owner=self.other)
+        response = self.client.get('/api/files/archive/', {'id': [private.pk]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error']['code'], 'NOT_FOUND')
+
+        self.create_file('a.txt', 'a.txt', b'a')
+        self.create_file('b.txt', 'b.txt', b'b')
+        with override_settings(FILE_ARCHIVE_MAX_FILES=1):
+            response = self.client.post('/api/files/archive/', {'category': 'document'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error']['code'], 'TOO_MANY_FILES')
+
+
+def extract_or_hang(row):
+    # Runs in pool workers, so it has to be importable
+    pk, name, _, _ = row
+    if name == 'hangs.pdf':
+        time.sleep(600)
+    return pk, {'name': name}
+
+
+class ExtractionPoolTests(SimpleTestCase):
+    def test_hung_file_times_out_and_the_pool_recovers(self):
+        names = ['a.pdf', 'hangs.pdf', 'b.pdf', 'c.pdf']
+        rows = [(pk, name, 'pdf', 'application/pdf') for pk, name in enumerate(names)]
+        pool = ExtractionPool(2, timeout=10, extract=extract_or_hang)
+        try:
+            results = pool.map(rows)
+        finally:
+            pool.shutdown(kill=True)
+
+        self.assertEqual(results[1]['extraction_error'], 'Timed out after 10 seconds')
+        self.assertIn('extracted_at', results[1])
+        for pk in (0, 2, 3):
+            self.assertEqual(results[pk], {'name': names[pk]})
+
+
+def box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+class MediaMetadataTests(SimpleTestCase):
+    # MPEG-1 layer III, 128 kbps, 44.1 kHz, joint stereo: 417 byte frames
+    MP3_FRAME = b'\xff\xfb\x90\x44' + b'\x00' * 413
+
+    def test_mp3_constant_bitrate(self):
+        id3 = b'ID3\x04\x00\x00\x00\x00\x00\x5a' + b'\x00' * 90
+        metadata = extract_mp3_metadata(BytesIO(id3 + self.MP3_FRAME * 100))
+        self.assertAlmostEqual(metadata['duration'], 100 * 1152 / 44100, places=1)
+        self.assertEqual((metadata['sample_rate'], metadata['channels']), (44100, 2))
+
+    def test_mp3_xing_frame_count(self):
+        xing = self.MP3_FRAME[:36] + b'Xing' + struct.pack('>II', 1, 1000)
+        first = xing + self.MP3_FRAME[len(xing):]
+        metadata = extract_mp3_metadata(BytesIO(first + self.MP3_FRAME * 10))
+        self.assertEqual(metadata['duration'], round(1000 * 1152 / 44100, 3))
+
+    def test_mp3_without_frames(self):
+        with self.assertRaises(ValueError):
+            extract_mp3_metadata(BytesIO(b'\x00' * 1000))
+
+    def movie(self, moov_last=False):
+        mvhd = box(b'mvhd', b'\x00' * 12 + struct.pack('>II', 1000, 5500) + b'\x00' * 80)
+        tkhd = box(b'tkhd', b'\x00' * 76 + struct.pack('>II', 1280 << 16, 720 << 16))
+        moov = box(b'moov', mvhd + box(b'trak', tkhd))
+        ftyp = box(b'ftyp', b'isom\x00\x00\x02\x00')
+        mdat = box(b'mdat', b'\x00' * 4096)
+        return BytesIO(ftyp + mdat + moov if moov_last else ftyp + moov + mdat)
+
+    def test_mp4(self):
+        for moov_last in (False, True):
+            self.assertEqual(
+                extract_mp4_metadata(self.movie(moov_last)), {'duration': 5.5, 'width': 1280, 'height': 720}
+            )
+
+
+@mock.patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing'})
+@override_settings(
+    STORAGES=S3_STORAGES, AWS_STORAGE_BUCKET_NAME=BUCKET, AWS_S3_REGION_NAME='us-east-1',
+    AWS_S3_SIGNATURE_VERSION='s3v4', AWS_S3_FILE_OVERWRITE=False, AWS_DEFAULT_ACL=None,
+    API_REQUEST_LOG_ENABLED=False,
+)
+class ObjectStorageTests(TestCase):
+    """The storage helpers and direct uploads against an S3 API (moto)"""
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket=BUCKET)
+
+    def test_storage_helpers(self):
+        body = b'0123456789' * 1000
+        self.s3.put_object(Bucket=BUCKET, Key='files/a.bin', Body=body, ChecksumAlgorithm='SHA256')
+
+        stored = stat_object('files/a.bin')
+        self.assertEqual(stored['size'], len(body))
+        self.assertEqual(stored['checksum_sha256'], hashlib.sha256(body).hexdigest())
+        self.assertEqual(read_head('files/a.bin', 16), body[:16])
+        self.assertEqual(compute_sha256('files/a.bin'), hashlib.sha256(body).hexdigest())
+        self.assertEqual([name for name, _ in iter_stored_files('files/')], ['files/a.bin'])
+
+        delete_files(['files/a.bin'])
+        with self.assertRaises(FileNotFoundError):
+            stat_object('files/a.bin')
+
+    def test_presigned_post_enforces_size(self):
+        presigned = generate_presigned_upload('files/b.txt', 'text/plain', 5)
+        response = requests.post(presigned['url'], data=presigned['fields'], files={'file': b'hello'})
+        self.assertLess(response.status_code, 300)
+        self.assertEqual(stat_object('files/b.txt')['size'], 5)
+
+    def presign_and_upload(self, client, body):
+        response = client.post('/api/files/upload/presign/', {
+            'original_filename': 'report.pdf', 'file_size': len(body), 'mime_type': 'application/pdf',
+            'file_extension': 'pdf', 'checksum_sha256': hashlib.sha256(body).hexdigest(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        data = response.json()['data']
+        upload = requests.post(data['upload_url'], data=data['fields'], files={'file': body})
+        self.assertLess(upload.status_code, 300)
+        return {'upload_token': data['upload_token'], 'file_data': {'title': 'Report'}}
+
+    def test_direct_upload_completes_once(self):
+        user = get_user_model().objects.create_user('uploader', email='uploader@example.com', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+        completion = self.presign_and_upload(client, b'%PDF-1.4 report')
+
+        self.assertEqual(client.post('/api/files/upload-complete/', completion, format='json').status_code, 201)
+        self.assertEqual(client.post('/api/files/upload-complete/', completion, format='json').status_code, 400)
+        self.assertEqual(File.objects.filter(uploaded_by=user).count(), 1)
+
+    def test_concurrent_completion_creates_one_file(self):
+        user = get_user_model().objects.create_user('racer', email='racer@example.com', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+        completion = self.presign_and_upload(client, b'%PDF-1.4 report')
+
+        stat_object = views.stat_object
+
+        def completed_elsewhere(name):
+            # The other request finishes while this one is checking the object
+            FileUploadRequest.objects.filter(upload_token=completion['upload_token']).update(is_used=True)
+            return stat_object(name)
+
+        with mock.patch('files.views.stat_object', completed_elsewhere):
+            response = client.post('/api/files/upload-complete/', completion, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(File.objects.filter(uploaded_by=user).exists())
+
+    @override_settings(FILE_STORAGE_QUOTA=20)
+    def test_quota_is_checked_again_at_completion(self):
+        user = get_user_model().objects.create_user('hoarder', email='hoarder@example.com', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+        # Both uploads fit the quota when presigned, but not together
+        first = self.presign_and_upload(client, b'%PDF-1.4 first')
+        second = self.presign_and_upload(client, b'%PDF-1.4 second')
+
+        self.assertEqual(client.post('/api/files/upload-complete/', first, format='json').status_code, 201)
+        response = client.post('/api/files/upload-complete/', second, format='json')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['error']['code'], 'QUOTA_EXCEEDED')
+        self.assertEqual(File.objects.filter(uploaded_by=user).count(), 1)
+        self.assertEqual(StorageUsage.get_user_total(user), len(b'%PDF-1.4 first'))
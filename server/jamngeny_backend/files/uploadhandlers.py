@@ -0,0 +1,34 @@
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler, TemporaryFileUploadHandler
+)
+from .sniffing import SNIFF_SIZE, sniff_mime_type
+
+
+class ContentSniffingMixin:
+    """
+    Capture the first SNIFF_SIZE bytes of each upload as it streams through the
+    handler and annotate the resulting UploadedFile with `sniffed_content_type`.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.sniff_buffer = bytearray()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if len(self.sniff_buffer) < SNIFF_SIZE:
+            self.sniff_buffer += raw_data[:SNIFF_SIZE - len(self.sniff_buffer)]
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.sniffed_content_type = sniff_mime_type(bytes(self.sniff_buffer))
+        return uploaded_file
+
+
+class SniffingMemoryFileUploadHandler(ContentSniffingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class SniffingTemporaryFileUploadHandler(ContentSniffingMixin, TemporaryFileUploadHandler):
+    pass
@@ -2,7 +2,7 @@ from django.urls import path
 from .views import (
     FileListView, FileDetailView, FileDownloadView, FileCreateView,
     FileUpdateView, FileDeleteView, PresignedUploadView,
-    upload_complete, file_stats
+    upload_direct, upload_complete, file_stats, download_archive, file_tags
 )
 
 app_name = 'files'
@@ -11,6 +11,8 @@ urlpatterns = [
     # File management
     path('files/', FileListView.as_view(), name='file-list'),
     path('files/create/', FileCreateView.as_view(), name='file-create'),
+    path('archive/', download_archive, name='file-archive'),
+    path('tags/', file_tags, name='file-tags'),
     path('files/<uuid:pk>/', FileDetailView.as_view(), name='file-detail'),
     path('files/<uuid:pk>/download/', FileDownloadView.as_view(), name='file-download'),
     path('files/<uuid:pk>/update/', FileUpdateView.as_view(), name='file-update'),
@@ -18,6 +20,7 @@ urlpatterns = [
     
     # Upload endpoints
     path('upload/presign/', PresignedUploadView.as_view(), name='upload-presign'),
+    path('upload/<str:upload_token>/', upload_direct, name='upload-direct'),
     path('upload-complete/', upload_complete, name='upload-complete'),
     
     # Stats
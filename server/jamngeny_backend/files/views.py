@@ -1,43 +1,100 @@
 import uuid
 import json
 from datetime import timedelta
-from django.db import models  # ADD THIS IMPORT
+from django.db import models, connection, transaction
 from django.conf import settings
 from django.utils import timezone
 from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import File, FileUploadRequest
+from .models import File, FileUploadRequest, StorageUsage, file_upload_path
 from .serializers import (
     FileListSerializer, FileDetailSerializer, FileCreateSerializer,
     FileUpdateSerializer, FileUploadRequestSerializer,
-    PresignedUploadResponseSerializer, FileUploadCompleteSerializer
+    PresignedUploadResponseSerializer, FileUploadCompleteSerializer,
+    FileArchiveRequestSerializer, FileUploadMetadataSerializer
 )
+from utils.export import StreamingExportMixin
+from utils.images import validate_stored_image_dimensions
+from .archive import stream_zip
+from .sniffing import SNIFF_SIZE, sniff_mime_type
+from .storage import (
+    generate_presigned_upload, stat_object, read_head, compute_sha256, delete_files
+)
+
+
+def quota_exceeded_response(user, additional_bytes, lock=False):
+    """Return an error response if the upload would exceed the user's storage quota"""
+    allowed, used, quota = StorageUsage.check_quota(user, additional_bytes, lock=lock)
+    if allowed:
+        return None
+    return Response({
+        'status': 'error',
+        'error': {
+            'code': 'QUOTA_EXCEEDED',
+            'message': 'This upload would exceed your storage quota.',
+            'details': {
+                'used_bytes': used,
+                'quota_bytes': quota,
+                'requested_bytes': additional_bytes,
+            }
+        }
+    }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+
+def filter_by_tags(queryset, tags, match='all'):
+    """
+    Filter files by tags using JSON containment so the GIN index on tags is used.
+    `match` is 'all' (every tag present) or 'any' (at least one).
+    """
+    tags = [tag for tag in tags if tag]
+    if not tags:
+        return queryset
+    if match == 'any':
+        condition = models.Q()
+        for tag in tags:
+            condition |= models.Q(tags__contains=[tag])
+        return queryset.filter(condition)
+    return queryset.filter(tags__contains=tags)
+
 
+def get_visible_files(user):
+    """Files a user may list: everything for admins, otherwise public or own approved files"""
+    if user.is_admin:
+        return File.objects.all()
+    return File.objects.filter(
+        models.Q(is_public=True) | models.Q(uploaded_by=user)
+    ).filter(is_approved=True)
 
-class FileListView(generics.ListAPIView):
+
+class FileListView(StreamingExportMixin, generics.ListAPIView):
     serializer_class = FileListSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['category', 'is_public', 'is_approved', 'is_featured']
-    search_fields = ['original_filename', 'title', 'description', 'tags']
+    search_fields = ['original_filename', 'title', 'description']
     ordering_fields = ['created_at', 'file_size', 'download_count']
     ordering = ['-created_at']
+    export_fields = [
+        'id', 'created_at', 'original_filename', 'title', 'category', 'mime_type', 'file_size',
+        'tags', 'uploaded_by__email', 'is_public', 'is_approved', 'is_featured',
+        'virus_scan_status', 'download_count', 'last_downloaded_at',
+    ]
+    export_filename = 'files'
 
     def get_queryset(self):
-        user = self.request.user
+        # Admins can see all files; users see public files and their own files
+        queryset = get_visible_files(self.request.user).select_related('uploaded_by')
         
-        if user.is_admin:
-            # Admins can see all files
-            return File.objects.all().select_related('uploaded_by')
-        else:
-            # Users can see public files and their own files
-            return File.objects.filter(
-                models.Q(is_public=True) | models.Q(uploaded_by=user)
-            ).filter(is_approved=True).select_related('uploaded_by')
+        # Exact tag filters: ?tag=a&tag=b[&tag_match=any]
+        tag_match = 'any' if self.request.query_params.get('tag_match') == 'any' else 'all'
+        return filter_by_tags(queryset, self.request.query_params.getlist('tag'), tag_match)
 
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
@@ -119,7 +176,14 @@ class FileCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
+        uploaded_file = request.FILES.get('file')
+        # Check the quota and save under the user's lock so concurrent uploads can't both fit
+        with transaction.atomic():
+            if uploaded_file:
+                quota_response = quota_exceeded_response(request.user, uploaded_file.size, lock=True)
+                if quota_response:
+                    return quota_response
+            response = super().create(request, *args, **kwargs)
         return Response({
             'status': 'success',
             'data': response.data
@@ -189,30 +253,54 @@ class PresignedUploadView(generics.CreateAPIView):
                 }
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        quota_response = quota_exceeded_response(
+            request.user, serializer.validated_data['file_size']
+        )
+        if quota_response:
+            return quota_response
+        
         # Create upload request
+        original_filename = serializer.validated_data['original_filename']
         upload_request = FileUploadRequest(
             uploaded_by=request.user,
-            original_filename=serializer.validated_data['original_filename'],
+            original_filename=original_filename,
             file_size=serializer.validated_data['file_size'],
             mime_type=serializer.validated_data.get('mime_type', 'application/octet-stream'),
             file_extension=serializer.validated_data['file_extension'],
+            checksum_sha256=serializer.validated_data.get('checksum_sha256', ''),
             purpose=serializer.validated_data.get('purpose', ''),
+            storage_key=file_upload_path(
+                None, f"{original_filename}.{serializer.validated_data['file_extension']}"
+            ),
             upload_token=str(uuid.uuid4()),
             expires_at=timezone.now() + timedelta(hours=1)  # 1 hour expiry
         )
         upload_request.save()
         
-        # Generate presigned URL data (simplified - in production, use your storage backend's presigned URL feature)
-        # For Django's default storage, we'll return the token and let the client upload directly
-        # In production with S3, you would generate actual presigned POST data here
+        # With object storage the client POSTs the file straight to the bucket;
+        # otherwise it uploads through the upload-direct endpoint
+        presigned_post = generate_presigned_upload(
+            upload_request.storage_key,
+            upload_request.mime_type,
+            upload_request.file_size,
+            checksum_sha256=upload_request.checksum_sha256,
+            expires_in=int((upload_request.expires_at - timezone.now()).total_seconds()),
+        )
+        if presigned_post:
+            upload_url = presigned_post['url']
+            fields = presigned_post['fields']
+        else:
+            upload_url = request.build_absolute_uri(
+                reverse('files:upload-direct', args=[upload_request.upload_token])
+            )
+            fields = {}
         
         response_data = {
             'upload_token': upload_request.upload_token,
-            'upload_url': f'/api/files/upload-complete/',  # Endpoint to complete upload
+            'upload_url': upload_url,
+            'upload_method': 'POST',
             'expires_at': upload_request.expires_at,
-            'fields': {
-                'upload_token': upload_request.upload_token,
-            }
+            'fields': fields,
         }
         
         response_serializer = PresignedUploadResponseSerializer(response_data)
@@ -222,6 +310,44 @@ class PresignedUploadView(generics.CreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 
+def upload_error_response(code, message, http_status=status.HTTP_400_BAD_REQUEST, details=None):
+    error = {'code': code, 'message': message}
+    if details is not None:
+        error['details'] = details
+    return Response({'status': 'error', 'error': error}, status=http_status)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def upload_direct(request, upload_token):
+    """Receive the file body for an upload request when storage can't accept direct uploads"""
+    try:
+        upload_request = FileUploadRequest.objects.get(
+            upload_token=upload_token,
+            uploaded_by=request.user
+        )
+    except FileUploadRequest.DoesNotExist:
+        return upload_error_response('TOKEN_NOT_FOUND', 'Upload token not found', status.HTTP_404_NOT_FOUND)
+    
+    if not upload_request.is_valid:
+        return upload_error_response('INVALID_TOKEN', 'Upload token is invalid or expired')
+    
+    uploaded_file = request.FILES.get('file')
+    if not uploaded_file:
+        return upload_error_response('VALIDATION_ERROR', 'No file was uploaded')
+    if uploaded_file.size != upload_request.file_size:
+        return upload_error_response('SIZE_MISMATCH', 'Uploaded file size does not match the upload request')
+    
+    # The storage may pick a different name if the key is taken
+    upload_request.storage_key = default_storage.save(upload_request.storage_key, uploaded_file)
+    upload_request.save(update_fields=['storage_key'])
+    
+    return Response({
+        'status': 'success',
+        'message': 'File received'
+    }, status=status.HTTP_201_CREATED)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def upload_complete(request):
@@ -229,85 +355,104 @@ def upload_complete(request):
     serializer = FileUploadCompleteSerializer(data=request.data)
     
     if not serializer.is_valid():
-        return Response({
-            'status': 'error',
-            'error': {
-                'code': 'VALIDATION_ERROR',
-                'message': 'Invalid upload completion data',
-                'details': serializer.errors
-            }
-        }, status=status.HTTP_400_BAD_REQUEST)
+        return upload_error_response(
+            'VALIDATION_ERROR', 'Invalid upload completion data', details=serializer.errors
+        )
     
     try:
-        upload_token = serializer.validated_data['upload_token']
-        file_data = serializer.validated_data['file_data']
-        
-        # Get upload request
         upload_request = FileUploadRequest.objects.get(
-            upload_token=upload_token,
+            upload_token=serializer.validated_data['upload_token'],
             uploaded_by=request.user
         )
-        
-        if not upload_request.is_valid:
-            return Response({
-                'status': 'error',
-                'error': {
-                    'code': 'INVALID_TOKEN',
-                    'message': 'Upload token is invalid or expired'
-                }
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Mark upload request as used
-        upload_request.is_used = True
-        
-        # Create file record (in a real implementation, you'd have the actual file)
-        # This is a simplified version - in production, you'd move the uploaded file
-        # to its final location and create the File record
-        
-        file_serializer = FileCreateSerializer(data=file_data, context={'request': request})
-        if file_serializer.is_valid():
-            file_obj = file_serializer.save()
-            upload_request.resulting_file = file_obj
-            upload_request.save()
-            
-            return Response({
-                'status': 'success',
-                'data': FileDetailSerializer(file_obj).data
-            }, status=status.HTTP_201_CREATED)
-        else:
-            return Response({
-                'status': 'error',
-                'error': {
-                    'code': 'FILE_VALIDATION_ERROR',
-                    'message': 'Invalid file data',
-                    'details': file_serializer.errors
-                }
-            }, status=status.HTTP_400_BAD_REQUEST)
-            
     except FileUploadRequest.DoesNotExist:
-        return Response({
-            'status': 'error',
-            'error': {
-                'code': 'TOKEN_NOT_FOUND',
-                'message': 'Upload token not found'
-            }
-        }, status=status.HTTP_404_NOT_FOUND)
+        return upload_error_response('TOKEN_NOT_FOUND', 'Upload token not found', status.HTTP_404_NOT_FOUND)
+    
+    if not upload_request.is_valid:
+        return upload_error_response('INVALID_TOKEN', 'Upload token is invalid or expired')
+    
+    metadata_serializer = FileUploadMetadataSerializer(data=serializer.validated_data['file_data'])
+    if not metadata_serializer.is_valid():
+        return upload_error_response(
+            'FILE_VALIDATION_ERROR', 'Invalid file data', details=metadata_serializer.errors
+        )
+    
+    storage_key = upload_request.storage_key
+    try:
+        stored = stat_object(storage_key)
+    except FileNotFoundError:
+        return upload_error_response('UPLOAD_NOT_FOUND', 'The file has not been uploaded yet')
+    
+    # Only size and hash are verified; the bytes never pass through Django
+    if stored['size'] != upload_request.file_size:
+        delete_files([storage_key])
+        return upload_error_response('SIZE_MISMATCH', 'Uploaded file size does not match the upload request')
+    
+    if upload_request.checksum_sha256:
+        checksum = stored['checksum_sha256'] or compute_sha256(storage_key)
+        if checksum != upload_request.checksum_sha256:
+            delete_files([storage_key])
+            return upload_error_response('CHECKSUM_MISMATCH', 'Uploaded file does not match the declared SHA-256')
+    
+    file_obj = File(
+        file=storage_key,
+        original_filename=upload_request.original_filename,
+        file_size=stored['size'],
+        uploaded_by=request.user,
+        **metadata_serializer.validated_data
+    )
+    head = read_head(storage_key, SNIFF_SIZE)
+    file_obj.sniffed_content_type = sniff_mime_type(head)
+    try:
+        file_obj.clean()
+        # Direct uploads are already stored (and never downscaled), so read
+        # image dimensions through ranged reads of the stored object
+        if file_obj.is_raster_image():
+            validate_stored_image_dimensions(
+                lambda length: read_head(storage_key, length), stored['size'], head
+            )
+    except DjangoValidationError as e:
+        delete_files([storage_key])
+        return upload_error_response('FILE_VALIDATION_ERROR', 'Invalid file', details=e.messages)
+    
+    with transaction.atomic():
+        # A concurrent completion of the same request may have won while we checked the object
+        upload_request = FileUploadRequest.objects.select_for_update().get(pk=upload_request.pk)
+        if upload_request.is_used:
+            return upload_error_response('INVALID_TOKEN', 'Upload token is invalid or expired')
+        # The quota was checked at presign time, but other uploads may have completed since
+        quota_response = quota_exceeded_response(request.user, stored['size'], lock=True)
+        if quota_response:
+            delete_files([storage_key])
+            return quota_response
+        file_obj.save()
+        upload_request.is_used = True
+        upload_request.resulting_file = file_obj
+        upload_request.save(update_fields=['is_used', 'resulting_file'])
+    
+    return Response({
+        'status': 'success',
+        'data': FileDetailSerializer(file_obj, context={'request': request}).data
+    }, status=status.HTTP_201_CREATED)
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAdminUser])
 def file_stats(request):
     """Get file statistics for admin dashboard"""
-    total_files = File.objects.count()
-    total_size = File.objects.aggregate(total_size=models.Sum('file_size'))['total_size'] or 0
+    # Totals come from the storage usage ledger rather than scanning File
+    category_counts = {category_value: 0 for category_value, category_label in File.FILE_CATEGORIES}
+    total_files = 0
+    total_size = 0
+    for row in StorageUsage.objects.values('category').annotate(
+        files=models.Sum('file_count'), size=models.Sum('total_size')
+    ):
+        category_counts[row['category']] = row['files']
+        total_files += row['files']
+        total_size += row['size']
+    
     public_files = File.objects.filter(is_public=True).count()
     unapproved_files = File.objects.filter(is_approved=False).count()
     
-    # Files by category
-    category_counts = {}
-    for category_value, category_label in File.FILE_CATEGORIES:
-        category_counts[category_value] = File.objects.filter(category=category_value).count()
-    
     # Recent uploads (last 7 days)
     seven_days_ago = timezone.now() - timedelta(days=7)
     recent_uploads = File.objects.filter(created_at__gte=seven_days_ago).count()
@@ -329,4 +474,110 @@ def file_stats(request):
             'category_breakdown': category_counts,
             'top_downloaded': list(top_downloaded),
         }
-    })
\ No newline at end of file
+    })
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def download_archive(request):
+    """Stream a ZIP archive of the selected files"""
+    if request.method == 'GET':
+        params = {
+            'ids': request.query_params.getlist('id'),
+            'tag': request.query_params.getlist('tag'),
+        }
+        if request.query_params.get('category'):
+            params['category'] = request.query_params['category']
+    else:
+        params = request.data
+    
+    serializer = FileArchiveRequestSerializer(data=params)
+    if not serializer.is_valid():
+        return Response({
+            'status': 'error',
+            'error': {
+                'code': 'VALIDATION_ERROR',
+                'message': 'Invalid archive request',
+                'details': serializer.errors
+            }
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    user = request.user
+    queryset = get_visible_files(user)
+    
+    ids = serializer.validated_data.get('ids')
+    if ids:
+        queryset = queryset.filter(pk__in=ids)
+    queryset = filter_by_tags(queryset, serializer.validated_data.get('tag', []))
+    if serializer.validated_data.get('category'):
+        queryset = queryset.filter(category=serializer.validated_data['category'])
+    
+    max_files = settings.FILE_ARCHIVE_MAX_FILES
+    files = [
+        file_obj for file_obj in queryset.only(
+            'id', 'file', 'original_filename', 'category', 'mime_type',
+            'is_public', 'uploaded_by_id', 'created_at'
+        ).order_by('original_filename')[:max_files + 1]
+        if file_obj.can_access(user)
+    ]
+    
+    if not files:
+        return Response({
+            'status': 'error',
+            'error': {
+                'code': 'NOT_FOUND',
+                'message': 'No accessible files match this request.'
+            }
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    if len(files) > max_files:
+        return Response({
+            'status': 'error',
+            'error': {
+                'code': 'TOO_MANY_FILES',
+                'message': f'An archive can contain at most {max_files} files.'
+            }
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    File.objects.filter(pk__in=[file_obj.pk for file_obj in files]).update(
+        download_count=models.F('download_count') + 1,
+        last_downloaded_at=timezone.now()
+    )
+    
+    response = StreamingHttpResponse(stream_zip(files), content_type='application/zip')
+    filename = f"files-{timezone.now().strftime('%Y%m%d-%H%M%S')}.zip"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def file_tags(request):
+    """Get tag usage counts across the files visible to the user"""
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 100)), 1000))
+    except ValueError:
+        limit = 100
+    
+    queryset = get_visible_files(request.user)
+    if request.query_params.get('category'):
+        queryset = queryset.filter(category=request.query_params['category'])
+    
+    # Unnest the tag arrays and count them in a single aggregate
+    inner_sql, params = queryset.order_by().values('tags').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT tag, COUNT(*) AS count
+            FROM ({inner_sql}) AS f
+            CROSS JOIN LATERAL jsonb_array_elements_text(f.tags) AS tag
+            WHERE jsonb_typeof(f.tags) = 'array'
+            GROUP BY tag
+            ORDER BY count DESC, tag
+            LIMIT %s
+        """, [*params, limit])
+        tags = [{'tag': tag, 'count': count} for tag, count in cursor.fetchall()]
+    
+    return Response({
+        'status': 'success',
+        'data': tags
+    })
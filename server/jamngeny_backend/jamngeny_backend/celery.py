@@ -0,0 +1,20 @@
+"""
+Celery application for jamngeny_backend.
+
+Start a worker with `celery -A jamngeny_backend worker` and the periodic
+scheduler with `celery -A jamngeny_backend beat`.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jamngeny_backend.settings')
+
+app = Celery('jamngeny_backend')
+
+# Read CELERY_* settings from Django settings
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Load tasks.py from all installed apps
+app.autodiscover_tasks()
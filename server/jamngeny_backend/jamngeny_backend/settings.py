@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.middleware.QueryProfileMiddleware',
+    'utils.middleware.PrometheusMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -52,6 +54,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.middleware.AuditContextMiddleware',
+    'utils.middleware.APIRequestLogMiddleware',
 ]
 
 ROOT_URLCONF = 'jamngeny_backend.urls'
@@ -118,6 +122,55 @@ BASE_URL = config('BASE_URL', default='https://api.robertjamngeny.com')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# File storage: 'local' keeps media under MEDIA_ROOT, 's3' uses an S3-compatible
+# bucket (AWS, MinIO, ...) so app servers share no disk and clients upload
+# directly with presigned POSTs. The bucket needs a CORS rule allowing POST
+# from the frontend origins.
+FILE_STORAGE_BACKEND = config('FILE_STORAGE_BACKEND', default='local')
+
+if FILE_STORAGE_BACKEND == 's3':
+    STORAGES = {
+        'default': {
+            'BACKEND': 'storages.backends.s3.S3Storage',
+        },
+        'staticfiles': {
+            'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+        },
+    }
+    AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME')
+    AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default=None)
+    AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default=None)
+    AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME', default=None)
+    # Set for MinIO or other S3-compatible services, e.g. http://localhost:9000
+    AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)
+    AWS_S3_SIGNATURE_VERSION = 's3v4'
+    AWS_S3_FILE_OVERWRITE = False
+    AWS_DEFAULT_ACL = None
+    AWS_QUERYSTRING_AUTH = True
+    AWS_QUERYSTRING_EXPIRE = config('AWS_QUERYSTRING_EXPIRE', default=3600, cast=int)
+
+# File uploads (handlers sniff the real content type while streaming)
+FILE_UPLOAD_HANDLERS = [
+    'files.uploadhandlers.SniffingMemoryFileUploadHandler',
+    'files.uploadhandlers.SniffingTemporaryFileUploadHandler',
+]
+
+# Image uploads: limits are checked from the image header before decoding,
+# and larger images are downscaled to IMAGE_DOWNSCALE_DIMENSION before storage
+IMAGE_MAX_DIMENSION = config('IMAGE_MAX_DIMENSION', default=12000, cast=int)
+IMAGE_MAX_PIXELS = config('IMAGE_MAX_PIXELS', default=50_000_000, cast=int)
+IMAGE_DOWNSCALE_DIMENSION = config('IMAGE_DOWNSCALE_DIMENSION', default=4096, cast=int)
+
+# Email (point EMAIL_HOST/EMAIL_PORT at a local SMTP stand-in for development)
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@robertjamngeny.com')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -135,6 +188,10 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Limit is read from SystemSetting.api_rate_limit
+    'DEFAULT_THROTTLE_CLASSES': (
+        'utils.ratelimit.APIRateThrottle',
+    ),
 }
 
 # JWT Configuration
@@ -165,6 +222,161 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
 }
 
+# Celery
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    'extract-file-metadata': {
+        'task': 'files.tasks.extract_pending_file_metadata',
+        'schedule': 60.0,
+    },
+    'gc-files': {
+        'task': 'files.tasks.gc_files',
+        'schedule': 6 * 60 * 60.0,
+    },
+    # Catch contact emails whose task was never queued or ran out of retries
+    'dispatch-contact-emails': {
+        'task': 'contact.tasks.dispatch_contact_emails',
+        'schedule': 15 * 60.0,
+    },
+    'train-spam-filter': {
+        'task': 'contact.tasks.train_spam_filter_incrementally',
+        'schedule': 10 * 60.0,
+    },
+    'prune-duplicate-fingerprints': {
+        'task': 'contact.tasks.prune_duplicate_fingerprints',
+        'schedule': 60 * 60.0,
+    },
+    'drain-contact-submissions': {
+        'task': 'contact.tasks.drain_contact_submissions',
+        'schedule': 5.0,
+    },
+    'rollup-api-requests': {
+        'task': 'utils.tasks.rollup_api_request_logs',
+        'schedule': 60.0,
+    },
+    'prune-api-rollups': {
+        'task': 'utils.tasks.prune_api_rollups',
+        'schedule': 60 * 60.0,
+    },
+    'maintain-log-partitions': {
+        'task': 'utils.tasks.maintain_log_partitions',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'archive-contact-messages': {
+        'task': 'contact.tasks.archive_old_contact_messages',
+        'schedule': 24 * 60 * 60.0,
+    },
+}
+
+# Contact messages scoring at or above this spam probability are filed as spam
+CONTACT_SPAM_THRESHOLD = config('CONTACT_SPAM_THRESHOLD', default=0.95, cast=float)
+
+# Contact messages at least this similar (estimated Jaccard over words) to one
+# received in the window are folded into it instead of being stored
+CONTACT_DUPLICATE_WINDOW_HOURS = config('CONTACT_DUPLICATE_WINDOW_HOURS', default=24, cast=int)
+CONTACT_DUPLICATE_SIMILARITY = config('CONTACT_DUPLICATE_SIMILARITY', default=0.7, cast=float)
+
+# Rows fetched per round trip (and written per chunk) by ?format=csv|ndjson exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Accept contact form submissions into a Redis stream (answering 202) and
+# save them in batches from the drain-contact-submissions task
+CONTACT_WRITE_BEHIND = config('CONTACT_WRITE_BEHIND', default=False, cast=bool)
+CONTACT_INGEST_REDIS_URL = config('CONTACT_INGEST_REDIS_URL', default=CELERY_BROKER_URL)
+
+# Days a contact message may stay in each status (since its last update)
+# before the retention job moves it to the archive table
+CONTACT_RETENTION_DAYS = {
+    'archived': config('CONTACT_ARCHIVED_RETENTION_DAYS', default=180, cast=int),
+    'spam': config('CONTACT_SPAM_RETENTION_DAYS', default=30, cast=int),
+}
+
+# Most contact messages a single bulk update may change
+CONTACT_BULK_UPDATE_LIMIT = config('CONTACT_BULK_UPDATE_LIMIT', default=5000, cast=int)
+
+# Shared cache. Settings singletons are invalidated across workers through it,
+# so set CACHE_URL (e.g. redis://localhost:6379/1) when running several workers.
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+
+# API request logging. Rows are queued in memory and written in batches by a
+# background thread; errors and requests slower than API_REQUEST_LOG_SLOW_MS
+# are always logged, the rest at API_REQUEST_LOG_SAMPLE_RATE and weighted
+# back up in the analytics rollups.
+API_REQUEST_LOG_ENABLED = config('API_REQUEST_LOG_ENABLED', default=True, cast=bool)
+API_REQUEST_LOG_PATH_PREFIXES = ['/api/']
+API_REQUEST_LOG_SAMPLE_RATE = config('API_REQUEST_LOG_SAMPLE_RATE', default=1.0, cast=float)
+API_REQUEST_LOG_SLOW_MS = config('API_REQUEST_LOG_SLOW_MS', default=1000, cast=int)
+API_REQUEST_LOG_QUEUE_SIZE = config('API_REQUEST_LOG_QUEUE_SIZE', default=10000, cast=int)
+API_REQUEST_LOG_BATCH_SIZE = config('API_REQUEST_LOG_BATCH_SIZE', default=500, cast=int)
+API_REQUEST_LOG_FLUSH_INTERVAL_MS = config('API_REQUEST_LOG_FLUSH_INTERVAL_MS', default=500, cast=int)
+
+# API analytics are read from minute and hour rollups of the request log,
+# filled every minute by the rollup-api-requests task
+API_ROLLUP_BACKFILL_DAYS = config('API_ROLLUP_BACKFILL_DAYS', default=30, cast=int)
+API_ROLLUP_MINUTE_RETENTION_HOURS = config('API_ROLLUP_MINUTE_RETENTION_HOURS', default=48, cast=int)
+API_ROLLUP_HOUR_RETENTION_DAYS = config('API_ROLLUP_HOUR_RETENTION_DAYS', default=400, cast=int)
+API_ANALYTICS_CACHE_SECONDS = config('API_ANALYTICS_CACHE_SECONDS', default=60, cast=int)
+
+# Prometheus metrics served at /metrics. With several worker processes, set
+# PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers so a
+# scrape sees all of them. /metrics requires the METRICS_TOKEN bearer token;
+# without one it is only served with DEBUG on. When METRICS_ALLOWED_IPS is
+# not empty, the connecting address (REMOTE_ADDR, not X-Forwarded-For) must
+# also be listed.
+PROMETHEUS_MULTIPROC_DIR = config('PROMETHEUS_MULTIPROC_DIR', default='')
+if PROMETHEUS_MULTIPROC_DIR:
+    # prometheus_client reads this when it's imported
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', PROMETHEUS_MULTIPROC_DIR)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])
+
+# Per-request SQL profiling. Every request's queries are counted and timed;
+# requests over the query count or database time thresholds are logged, and
+# with SQL_PROFILE_SERVER_TIMING staff responses carry a Server-Timing header.
+# SQL_PROFILE_SAMPLE_RATE of requests also log statements run SQL_PROFILE_REPEAT_THRESHOLD times or more (N+1).
+SQL_PROFILE_SAMPLE_RATE = config('SQL_PROFILE_SAMPLE_RATE', default=0.05, cast=float)
+SQL_PROFILE_SERVER_TIMING = config('SQL_PROFILE_SERVER_TIMING', default=False, cast=bool)
+SQL_PROFILE_QUERY_COUNT_THRESHOLD = config('SQL_PROFILE_QUERY_COUNT_THRESHOLD', default=50, cast=int)
+SQL_PROFILE_DB_MS_THRESHOLD = config('SQL_PROFILE_DB_MS_THRESHOLD', default=500, cast=int)
+SQL_PROFILE_REPEAT_THRESHOLD = config('SQL_PROFILE_REPEAT_THRESHOLD', default=5, cast=int)
+
+# Log tables are partitioned by month on PostgreSQL. The daily
+# maintain-log-partitions task (or manage_log_partitions) creates partitions this many months ahead and drops, or with
+# LOG_PARTITION_DETACH_EXPIRED detaches, months older than the retention.
+LOG_PARTITION_PREMAKE_MONTHS = config('LOG_PARTITION_PREMAKE_MONTHS', default=3, cast=int)
+LOG_PARTITION_DETACH_EXPIRED = config('LOG_PARTITION_DETACH_EXPIRED', default=False, cast=bool)
+LOG_PARTITION_RETENTION_MONTHS = {
+    'utils.APIRequestLog': config('API_REQUEST_LOG_RETENTION_MONTHS', default=3, cast=int),
+    'utils.AuditLog': config('AUDIT_LOG_RETENTION_MONTHS', default=24, cast=int),
+    'utils.HealthCheck': config('HEALTH_CHECK_RETENTION_MONTHS', default=1, cast=int),
+}
+
+# Shared rate limit counters; when empty or unreachable each process counts on its own
+RATE_LIMIT_REDIS_URL = config('RATE_LIMIT_REDIS_URL', default=CELERY_BROKER_URL)
+
+# Per-user storage quota in bytes (admins are exempt)
+FILE_STORAGE_QUOTA = config('FILE_STORAGE_QUOTA', default=2 * 1024 ** 3, cast=int)
+
+# Used upload requests are kept this long for auditing before gc_files removes them
+FILE_UPLOAD_REQUEST_RETENTION_DAYS = config('FILE_UPLOAD_REQUEST_RETENTION_DAYS', default=30, cast=int)
+
+# Maximum number of files in one streamed ZIP download
+FILE_ARCHIVE_MAX_FILES = config('FILE_ARCHIVE_MAX_FILES', default=1000, cast=int)
+
+# File metadata extraction
+FILE_METADATA_BATCH_SIZE = config('FILE_METADATA_BATCH_SIZE', default=100, cast=int)
+# Seconds a pool worker may spend on one file before it's recorded as failed
+FILE_METADATA_TIMEOUT = config('FILE_METADATA_TIMEOUT', default=60, cast=int)
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -4,6 +4,8 @@ from django.http import HttpResponse
 from django.views.generic import RedirectView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from utils.metrics import metrics_view
+
 urlpatterns = [
     # Root URL redirect to API docs
     path('', RedirectView.as_view(url='/api/docs/', permanent=False)),
@@ -23,6 +25,9 @@ urlpatterns = [
     
     # Health check
     path('healthz/', lambda request: HttpResponse('OK'), name='health-check'),
+
+    # Prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Serve media files in development
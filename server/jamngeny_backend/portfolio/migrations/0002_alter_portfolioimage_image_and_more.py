@@ -0,0 +1,24 @@
+# Generated by Django 4.2.26 on 2026-10-19 06:59
+
+from django.db import migrations, models
+import utils.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='portfolioimage',
+            name='image',
+            field=models.ImageField(upload_to='portfolio/images/', validators=[utils.images.validate_image_dimensions]),
+        ),
+        migrations.AlterField(
+            model_name='portfolioitem',
+            name='featured_image',
+            field=models.ImageField(blank=True, null=True, upload_to='portfolio/featured/', validators=[utils.images.validate_image_dimensions]),
+        ),
+    ]
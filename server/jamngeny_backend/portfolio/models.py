@@ -5,6 +5,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 from django.utils import timezone
+from utils.images import validate_image_dimensions, downscale_image_field
 
 User = get_user_model()
 
@@ -68,7 +69,10 @@ class PortfolioItem(models.Model):
     sanitized_content = models.TextField(editable=False, blank=True)
     
     # Media & Links
-    featured_image = models.ImageField(upload_to='portfolio/featured/', null=True, blank=True)
+    featured_image = models.ImageField(
+        upload_to='portfolio/featured/', null=True, blank=True,
+        validators=[validate_image_dimensions]
+    )
     link = models.URLField(blank=True, help_text="External link to project/demo")
     client = models.CharField(max_length=200, blank=True, help_text="Client name (if applicable)")
     
@@ -152,6 +156,9 @@ class PortfolioItem(models.Model):
             except json.JSONDecodeError:
                 self.technologies = [tech.strip() for tech in self.technologies.split(',')]
         
+        # Shrink oversized uploads before they are written to storage
+        downscale_image_field(self.featured_image)
+        
         super().save(*args, **kwargs)
 
     @property
@@ -183,7 +190,7 @@ class PortfolioImage(models.Model):
         on_delete=models.CASCADE, 
         related_name='images'
     )
-    image = models.ImageField(upload_to='portfolio/images/')
+    image = models.ImageField(upload_to='portfolio/images/', validators=[validate_image_dimensions])
     caption = models.CharField(max_length=200, blank=True)
     alt_text = models.CharField(max_length=200, blank=True, help_text="Alternative text for accessibility")
     order = models.PositiveIntegerField(default=0, help_text="Display order")
@@ -204,4 +211,6 @@ class PortfolioImage(models.Model):
                 portfolio_item=self.portfolio_item, 
                 is_featured=True
             ).update(is_featured=False)
+        # Shrink oversized uploads before they are written to storage
+        downscale_image_field(self.image)
         super().save(*args, **kwargs)
\ No newline at end of file
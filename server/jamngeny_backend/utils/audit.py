@@ -0,0 +1,180 @@
+"""
+Automatic audit logging of model changes.
+
+Audited models keep a snapshot of their field values from when they were
+loaded (post_init), so an update is diffed against the snapshot instead of
+a fresh SELECT. Each create, update and delete event is released with
+transaction.on_commit, so events from a rolled-back transaction or
+savepoint are discarded with it. Released events are collected for the
+rest of the request (or an audit_batch() block) and written with one
+bulk_create at its end; outside of one they are written straight away.
+The acting user, IP, user agent and session come from the request being
+served, which AuditContextMiddleware makes available.
+"""
+
+import contextvars
+import copy
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+
+# Model label -> AuditLog entity
+AUDITED_MODELS = {
+    'blog.Article': 'article',
+    'portfolio.PortfolioItem': 'portfolio',
+    'content.Service': 'service',
+    'files.File': 'file',
+    'contact.ContactMessage': 'contact_message',
+    'accounts.User': 'user',
+}
+
+# Derived or bookkeeping fields whose changes aren't worth an audit entry
+IGNORED_FIELDS = {'updated_at', 'last_login', 'search_vector', 'fingerprint', 'spam_trained_as'}
+# Recorded as changed, without the values
+MASKED_FIELDS = {'password'}
+MASK = '********'
+
+JSON_TYPES = (str, int, float, bool, type(None))
+
+current_request = contextvars.ContextVar('audit_request', default=None)
+# Committed entries waiting for the end of the current audit_batch()
+_batch = contextvars.ContextVar('audit_batch', default=None)
+
+
+def _audited_fields(model):
+    fields = getattr(model, '_audit_fields', None)
+    if fields is None:
+        fields = [
+            field.attname for field in model._meta.concrete_fields
+            if field.name not in IGNORED_FIELDS and field.get_internal_type() != 'BinaryField'
+        ]
+        model._audit_fields = fields
+    return fields
+
+
+def _snapshot(instance):
+    values = instance.__dict__
+    return {
+        attname: copy.deepcopy(values[attname]) if isinstance(values[attname], (dict, list)) else values[attname]
+        for attname in _audited_fields(type(instance)) if attname in values
+    }
+
+
+def _json_value(attname, value):
+    if attname in MASKED_FIELDS:
+        return MASK
+    if isinstance(value, JSON_TYPES + (dict, list)):
+        return value
+    return str(value)
+
+
+def diff(instance):
+    """Fields changed since the instance was loaded, as {attname: [old, new]}"""
+    snapshot = getattr(instance, '_audit_snapshot', None) or {}
+    values = instance.__dict__
+    return {
+        attname: [_json_value(attname, old), _json_value(attname, values[attname])]
+        for attname, old in snapshot.items()
+        if attname in values and values[attname] != old
+    }
+
+
+def _request_fields():
+    request = current_request.get()
+    if request is None:
+        return {}
+    from .models import APIRequestLog
+
+    # Read at commit time, after DRF has authenticated the request
+    user = getattr(request, 'user', None)
+    session = getattr(request, 'session', None)
+    return {
+        'performed_by': user if user is not None and user.is_authenticated else None,
+        'user_ip': APIRequestLog.get_client_ip(request),
+        'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+        'session_key': (session.session_key if session is not None else None) or '',
+    }
+
+
+def write_entries(entries):
+    """Save audit entries (AuditLog field values) with the current request's details"""
+    from .models import AuditLog
+
+    request_fields = _request_fields()
+    logs = []
+    for entry in entries:
+        log = AuditLog(**entry, **request_fields)
+        # bulk_create skips save(), which fills this in
+        log.description = log.generate_description()
+        logs.append(log)
+    AuditLog.objects.bulk_create(logs, batch_size=500)
+
+
+@contextmanager
+def audit_batch():
+    """Collect the audit entries committed inside the block and write them together at its end"""
+    if _batch.get() is not None:
+        # Already collecting; the outer block writes
+        yield
+        return
+    entries = []
+    token = _batch.set(entries)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+        if entries:
+            write_entries(entries)
+
+
+def _committed(entry):
+    entries = _batch.get()
+    if entries is None:
+        write_entries([entry])
+    else:
+        entries.append(entry)
+
+
+def record(action, instance, changes=None):
+    entry = {
+        'action': action,
+        'entity': AUDITED_MODELS[instance._meta.label],
+        'entity_id': str(instance.pk),
+        'changes': changes or {},
+    }
+    # Runs now in autocommit mode; otherwise once the change is committed, and
+    # never if the transaction or savepoint it was made in rolls back
+    transaction.on_commit(lambda: _committed(entry))
+
+
+def _on_init(sender, instance, **kwargs):
+    instance._audit_snapshot = _snapshot(instance)
+
+
+def _on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        record('create', instance)
+    else:
+        changes = diff(instance)
+        if not changes:
+            return
+        record('update', instance, changes)
+    instance._audit_snapshot = _snapshot(instance)
+
+
+def _on_delete(sender, instance, **kwargs):
+    record('delete', instance)
+
+
+def connect_audit_signals():
+    """Start auditing AUDITED_MODELS; called once the app registry is ready"""
+    for label in AUDITED_MODELS:
+        model = apps.get_model(label)
+        uid = f'audit:{label}'
+        post_init.connect(_on_init, sender=model, weak=False, dispatch_uid=f'{uid}:init')
+        post_save.connect(_on_save, sender=model, weak=False, dispatch_uid=f'{uid}:save')
+        post_delete.connect(_on_delete, sender=model, weak=False, dispatch_uid=f'{uid}:delete')
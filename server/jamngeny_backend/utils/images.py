@@ -0,0 +1,146 @@
+"""
+Upload-time image safety checks.
+
+Dimensions are read from the image header via Pillow's lazy open, so a
+decompression bomb is rejected before any pixel data is decoded. Images
+that are acceptable but larger than IMAGE_DOWNSCALE_DIMENSION are shrunk
+before they reach storage, which keeps later processing (thumbnails,
+metadata, previews) at a predictable memory cost.
+"""
+
+import os
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+
+# Formats that can be re-encoded without losing anything beyond resolution
+DOWNSCALE_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+# How far into a stored image its dimensions are looked for
+HEADER_READ_LIMIT = 4 * 1024 * 1024
+
+
+def _read_header(file_obj):
+    """Open an image lazily and return (format, (width, height), frame_count), or None if not an image"""
+    from PIL import Image, UnidentifiedImageError
+
+    position = file_obj.tell() if hasattr(file_obj, 'tell') else 0
+    file_obj.seek(0)
+    try:
+        with warnings.catch_warnings():
+            # Limits are enforced below with a proper validation message
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            try:
+                with Image.open(file_obj) as image:
+                    return image.format, image.size, getattr(image, 'n_frames', 1)
+            except Image.DecompressionBombError:
+                raise ValidationError("Image has too many pixels to be processed safely.")
+            except (UnidentifiedImageError, OSError):
+                return None
+    finally:
+        file_obj.seek(position)
+
+
+def _check_dimensions(width, height):
+    max_dimension = settings.IMAGE_MAX_DIMENSION
+    if width > max_dimension or height > max_dimension:
+        raise ValidationError(
+            f"Image is {width}x{height}; neither side may exceed {max_dimension} pixels."
+        )
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            f"Image is {width}x{height} ({width * height} pixels); "
+            f"the maximum is {settings.IMAGE_MAX_PIXELS} pixels."
+        )
+
+
+def validate_image_dimensions(value):
+    """Reject images whose declared dimensions exceed IMAGE_MAX_DIMENSION or IMAGE_MAX_PIXELS"""
+    if not value:
+        return
+    # Files already in storage were checked on upload; opening them would download them again
+    if getattr(value, '_committed', False):
+        return
+    header = _read_header(value)
+    if header is None:
+        # Not something Pillow recognizes; format validation happens elsewhere
+        return
+    _, (width, height), _ = header
+    _check_dimensions(width, height)
+
+
+def validate_stored_image_dimensions(read_head, size, head=b''):
+    """
+    Like validate_image_dimensions, for an image only readable through
+    `read_head(length)` (its first `length` bytes, e.g. a ranged GET).
+    Reads progressively more until Pillow finds the dimensions (metadata
+    such as EXIF can push them well past the first few KB), and rejects
+    the image if they aren't within the first HEADER_READ_LIMIT bytes.
+    """
+    length = max(len(head), 8 * 1024)
+    while True:
+        header = _read_header(BytesIO(head)) if head else None
+        if header is not None:
+            break
+        if len(head) >= min(size, HEADER_READ_LIMIT):
+            raise ValidationError("Could not read the image dimensions.")
+        length = min(length * 8, size, HEADER_READ_LIMIT)
+        head = read_head(length)
+    _, (width, height), _ = header
+    _check_dimensions(width, height)
+
+
+def downscale_image(file_obj, max_dimension):
+    """
+    Shrink an image so its longest side is at most `max_dimension`.
+    Returns a new ContentFile in the same format, or None if the image is
+    already small enough or can't be re-encoded safely.
+    """
+    from PIL import Image
+
+    header = _read_header(file_obj)
+    if header is None:
+        return None
+    image_format, size, frame_count = header
+    if max(size) <= max_dimension or image_format not in DOWNSCALE_FORMATS or frame_count > 1:
+        return None
+
+    file_obj.seek(0)
+    with Image.open(file_obj) as image:
+        exif = image.info.get('exif')
+        # thumbnail() uses draft() first, so JPEGs are decoded at 1/2, 1/4 or
+        # 1/8 scale instead of allocating the full-resolution bitmap
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS, reducing_gap=3.0)
+        save_kwargs = {'format': image_format}
+        if image_format == 'JPEG':
+            save_kwargs.update(quality=90, optimize=True)
+        if exif:
+            save_kwargs['exif'] = exif
+        output = BytesIO()
+        image.save(output, **save_kwargs)
+    file_obj.seek(0)
+
+    return ContentFile(output.getvalue(), name=os.path.basename(file_obj.name or ''))
+
+
+def downscale_image_field(field_file, max_dimension=None):
+    """
+    Replace a pending (not yet stored) upload on a FieldFile with a
+    downscaled copy if it's larger than IMAGE_DOWNSCALE_DIMENSION.
+    Returns True if the image was replaced.
+    """
+    if not field_file or field_file._committed:
+        return False
+    uploaded = field_file.file
+    downscaled = downscale_image(uploaded, max_dimension or settings.IMAGE_DOWNSCALE_DIMENSION)
+    if downscaled is None:
+        return False
+    # Keep annotations made by upload handlers (e.g. the sniffed content type)
+    sniffed_type = getattr(uploaded, 'sniffed_content_type', None)
+    if sniffed_type:
+        downscaled.sniffed_content_type = sniffed_type
+    field_file.file = downscaled
+    return True
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from utils.partitions import maintain_partitions
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly log partitions and drop or detach expired ones (run daily)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int, default=None,
+            help="Months to create past the current one (default: LOG_PARTITION_PREMAKE_MONTHS)"
+        )
+        parser.add_argument(
+            '--detach', action='store_true', default=None,
+            help="Detach expired partitions instead of dropping them"
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would change without changing anything"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Log partitioning requires PostgreSQL")
+
+        results = maintain_partitions(
+            months_ahead=options['months_ahead'], detach=options['detach'], dry_run=options['dry_run']
+        )
+        for label, changes in results.items():
+            self.stdout.write(
+                f"{label}: created {', '.join(changes['created']) or 'none'}; "
+                f"removed {', '.join(changes['removed']) or 'none'}"
+            )
+        self.stdout.write(self.style.SUCCESS("Dry run complete" if options['dry_run'] else "Partitions up to date"))
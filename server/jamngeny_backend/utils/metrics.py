@@ -0,0 +1,133 @@
+"""
+Prometheus metrics.
+
+Metrics are kept in process by prometheus_client. When
+PROMETHEUS_MULTIPROC_DIR is set, each worker writes its values to
+mmap'd files in that directory, and /metrics merges every worker's files
+at scrape time, so a scrape sees the whole server rather than whichever
+worker answered. The directory must be emptied before the server starts,
+and the server should call mark_process_dead(pid) when a worker exits
+(gunicorn's child_exit hook) so that worker's live gauges are dropped.
+
+Updating a metric is an in-memory (or mmap) write. Labelled children
+are cached, so recording a request costs a few microseconds.
+"""
+
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent serving requests',
+    ['method', 'route', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Counter('db_queries_total', 'Database queries executed while serving requests', ['route'])
+DB_QUERY_TIME = Counter('db_query_seconds_total', 'Time spent in database queries while serving requests', ['route'])
+REPEATED_QUERY_REQUESTS = Counter(
+    'db_repeated_query_requests_total', 'Profiled requests that repeated a statement (likely N+1 queries)', ['route']
+)
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups', ['cache', 'result'])
+REQUEST_LOG_QUEUE = Gauge(
+    'api_request_log_queue_depth', 'API request logs waiting to be written',
+    multiprocess_mode='livesum',
+)
+REQUEST_LOG_DROPPED = Counter('api_request_log_dropped_total', 'API request logs dropped while the queue was full')
+
+# Requests that matched no URL pattern share one label value
+UNMATCHED_ROUTE = '<unmatched>'
+
+_request_children = {}
+_db_children = {}
+_cache_children = {}
+
+
+def record_request(method, route, status, seconds, query_count, query_seconds):
+    key = (method, route, status)
+    child = _request_children.get(key)
+    if child is None:
+        child = _request_children[key] = REQUEST_LATENCY.labels(method, route, str(status))
+    child.observe(seconds)
+
+    if query_count:
+        children = _db_children.get(route)
+        if children is None:
+            children = _db_children[route] = (DB_QUERIES.labels(route), DB_QUERY_TIME.labels(route))
+        children[0].inc(query_count)
+        children[1].inc(query_seconds)
+
+
+def record_cache(cache, hit):
+    """Count a lookup in one of our caches"""
+    key = (cache, hit)
+    child = _cache_children.get(key)
+    if child is None:
+        child = _cache_children[key] = CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss')
+    child.inc()
+
+
+class QueueDepthCollector:
+    """Queue lengths read from Redis at scrape time"""
+
+    def collect(self):
+        gauge = GaugeMetricFamily('queue_depth', 'Messages waiting in background queues', labels=['queue'])
+        try:
+            import redis
+            from contact.ingest import STREAM
+
+            client = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=0.25, socket_connect_timeout=0.25)
+            gauge.add_metric(['celery'], client.llen('celery'))
+            ingest = client if settings.CONTACT_INGEST_REDIS_URL == settings.CELERY_BROKER_URL else redis.Redis.from_url(
+                settings.CONTACT_INGEST_REDIS_URL, socket_timeout=0.25, socket_connect_timeout=0.25
+            )
+            gauge.add_metric(['contact_submissions'], ingest.xlen(STREAM))
+        except Exception:
+            # A scrape shouldn't fail because Redis is down; the series just go missing
+            pass
+        yield gauge
+
+
+def metrics_registry():
+    if settings.PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+    return registry
+
+
+_queue_collector = QueueDepthCollector()
+
+
+def metrics_view(request):
+    """Metrics in the Prometheus text format, for METRICS_TOKEN holders (or anyone allowed under DEBUG)"""
+    token = settings.METRICS_TOKEN
+    if token:
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(authorization, f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    # The connecting address; X-Forwarded-For is set by the client and can't be trusted here
+    allowed_ips = settings.METRICS_ALLOWED_IPS
+    if allowed_ips and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponseForbidden()
+
+    registry = metrics_registry()
+    output = generate_latest(registry)
+    # Queue depths are server-wide, so they're read once per scrape rather than per worker
+    queues = CollectorRegistry()
+    queues.register(_queue_collector)
+    output += generate_latest(queues)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """Drop the live gauges of an exited worker (call from the server's worker-exit hook)"""
+    if settings.PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,187 @@
+"""
+Request middleware.
+"""
+
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import metrics
+from .audit import audit_batch, current_request
+from .models import APIRequestLog
+from .query_profile import QueryProfile
+from .request_log import request_log_queue
+
+logger = logging.getLogger(__name__)
+
+
+def route_label(request):
+    match = request.resolver_match
+    return '/' + match.route if match else metrics.UNMATCHED_ROUTE
+
+
+def response_size(response):
+    """Body size in bytes, without consuming streaming responses"""
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    if getattr(response, 'streaming', False):
+        return 0
+    return len(response.content)
+
+
+class QueryProfileMiddleware:
+    """
+    Count and time each request's SQL queries (see utils.query_profile),
+    add a Server-Timing header for staff, and log requests over the SQL_PROFILE_*
+    thresholds. Statements are fingerprinted for repeats only on the
+    sampled requests. Later middleware reads the profile from
+    request.query_profile.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.SQL_PROFILE_SAMPLE_RATE
+        self.server_timing = settings.SQL_PROFILE_SERVER_TIMING
+        self.query_threshold = settings.SQL_PROFILE_QUERY_COUNT_THRESHOLD
+        self.time_threshold = settings.SQL_PROFILE_DB_MS_THRESHOLD / 1000
+        self.repeat_threshold = settings.SQL_PROFILE_REPEAT_THRESHOLD
+
+    def __call__(self, request):
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        profile = request.query_profile = QueryProfile(fingerprints=sampled)
+        started = time.perf_counter()
+        with connection.execute_wrapper(profile):
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        # Database timings reveal how a request was served, so only staff see them
+        user = getattr(request, 'user', None)
+        if self.server_timing and user is not None and user.is_staff:
+            timings = [f'db;dur={profile.seconds * 1000:.1f};desc="{profile.count} queries"']
+            render = getattr(request, '_render_seconds', None)
+            if render is not None:
+                timings.append(f'serialize;dur={render * 1000:.1f}')
+            timings.append(f'total;dur={total * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(timings)
+
+        repeated = profile.repeated(self.repeat_threshold) if sampled else []
+        if repeated:
+            metrics.REPEATED_QUERY_REQUESTS.labels(route_label(request)).inc()
+        if repeated or profile.count >= self.query_threshold or profile.seconds >= self.time_threshold:
+            logger.warning(
+                "%s %s ran %d queries in %.1fms (%.1fms total)%s",
+                request.method, request.path, profile.count, profile.seconds * 1000, total * 1000,
+                ''.join(f'\n  {count}x {sql[:500]}' for sql, count in repeated[:5]),
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that separately
+        rendering = time.perf_counter()
+
+        def rendered(response):
+            request._render_seconds = time.perf_counter() - rendering
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class PrometheusMetricsMiddleware:
+    """Record request latency, and the database work QueryProfileMiddleware counted, in the Prometheus metrics"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        profile = getattr(request, 'query_profile', None)
+        metrics.record_request(
+            request.method,
+            route_label(request),
+            response.status_code,
+            time.perf_counter() - started,
+            profile.count if profile else 0,
+            profile.seconds if profile else 0.0,
+        )
+        return response
+
+
+class APIRequestLogMiddleware:
+    """
+    Record API requests in APIRequestLog through the buffered request log
+    queue. Errors and slow responses are always kept; other requests are
+    sampled at API_REQUEST_LOG_SAMPLE_RATE and carry a sample_weight.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.API_REQUEST_LOG_ENABLED
+        self.prefixes = tuple(settings.API_REQUEST_LOG_PATH_PREFIXES)
+        self.sample_rate = settings.API_REQUEST_LOG_SAMPLE_RATE
+        self.slow_ms = settings.API_REQUEST_LOG_SLOW_MS
+
+    def __call__(self, request):
+        if not self.enabled or not request.path.startswith(self.prefixes):
+            return self.get_response(request)
+
+        requested_at = timezone.now()
+        started = time.perf_counter()
+        response = self.get_response(request)
+        response_time = (time.perf_counter() - started) * 1000
+
+        status_code = response.status_code
+        match = request.resolver_match
+        metadata = {'route': '/' + match.route} if match else {}
+        if status_code < 400 and response_time < self.slow_ms and self.sample_rate < 1:
+            if random.random() >= self.sample_rate:
+                return response
+            # Each sampled row stands in for the ones skipped; the rollups scale counts by it
+            metadata['sample_weight'] = 1 / self.sample_rate
+
+        # DRF authenticates in the view and sets the user on the Django request
+        user = getattr(request, 'user', None)
+        is_authenticated = bool(user and user.is_authenticated)
+        exception = getattr(request, '_api_log_exception', None)
+        request_log_queue.put({
+            'method': request.method,
+            'path': request.path[:500],
+            'query_params': dict(request.GET),
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'ip_address': APIRequestLog.get_client_ip(request),
+            'user_id': user.pk if is_authenticated else None,
+            'is_authenticated': is_authenticated,
+            'status_code': status_code,
+            'response_size': response_size(response),
+            'response_time': response_time,
+            'error_message': str(exception) if exception else '',
+            'exception_type': type(exception).__name__ if exception else '',
+            'metadata': metadata,
+            'requested_at': requested_at,
+        })
+        return response
+
+    def process_exception(self, request, exception):
+        request._api_log_exception = exception
+
+
+class AuditContextMiddleware:
+    """
+    Make the request available to audit entries recorded while it's served,
+    and write the entries committed during the request in one batch.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_request.set(request)
+        try:
+            with audit_batch():
+                return self.get_response(request)
+        finally:
+            current_request.reset(token)
@@ -0,0 +1,70 @@
+from django.db import migrations
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Keys of a JSON object column (payload parameters, changed field names)
+JSON_KEYS_SQL = (
+    "coalesce((SELECT string_agg(key, ' ') FROM jsonb_object_keys("
+    "CASE WHEN jsonb_typeof({value}) = 'object' THEN {value} ELSE jsonb_build_object() END"
+    ") AS key), '')"
+)
+
+SEARCH_VECTOR_SQL = f"""
+    setweight(to_tsvector('english', coalesce({{row}}.description, '')), 'A') ||
+    setweight(to_tsvector('english', {{row}}.action || ' ' || {{row}}.entity || ' ' || coalesce({{row}}.entity_id, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce({{row}}.error_message, '')), 'B') ||
+    setweight(to_tsvector('english', {JSON_KEYS_SQL.format(value='{row}.payload')} || ' ' || {JSON_KEYS_SQL.format(value='{row}.changes')}), 'C')
+"""
+
+CREATE_TRIGGER_SQL = f"""
+CREATE FUNCTION utils_auditlog_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR_SQL.format(row='NEW')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER utils_auditlog_search_vector_trigger
+BEFORE INSERT OR UPDATE OF description, action, entity, entity_id, error_message, payload, changes
+ON utils_auditlog
+FOR EACH ROW EXECUTE FUNCTION utils_auditlog_search_vector_update();
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS utils_auditlog_search_vector_trigger ON utils_auditlog;
+DROP FUNCTION IF EXISTS utils_auditlog_search_vector_update();
+"""
+
+
+def backfill_search_vectors(apps, schema_editor):
+    # Short batches so existing rows are never locked for long
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                f"""
+                UPDATE utils_auditlog AS a
+                SET search_vector = {SEARCH_VECTOR_SQL.format(row='a')}
+                WHERE a.id IN (
+                    SELECT id FROM utils_auditlog
+                    WHERE search_vector IS NULL
+                    LIMIT %s
+                )
+                """,
+                [BACKFILL_BATCH_SIZE],
+            )
+            if cursor.rowcount < BACKFILL_BATCH_SIZE:
+                break
+
+
+class Migration(migrations.Migration):
+    # Backfill in separate transactions
+    atomic = False
+
+    dependencies = [
+        ('utils', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER_SQL, DROP_TRIGGER_SQL),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,143 @@
+"""
+Convert the log tables to monthly range partitions on created_at.
+
+A partitioned table's primary key must include the partition key, so the
+key becomes (id, created_at); Django keeps treating id as the primary key.
+Indexes, foreign keys and triggers are recreated under their old names,
+and identity columns keep generating values after the copied rows.
+Existing rows are copied into the new table, one table per transaction.
+"""
+
+import datetime
+
+from django.db import migrations, transaction
+
+TABLES = ['utils_apirequestlog', 'utils_auditlog', 'utils_healthcheck']
+
+# Months created past the current one; manage_log_partitions keeps this topped up
+MONTHS_AHEAD = 3
+
+
+def _month(year, month):
+    return datetime.datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _table_objects(cursor, table):
+    """Definitions of the table's secondary indexes, foreign keys and user triggers"""
+    cursor.execute(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = %s AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'
+        )
+        """,
+        [table, table],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(
+        "SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal",
+        [table],
+    )
+    triggers = cursor.fetchall()
+    return indexes, foreign_keys, triggers
+
+
+def _reset_identity(cursor, table):
+    """Continue any identity column of the copied table after its highest value"""
+    cursor.execute(
+        "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attidentity != ''",
+        [table],
+    )
+    for (column,) in cursor.fetchall():
+        cursor.execute(
+            f'SELECT setval(pg_get_serial_sequence(%s, %s), coalesce(max("{column}"), 0) + 1, false) FROM "{table}"',
+            [table, column],
+        )
+
+
+def _rebuild(cursor, table, partitioned):
+    indexes, foreign_keys, triggers = _table_objects(cursor, table)
+    old = f'{table}_unpartitioned' if partitioned else f'{table}_partitioned'
+
+    # Free the index, constraint and trigger names for the new table
+    for name, _ in triggers:
+        cursor.execute(f'DROP TRIGGER "{name}" ON "{table}"')
+    for name, _ in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}"')
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX "{name}"')
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+    cursor.execute(f'ALTER TABLE "{old}" DROP CONSTRAINT "{table}_pkey"')
+
+    if partitioned:
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, created_at)')
+        cursor.execute(f'SELECT min(created_at) FROM "{old}"')
+        first = cursor.fetchone()[0]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        month = _month(first.year, first.month) if first else _month(now.year, now.month)
+        last = _month(now.year, now.month + MONTHS_AHEAD)
+        while month <= last:
+            following = _month(month.year, month.month + 1)
+            cursor.execute(
+                f'CREATE TABLE "{table}_p{month:%Y%m}" PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)',
+                [month, following],
+            )
+            month = following
+        cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+    else:
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY)'
+        )
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id)')
+
+    cursor.execute(f'INSERT INTO "{table}" OVERRIDING SYSTEM VALUE SELECT * FROM "{old}"')
+    cursor.execute(f'DROP TABLE "{old}" CASCADE')
+    _reset_identity(cursor, table)
+
+    for _, definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+    for _, definition in triggers:
+        cursor.execute(definition)
+
+
+def _convert(schema_editor, partitioned):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table])
+            if (cursor.fetchone() is not None) != partitioned:
+                _rebuild(cursor, table, partitioned)
+
+
+def partition_tables(apps, schema_editor):
+    _convert(schema_editor, partitioned=True)
+
+
+def unpartition_tables(apps, schema_editor):
+    _convert(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+    # Each table is converted in its own transaction
+    atomic = False
+
+    dependencies = [
+        ('utils', '0002_auditlog_search_vector_trigger'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.26 on 2026-10-19 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utils', '0003_partition_log_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIHourRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('route', models.CharField(max_length=500)),
+                ('method', models.CharField(max_length=10)),
+                ('status_class', models.CharField(help_text='e.g. 2xx, 4xx', max_length=3)),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('total_time', models.FloatField(default=0)),
+                ('min_time', models.FloatField(null=True)),
+                ('max_time', models.FloatField(null=True)),
+                ('histogram', models.JSONField(default=dict, help_text='Log-scale latency histogram, bucket index -> count (see utils.analytics)')),
+            ],
+            options={
+                'verbose_name': 'API Hour Rollup',
+                'verbose_name_plural': 'API Hour Rollups',
+                'ordering': ['-bucket_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='APIMinuteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('route', models.CharField(max_length=500)),
+                ('method', models.CharField(max_length=10)),
+                ('status_class', models.CharField(help_text='e.g. 2xx, 4xx', max_length=3)),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('total_time', models.FloatField(default=0)),
+                ('min_time', models.FloatField(null=True)),
+                ('max_time', models.FloatField(null=True)),
+                ('histogram', models.JSONField(default=dict, help_text='Log-scale latency histogram, bucket index -> count (see utils.analytics)')),
+            ],
+            options={
+                'verbose_name': 'API Minute Rollup',
+                'verbose_name_plural': 'API Minute Rollups',
+                'ordering': ['-bucket_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='APIRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processed_until', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='apiminuterollup',
+            constraint=models.UniqueConstraint(fields=('bucket_start', 'route', 'method', 'status_class'), name='utils_apiminuterollup_unique_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='apihourrollup',
+            constraint=models.UniqueConstraint(fields=('bucket_start', 'route', 'method', 'status_class'), name='utils_apihourrollup_unique_bucket'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import ipaddress
 import uuid
 import json
 from django.db import models
@@ -5,6 +6,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.contrib.postgres.search import SearchVectorField
 from django.contrib.postgres.indexes import GinIndex
+from .singletons import SingletonCache
 
 User = get_user_model()
 
@@ -265,9 +267,15 @@ class SystemSetting(models.Model):
 
     @classmethod
     def get_instance(cls):
-        """Get or create the singleton instance"""
-        if cls.objects.exists():
-            return cls.objects.first()
+        """Get the singleton instance from the process cache"""
+        return system_setting_cache.get()
+
+    @classmethod
+    def load_instance(cls):
+        """Get or create the singleton instance from the database"""
+        instance = cls.objects.first()
+        if instance:
+            return instance
         else:
             return cls.objects.create(
                 site_name='Jamngeny Vision',
@@ -282,6 +290,9 @@ class SystemSetting(models.Model):
         return not settings.DEBUG
 
 
+system_setting_cache = SingletonCache(SystemSetting, SystemSetting.load_instance)
+
+
 class HealthCheck(models.Model):
     """
     Track system health check results
@@ -431,7 +442,8 @@ class APIRequestLog(models.Model):
         
         # Extract response data
         status_code = response.status_code
-        response_size = len(response.content) if hasattr(response, 'content') else 0
+        from .middleware import response_size as get_response_size
+        response_size = get_response_size(response)
         
         # Handle errors
         error_message = ''
@@ -462,7 +474,70 @@ class APIRequestLog(models.Model):
         """Extract client IP address from request"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+            ip = x_forwarded_for.split(',')[0].strip()
+            # The header is client supplied; an invalid value would fail the inet column
+            try:
+                ipaddress.ip_address(ip)
+                return ip
+            except ValueError:
+                pass
+        return request.META.get('REMOTE_ADDR')
+
+
+class APIRequestRollup(models.Model):
+    """
+    API requests aggregated per time bucket, route, method and status class
+    """
+    bucket_start = models.DateTimeField()
+    route = models.CharField(max_length=500)
+    method = models.CharField(max_length=10)
+    status_class = models.CharField(max_length=3, help_text="e.g. 2xx, 4xx")
+    
+    # Counts
+    request_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    
+    # Response times in milliseconds
+    total_time = models.FloatField(default=0)
+    min_time = models.FloatField(null=True)
+    max_time = models.FloatField(null=True)
+    histogram = models.JSONField(
+        default=dict,
+        help_text="Log-scale latency histogram, bucket index -> count (see utils.analytics)"
+    )
+
+    class Meta:
+        abstract = True
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bucket_start', 'route', 'method', 'status_class'],
+                name='%(app_label)s_%(class)s_unique_bucket'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.route} {self.status_class} @ {self.bucket_start}: {self.request_count}"
+
+
+class APIMinuteRollup(APIRequestRollup):
+    class Meta(APIRequestRollup.Meta):
+        verbose_name = 'API Minute Rollup'
+        verbose_name_plural = 'API Minute Rollups'
+
+
+class APIHourRollup(APIRequestRollup):
+    class Meta(APIRequestRollup.Meta):
+        verbose_name = 'API Hour Rollup'
+        verbose_name_plural = 'API Hour Rollups'
+
+
+class APIRollupState(models.Model):
+    """
+    Singleton recording how far API request logs have been rolled up
+    """
+    processed_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"API rollups up to {self.processed_until}"
@@ -0,0 +1,155 @@
+"""
+Monthly partitions of the append-only log tables.
+
+On PostgreSQL the tables of PARTITIONED_MODELS are range-partitioned on
+created_at, one partition per calendar month (UTC) named <table>_pYYYYMM,
+plus a <table>_default partition for rows outside every month created so
+far. Queries bounded on created_at only scan the matching months, and
+retention drops whole partitions instead of deleting rows.
+
+maintain_partitions() creates the coming months ahead of time and drops
+(or detaches) months that are entirely older than the model's retention
+in LOG_PARTITION_RETENTION_MONTHS. The daily maintain_log_partitions
+task and the manage_log_partitions command run it.
+"""
+
+import datetime
+import logging
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_MODELS = ['utils.APIRequestLog', 'utils.AuditLog', 'utils.HealthCheck']
+PARTITION_KEY = 'created_at'
+PARTITION_RE = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table])
+        return cursor.fetchone() is not None
+
+
+def list_partitions(table):
+    """Monthly partitions of `table` as {name: month start}"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_RE.search(name)
+        if match:
+            partitions[name] = datetime.datetime(int(match[1]), int(match[2]), 1, tzinfo=datetime.timezone.utc)
+    return partitions
+
+
+def create_partition(table, month):
+    """Create the partition for `month`, moving in any of its rows that landed in the default partition"""
+    name = partition_name(table, month)
+    default = f'{table}_default'
+    bounds = [month, add_months(month, 1)]
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {qn(default)} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s)",
+            bounds,
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)",
+                bounds,
+            )
+            return
+
+        # The new range can't overlap rows held by the default partition
+        logger.warning("Moving rows for %s out of %s", name, default)
+        cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(default)}")
+        cursor.execute(f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)", bounds)
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(default)} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *) "
+            f"INSERT INTO {qn(table)} SELECT * FROM moved",
+            bounds,
+        )
+        cursor.execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(default)} DEFAULT")
+
+
+def remove_partition(table, name, detach=False):
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if detach:
+            cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+        else:
+            cursor.execute(f"DROP TABLE {qn(name)}")
+
+
+def maintain_partitions(months_ahead=None, detach=None, dry_run=False):
+    """
+    Create missing partitions up to `months_ahead` months from now and
+    remove expired ones. Returns {model label: {'created': [...], 'removed': [...]}}.
+    """
+    if months_ahead is None:
+        months_ahead = settings.LOG_PARTITION_PREMAKE_MONTHS
+    if detach is None:
+        detach = settings.LOG_PARTITION_DETACH_EXPIRED
+    current = month_start(timezone.now())
+
+    results = {}
+    for label in PARTITIONED_MODELS:
+        table = apps.get_model(label)._meta.db_table
+        if not is_partitioned(table):
+            logger.warning("%s is not partitioned; skipping", table)
+            continue
+        existing = list_partitions(table)
+        created, removed = [], []
+
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(table, month)
+            if name not in existing:
+                if not dry_run:
+                    create_partition(table, month)
+                created.append(name)
+
+        retention = settings.LOG_PARTITION_RETENTION_MONTHS.get(label)
+        if retention:
+            # Keep the partitions holding any row younger than the retention period
+            cutoff = add_months(current, -retention)
+            for name, month in sorted(existing.items(), key=lambda item: item[1]):
+                if month < cutoff:
+                    if not dry_run:
+                        remove_partition(table, name, detach=detach)
+                    removed.append(name)
+            if not dry_run:
+                qn = connection.ops.quote_name
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"DELETE FROM {qn(table + '_default')} WHERE {PARTITION_KEY} < %s", [cutoff]
+                    )
+
+        results[label] = {'created': created, 'removed': removed}
+    return results
@@ -0,0 +1,53 @@
+"""
+Per-request SQL instrumentation.
+
+QueryProfileMiddleware installs a QueryProfile as an execute_wrapper for
+each request, counting and timing every query. A sample of requests
+(SQL_PROFILE_SAMPLE_RATE) also fingerprint each statement, so the same
+query run over and over with different parameters, the usual sign of an
+N+1 pattern, can be reported. Requests over the configured thresholds are
+logged, and with SQL_PROFILE_SERVER_TIMING staff users get the timings
+back in a Server-Timing header.
+"""
+
+import re
+import time
+from collections import Counter
+
+# Parameter lists vary in length with the data, numbers are often inlined (LIMIT 21)
+_IN_LIST_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """The statement with its parameters and literal numbers removed"""
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """connection.execute_wrapper that counts and times the queries it sees"""
+
+    def __init__(self, fingerprints=False):
+        self.count = 0
+        self.seconds = 0.0
+        # Fingerprint -> number of executions, kept only for sampled requests
+        self.statements = Counter() if fingerprints else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+            if self.statements is not None:
+                self.statements[fingerprint(sql)] += 1
+
+    def repeated(self, threshold):
+        """Statements run at least `threshold` times, most frequent first"""
+        if not self.statements:
+            return []
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
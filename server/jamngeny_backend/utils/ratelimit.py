@@ -0,0 +1,238 @@
+"""
+Shared rate limiting for the API and the contact form.
+
+Limits use a sliding-window counter: hits are counted in fixed windows and
+the previous window's count is weighted by how much of it still overlaps
+the sliding window. That needs two integers per key, however high the
+limit is.
+
+Counters live in Redis (RATE_LIMIT_REDIS_URL) and are checked and
+incremented by a single Lua script, so every check costs one round trip
+and concurrent requests can't slip past the limit. Without Redis, or while
+it is unreachable, counters fall back to process memory.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+# Seconds to stay on local counters after Redis fails before trying it again
+REDIS_RETRY_INTERVAL = 30
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'limit', 'remaining', 'retry_after'])
+
+SLIDING_WINDOW_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local limit = tonumber(ARGV[1])
+local weight = tonumber(ARGV[2])
+if previous * weight + current + 1 > limit then
+    return {0, current, previous}
+end
+current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return {1, current, previous}
+"""
+
+
+def _window(period, now):
+    """Return (window index, fraction of the previous window still inside the sliding window)"""
+    index, elapsed = divmod(now, period)
+    return int(index), (period - elapsed) / period
+
+
+def _result(allowed, limit, period, now, current, previous, weight):
+    estimated = previous * weight + current
+    remaining = max(0, int(limit - estimated))
+    if allowed:
+        return RateLimitResult(True, limit, remaining, 0)
+
+    elapsed = now % period
+    if previous and current < limit:
+        # Wait until enough of the previous window has slid out
+        retry_after = (period - elapsed) - period * (limit - 1 - current) / previous
+    else:
+        retry_after = period - elapsed
+    return RateLimitResult(False, limit, 0, max(1, math.ceil(retry_after)))
+
+
+class LocalBackend:
+    """Sliding-window counters in process memory"""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._hits = 0
+
+    def hit(self, key, limit, period, now):
+        index, weight = _window(period, now)
+        with self._lock:
+            counter_index, current, previous = self._counters.get(key, (index, 0, 0))
+            if counter_index != index:
+                previous = current if counter_index == index - 1 else 0
+                current = 0
+
+            allowed = previous * weight + current + 1 <= limit
+            if allowed:
+                current += 1
+            self._counters[key] = (index, current, previous)
+
+            self._hits += 1
+            if self._hits % self.PRUNE_EVERY == 0:
+                self._prune(now)
+        return _result(allowed, limit, period, now, current, previous, weight)
+
+    def _prune(self, now):
+        # Keys are "<scope>:<period>:<ident>"; drop counters whose windows have both passed
+        stale = []
+        for key, (index, _, _) in self._counters.items():
+            period = int(key.split(':', 2)[1])
+            if index < int(now // period) - 1:
+                stale.append(key)
+        for key in stale:
+            del self._counters[key]
+
+
+class RedisBackend:
+    """Sliding-window counters in Redis, updated atomically by a Lua script"""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        # Script objects use EVALSHA and reload the script if the server lost it
+        self.script = self.client.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def hit(self, key, limit, period, now):
+        index, weight = _window(period, now)
+        allowed, current, previous = self.script(
+            keys=[f'ratelimit:{key}:{index}', f'ratelimit:{key}:{index - 1}'],
+            args=[limit, repr(weight), period * 2],
+        )
+        return _result(bool(allowed), limit, period, now, current, previous, weight)
+
+
+class RateLimiter:
+    """Check-and-count against Redis when configured, otherwise in process memory"""
+
+    def __init__(self, redis_url=''):
+        self.local = LocalBackend()
+        self.redis = RedisBackend(redis_url) if redis_url else None
+        self._redis_down_until = 0
+
+    def hit(self, scope, ident, limit, period):
+        """Count a hit for `ident` and report whether it's within `limit` per `period` seconds"""
+        key = f'{scope}:{period}:{ident}'
+        now = time.time()
+        if self.redis and now >= self._redis_down_until:
+            import redis
+            try:
+                return self.redis.hit(key, limit, period, now)
+            except redis.RedisError as e:
+                logger.warning("Rate limit backend unavailable, using local counters: %s", e)
+                self._redis_down_until = now + REDIS_RETRY_INTERVAL
+        return self.local.hit(key, limit, period, now)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Get the process-wide rate limiter"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(settings.RATE_LIMIT_REDIS_URL)
+    return _limiter
+
+
+class SettingsRateThrottle(BaseThrottle):
+    """
+    Throttle whose limit is read from a settings model on every request.
+    Subclasses set `scope` and implement get_rate() returning
+    (limit, period_seconds), or None to disable throttling.
+    """
+    scope = None
+
+    def get_rate(self, request, view):
+        raise NotImplementedError('.get_rate() must be overridden')
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        rate = self.get_rate(request, view)
+        if not rate:
+            return True
+        limit, period = rate
+        self.result = get_rate_limiter().hit(self.scope, self.get_ident_key(request), limit, period)
+        return self.result.allowed
+
+    def wait(self):
+        return self.result.retry_after
+
+
+class APIRateThrottle(SettingsRateThrottle):
+    """Per-user (or per-IP for anonymous clients) limit from SystemSetting.api_rate_limit"""
+    scope = 'api'
+
+    def get_rate(self, request, view):
+        from .models import SystemSetting
+        limit = SystemSetting.get_instance().api_rate_limit
+        return (limit, 3600) if limit else None
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user-{request.user.pk}'
+        return f'ip-{self.get_ident(request)}'
+
+
+class ContactFormThrottle(SettingsRateThrottle):
+    """Per-IP contact form limit from ContactSetting"""
+    scope = 'contact'
+
+    def get_rate(self, request, view):
+        from contact.models import ContactSetting
+        contact_settings = ContactSetting.get_instance()
+        if not contact_settings.rate_limit_enabled:
+            return None
+        return contact_settings.rate_limit_count, contact_settings.rate_limit_period
+
+
+def rate_limit(throttle_class, message='Too many requests. Please try again later.'):
+    """
+    Apply a throttle to an API view function, responding with the standard
+    RATE_LIMITED error. Use with method_decorator on class-based views.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            throttle = throttle_class()
+            if not throttle.allow_request(request, None):
+                retry_after = throttle.wait()
+                return Response({
+                    'status': 'error',
+                    'error': {
+                        'code': 'RATE_LIMITED',
+                        'message': message,
+                        'details': {'retry_after': retry_after}
+                    }
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(retry_after)})
+            return view_func(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,119 @@
+"""
+Buffered writes of API request logs.
+
+Requests only append a dict of field values to a bounded in-process
+queue. A daemon thread wakes every API_REQUEST_LOG_FLUSH_INTERVAL_MS (or
+as soon as a full batch is waiting) and saves queued entries with bulk_create. When
+the queue is full, new entries are dropped and counted instead of making
+requests wait on the database. If a batch insert fails, its rows are
+retried one at a time so a single bad row only loses itself. Entries still queued when the process
+exits are flushed by an atexit hook, so only a hard kill loses them.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+
+from .metrics import REQUEST_LOG_DROPPED, REQUEST_LOG_QUEUE
+
+logger = logging.getLogger(__name__)
+
+
+class RequestLogQueue:
+    """Bounded queue of pending APIRequestLog rows and the thread that writes them"""
+
+    def __init__(self, max_size, batch_size, flush_interval):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._entries = deque()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def put(self, entry):
+        """Queue an entry without blocking; returns False if it was dropped"""
+        if len(self._entries) >= self.max_size:
+            self.dropped += 1
+            REQUEST_LOG_DROPPED.inc()
+            return False
+        self._entries.append(entry)
+        if self._pid != os.getpid():
+            self._start()
+        if len(self._entries) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _start(self):
+        with self._lock:
+            # Threads don't survive fork, so each worker starts its own
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='api-request-log', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                while self.flush() == self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("Could not write API request logs")
+                connection.close()
+
+    def flush(self):
+        """Write up to one batch of queued entries; returns how many were written"""
+        from .models import APIRequestLog
+
+        batch = []
+        while self._entries and len(batch) < self.batch_size:
+            batch.append(self._entries.popleft())
+        REQUEST_LOG_QUEUE.set(len(self._entries))
+        if batch:
+            try:
+                with transaction.atomic():
+                    APIRequestLog.objects.bulk_create([APIRequestLog(**entry) for entry in batch])
+            except DatabaseError:
+                self._write_each(APIRequestLog, batch)
+        if self.dropped:
+            logger.warning("Dropped %d API request logs while the queue was full", self.dropped)
+            self.dropped = 0
+        return len(batch)
+
+    def _write_each(self, model, batch):
+        """Insert a failed batch row by row, dropping only the rows that fail"""
+        failed = 0
+        for entry in batch:
+            try:
+                with transaction.atomic():
+                    model.objects.create(**entry)
+            except DatabaseError:
+                failed += 1
+        if failed:
+            logger.warning("Dropped %d API request logs the database rejected", failed)
+
+    def flush_all(self):
+        try:
+            while self.flush():
+                pass
+        except Exception:
+            logger.exception("Could not write API request logs")
+
+
+request_log_queue = RequestLogQueue(
+    max_size=settings.API_REQUEST_LOG_QUEUE_SIZE,
+    batch_size=settings.API_REQUEST_LOG_BATCH_SIZE,
+    flush_interval=settings.API_REQUEST_LOG_FLUSH_INTERVAL_MS / 1000,
+)
+atexit.register(request_log_queue.flush_all)
@@ -0,0 +1,37 @@
+"""
+Full-text search over maintained tsvector columns.
+"""
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    ?search= matched against the view's `search_vector_field` (a GIN-indexed
+    tsvector) using web-search syntax ("quoted phrases", -exclusions, or).
+    Results are ranked by relevance unless ?ordering= is given, so this
+    must come after OrderingFilter in filter_backends. Falls back to the
+    view's search_fields on databases other than PostgreSQL.
+    """
+    search_config = 'english'
+
+    def filter_queryset(self, request, queryset, view):
+        field = getattr(view, 'search_vector_field', None)
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not field or not terms or connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        query = SearchQuery(terms, search_type='websearch', config=self.search_config)
+        queryset = queryset.filter(**{field: query}).annotate(search_rank=SearchRank(F(field), query))
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by('-search_rank', *queryset.query.order_by)
+        return queryset
+
+
+class RankedQueryFilter(FullTextSearchFilter):
+    """FullTextSearchFilter on ?q=, for views that keep ?search= for substring matches"""
+    search_param = 'q'
@@ -0,0 +1,104 @@
+"""
+Process-local caching for singleton settings rows.
+
+Each process keeps its own copy of the row. A version stamp in the shared
+Django cache says when the copy is stale: saving or deleting the row
+writes a new stamp once the transaction commits. Processes compare stamps
+at most every CHECK_INTERVAL seconds, so a hot-path read normally touches
+neither the database nor the cache. MAX_AGE bounds staleness if the shared
+cache loses the stamp or isn't shared between workers (local-memory cache).
+"""
+
+import copy
+import logging
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 1.0
+MAX_AGE = 300.0
+
+
+class SingletonCache:
+    """
+    Cache the result of `loader()` (a model instance or None) for `model`.
+    get() returns a copy, so callers can modify and save it freely; pass
+    copy_result=False when the loader builds an object nobody mutates.
+    """
+
+    def __init__(self, model, loader, copy_result=True):
+        self.model = model
+        self.loader = loader
+        self.copy_result = copy_result
+        self.version_key = f'singleton-version:{model._meta.label_lower}'
+        self.metric_name = f'singleton:{model._meta.label_lower}'
+        # Reentrant: a loader that creates the row triggers _on_change
+        self._lock = threading.RLock()
+        self._instance = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+        post_save.connect(self._on_change, sender=model, weak=False,
+                          dispatch_uid=f'{self.version_key}:save')
+        post_delete.connect(self._on_change, sender=model, weak=False,
+                            dispatch_uid=f'{self.version_key}:delete')
+
+    def _current_version(self):
+        """Read the shared stamp, creating one if the cache doesn't have it"""
+        version = cache.get(self.version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(self.version_key, version, None):
+                version = cache.get(self.version_key, version)
+        return version
+
+    def get(self):
+        now = time.monotonic()
+        with self._lock:
+            loaded = self._loaded_at > 0 and now - self._loaded_at < MAX_AGE
+            if loaded and now - self._checked_at < CHECK_INTERVAL:
+                record_cache(self.metric_name, True)
+                return self._result()
+
+            try:
+                version = self._current_version()
+            except Exception as e:
+                # Without the shared cache, fall back to the database
+                logger.warning("Singleton version check failed for %s: %s", self.model.__name__, e)
+                version = None
+
+            stale = not loaded or version is None or version != self._version
+            record_cache(self.metric_name, not stale)
+            if stale:
+                self._instance = self.loader()
+                self._version = version
+                self._loaded_at = now
+            self._checked_at = now
+            return self._result()
+
+    def _result(self):
+        return copy.deepcopy(self._instance) if self.copy_result else self._instance
+
+    def invalidate(self):
+        """Drop this process's copy and tell other processes to drop theirs"""
+        with self._lock:
+            self._loaded_at = 0.0
+        try:
+            cache.set(self.version_key, uuid.uuid4().hex, None)
+        except Exception as e:
+            logger.warning("Singleton invalidation failed for %s: %s", self.model.__name__, e)
+
+    def _on_change(self, sender, **kwargs):
+        with self._lock:
+            self._loaded_at = 0.0
+        # Other processes must not reload before the change is visible to them
+        transaction.on_commit(self.invalidate)
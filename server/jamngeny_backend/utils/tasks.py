@@ -0,0 +1,25 @@
+from celery import shared_task
+from django.db import connection
+
+from .analytics import prune_rollups, rollup_api_requests
+from .partitions import maintain_partitions
+
+
+@shared_task
+def rollup_api_request_logs():
+    """Fold newly written API request logs into the analytics rollups"""
+    return rollup_api_requests()
+
+
+@shared_task
+def prune_api_rollups():
+    """Drop minute and hour rollups past their retention"""
+    return prune_rollups()
+
+
+@shared_task
+def maintain_log_partitions():
+    """Create upcoming monthly log partitions and remove expired ones"""
+    if connection.vendor != 'postgresql':
+        return None
+    return maintain_partitions()
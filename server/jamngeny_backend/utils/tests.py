@@ -1,3 +1,492 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib
+import io
+import json
+import unittest
+import uuid
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import redis
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .analytics import api_summary, rollup_api_requests
+from .audit import audit_batch, write_entries
+from .images import validate_image_dimensions, validate_stored_image_dimensions
+from .metrics import metrics_view
+from .middleware import APIRequestLogMiddleware, QueryProfileMiddleware
+from .models import (
+    APIHourRollup, APIMinuteRollup, APIRequestLog, AuditLog, HealthCheck, SystemSetting, system_setting_cache,
+)
+from .partitions import (
+    PARTITIONED_MODELS, add_months, create_partition, is_partitioned, list_partitions, month_start, partition_name,
+)
+from .ratelimit import LocalBackend, RateLimiter, RedisBackend
+from .request_log import RequestLogQueue
+from .tasks import maintain_log_partitions
+
+
+def redis_available():
+    try:
+        return redis.Redis.from_url(settings.RATE_LIMIT_REDIS_URL, socket_connect_timeout=0.25).ping()
+    except (redis.RedisError, ValueError):
+        return False
+
+
+partition_migration = importlib.import_module('utils.migrations.0003_partition_log_tables')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Log partitioning is PostgreSQL only')
+class LogPartitionTests(TestCase):
+    def test_log_tables_are_partitioned_and_writable(self):
+        for label in PARTITIONED_MODELS:
+            self.assertTrue(is_partitioned(label.replace('.', '_').lower()))
+
+        HealthCheck.log_check(check_type='full', is_successful=True, response_time=1.0)
+        AuditLog.objects.create(action='create', entity='test', description='test')
+        APIRequestLog.objects.create(
+            method='GET', path='/api/test/', status_code=200, response_time=1.0, ip_address='127.0.0.1'
+        )
+        self.assertEqual(HealthCheck.objects.count(), 1)
+        self.assertEqual(AuditLog.objects.count(), 1)
+        self.assertEqual(APIRequestLog.objects.count(), 1)
+
+    def test_rebuild_keeps_identity_columns(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE partition_test (id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, '
+                'created_at timestamptz NOT NULL)'
+            )
+            cursor.execute(
+                "INSERT INTO partition_test (created_at) SELECT now() - g * interval '1 day' FROM generate_series(1, 40) g"
+            )
+            for partitioned in (True, False):
+                partition_migration._rebuild(cursor, 'partition_test', partitioned)
+                cursor.execute('INSERT INTO partition_test (created_at) VALUES (now()) RETURNING id')
+                self.assertEqual(cursor.fetchone()[0], 41 + (not partitioned))
+
+    def test_create_partition_moves_rows_out_of_the_default_partition(self):
+        table = HealthCheck._meta.db_table
+        month = datetime.datetime(2100, 1, 1, tzinfo=datetime.timezone.utc)
+        check = HealthCheck.log_check(check_type='full', is_successful=True, response_time=1.0)
+        HealthCheck.objects.filter(pk=check.pk).update(created_at=month + timedelta(days=3))
+        self.assertNotIn(partition_name(table, month), list_partitions(table))
+
+        create_partition(table, month)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {table}_default')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute(f'SELECT id FROM {partition_name(table, month)}')
+            self.assertEqual(cursor.fetchall(), [(check.pk,)])
+        self.assertTrue(is_partitioned(table))
+        self.assertEqual(HealthCheck.objects.get().pk, check.pk)
+
+    @override_settings(LOG_PARTITION_PREMAKE_MONTHS=1)
+    def test_maintenance_task_creates_upcoming_partitions(self):
+        current = month_start(timezone.now())
+        results = maintain_log_partitions()
+        for label in PARTITIONED_MODELS:
+            table = label.replace('.', '_').lower()
+            self.assertIn(partition_name(table, add_months(current, 1)), list_partitions(table))
+            self.assertEqual(results[label]['removed'], [])
+
+
+def log_entry(**fields):
+    return {
+        'method': 'GET', 'path': '/api/files/', 'ip_address': '203.0.113.9', 'status_code': 200,
+        'response_time': 5, 'requested_at': timezone.now(), **fields,
+    }
+
+
+@mock.patch.object(RequestLogQueue, '_start')
+class RequestLogTests(TestCase):
+    def test_queue_drops_when_full_and_flushes_in_batches(self, start):
+        queue = RequestLogQueue(max_size=3, batch_size=2, flush_interval=60)
+        self.assertEqual([queue.put(log_entry()) for _ in range(4)], [True, True, True, False])
+        self.assertEqual(queue.dropped, 1)
+
+        self.assertEqual(queue.flush(), 2)
+        self.assertEqual(queue.flush(), 1)
+        self.assertEqual(queue.flush(), 0)
+        self.assertEqual(APIRequestLog.objects.count(), 3)
+
+    def test_bad_row_does_not_lose_the_batch(self, start):
+        queue = RequestLogQueue(max_size=10, batch_size=10, flush_interval=60)
+        for ip_address in ('203.0.113.1', 'not-an-ip', '203.0.113.2'):
+            queue.put(log_entry(ip_address=ip_address))
+        self.assertEqual(queue.flush(), 3)
+        self.assertEqual(
+            set(APIRequestLog.objects.values_list('ip_address', flat=True)), {'203.0.113.1', '203.0.113.2'}
+        )
+
+    def test_invalid_forwarded_for_falls_back_to_remote_addr(self, start):
+        factory = RequestFactory()
+        for header, expected in [('not-an-ip', '10.0.0.1'), (' 203.0.113.7 , 10.0.0.2', '203.0.113.7')]:
+            request = factory.get('/api/files/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=header)
+            self.assertEqual(APIRequestLog.get_client_ip(request), expected)
+
+    def logged_statuses(self, statuses, **settings):
+        queue = RequestLogQueue(max_size=10, batch_size=10, flush_interval=60)
+        with override_settings(API_REQUEST_LOG_ENABLED=True, **settings), \
+                mock.patch('utils.middleware.request_log_queue', queue):
+            middleware = APIRequestLogMiddleware(lambda request: HttpResponse(status=request.status))
+            for status in statuses:
+                request = RequestFactory().get('/api/files/')
+                request.status = status
+                middleware(request)
+        return [(entry['status_code'], entry['metadata'].get('sample_weight')) for entry in queue._entries]
+
+    def test_sampling_keeps_errors_and_slow_requests(self, start):
+        self.assertEqual(
+            self.logged_statuses([200, 404, 500], API_REQUEST_LOG_SAMPLE_RATE=0, API_REQUEST_LOG_SLOW_MS=10000),
+            [(404, None), (500, None)],
+        )
+        self.assertEqual(
+            self.logged_statuses([200], API_REQUEST_LOG_SAMPLE_RATE=0, API_REQUEST_LOG_SLOW_MS=0), [(200, None)]
+        )
+        self.assertEqual(
+            self.logged_statuses([200, 200], API_REQUEST_LOG_SAMPLE_RATE=1, API_REQUEST_LOG_SLOW_MS=10000),
+            [(200, None), (200, None)],
+        )
+
+    def test_sampled_rows_carry_their_weight(self, start):
+        with mock.patch('utils.middleware.random.random', side_effect=[0.1, 0.9]):
+            self.assertEqual(
+                self.logged_statuses([200, 200, 500], API_REQUEST_LOG_SAMPLE_RATE=0.25, API_REQUEST_LOG_SLOW_MS=10000),
+                [(200, 4), (500, None)],
+            )
+
+
+class RollupTests(TestCase):
+    def test_unmatched_paths_share_one_route(self):
+        APIRequestLog.objects.bulk_create([
+            APIRequestLog(
+                method='GET', path=path, ip_address='203.0.113.9', status_code=404, response_time=5,
+                metadata={'route': route} if route else {},
+            )
+            for path, route in [
+                ('/wp-login.php', None), ('/.env', None), ('/api/files/1/', '/api/files/<int:pk>/'),
+            ]
+        ])
+        APIRequestLog.objects.update(created_at=timezone.now() - timedelta(minutes=10))
+
+        self.assertEqual(rollup_api_requests(), 3)
+        self.assertEqual(
+            dict(APIMinuteRollup.objects.values_list('route', 'request_count')),
+            {'<unmatched>': 2, '/api/files/<int:pk>/': 1},
+        )
+
+    def test_windows_count_each_row_once_and_merge_hours(self):
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=5)
+        # minutes after `hour`, sample weight; the first window runs from minute 17 to 77
+        rows = [(17, {}), (40, {}), (70, {}), (100, {'sample_weight': 4}), (130, {})]
+        APIRequestLog.objects.bulk_create([
+            APIRequestLog(
+                method='GET', path=f'/api/files/{minute}/', ip_address='203.0.113.9', status_code=200,
+                response_time=5, metadata={'route': '/api/files/<int:pk>/', **weight},
+            )
+            for minute, weight in rows
+        ])
+        for minute, _ in rows:
+            APIRequestLog.objects.filter(path=f'/api/files/{minute}/').update(
+                created_at=hour + timedelta(minutes=minute)
+            )
+
+        self.assertEqual(rollup_api_requests(max_windows=1), 3)
+        self.assertEqual(rollup_api_requests(), 2)
+        self.assertEqual(rollup_api_requests(), 0)
+
+        # The second hour is written by the first window and merged into by the second
+        self.assertEqual(
+            list(APIHourRollup.objects.order_by('bucket_start').values_list('bucket_start', 'request_count')),
+            [(hour, 2), (hour + timedelta(hours=1), 5), (hour + timedelta(hours=2), 1)],
+        )
+        summary = api_summary(hour)
+        self.assertEqual(summary['total_requests'], 8)
+        self.assertEqual(summary['response_times']['average'], 5)
+
+
+class SlidingWindowCases:
+    """Rate limit window cases, run against each backend: 3 hits per 60 seconds"""
+    START = 6000.0  # the start of a window
+
+    def hit(self, now, ident='client'):
+        return self.backend.hit(f'test:60:{self.prefix}-{ident}', 3, 60, now)
+
+    def test_limit_within_a_window(self):
+        self.assertEqual([self.hit(self.START + i).remaining for i in range(3)], [2, 1, 0])
+        denied = self.hit(self.START + 10)
+        self.assertFalse(denied.allowed)
+        self.assertEqual(denied.retry_after, 50)
+        self.assertTrue(self.hit(self.START, ident='other').allowed)
+
+    def test_previous_window_slides_out(self):
+        for i in range(3):
+            self.hit(self.START + i)
+        # At the boundary the whole previous window still counts
+        self.assertEqual(self.hit(self.START + 60).retry_after, 20)
+        # Halfway through, half of it (1.5 hits) does
+        self.assertTrue(self.hit(self.START + 90).allowed)
+        denied = self.hit(self.START + 90)
+        self.assertFalse(denied.allowed)
+        self.assertEqual(denied.retry_after, 10)
+        self.assertTrue(self.hit(self.START + 100).allowed)
+
+    def test_idle_window_resets(self):
+        for i in range(3):
+            self.hit(self.START + i)
+        self.assertEqual([self.hit(self.START + 120).allowed for _ in range(4)], [True, True, True, False])
+
+
+class LocalRateLimitTests(SlidingWindowCases, SimpleTestCase):
+    def setUp(self):
+        self.backend = LocalBackend()
+        self.prefix = 'local'
+
+
+@unittest.skipUnless(redis_available(), 'Needs the Redis server at RATE_LIMIT_REDIS_URL')
+class RedisRateLimitTests(SlidingWindowCases, SimpleTestCase):
+    def setUp(self):
+        self.backend = RedisBackend(settings.RATE_LIMIT_REDIS_URL)
+        self.prefix = uuid.uuid4().hex
+
+
+class RateLimiterFallbackTests(SimpleTestCase):
+    def test_falls_back_to_local_counters_while_redis_is_down(self):
+        limiter = RateLimiter()
+        limiter.redis = mock.Mock()
+        limiter.redis.hit.side_effect = redis.ConnectionError('down')
+        self.assertEqual([limiter.hit('api', 'client', 2, 60).allowed for _ in range(3)], [True, True, False])
+        # Redis isn't retried until REDIS_RETRY_INTERVAL has passed
+        self.assertEqual(limiter.redis.hit.call_count, 1)
+
+        limiter._redis_down_until = 0
+        limiter.redis.hit.side_effect = None
+        limiter.redis.hit.return_value = 'from redis'
+        self.assertEqual(limiter.hit('api', 'client', 2, 60), 'from redis')
+
+
+@override_settings(API_REQUEST_LOG_ENABLED=False)
+class APIThrottleTests(TestCase):
+    def test_api_limit_sends_retry_after(self):
+        system_settings = SystemSetting.get_instance()
+        system_settings.api_rate_limit = 2
+        system_settings.save()
+        # The cached copy would outlive the rolled back test transaction
+        self.addCleanup(system_setting_cache.invalidate)
+        user = get_user_model().objects.create_user('busy', email='busy@example.com', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with mock.patch('utils.ratelimit._limiter', RateLimiter()):
+            statuses = [client.get('/api/files/tags/') for _ in range(3)]
+        self.assertEqual([response.status_code for response in statuses], [200, 200, 429])
+        self.assertTrue(1 <= int(statuses[-1]['Retry-After']) <= 3600)
+
+
+class MetricsAccessTests(SimpleTestCase):
+    def get(self, remote_addr, **headers):
+        return metrics_view(RequestFactory().get('/metrics', REMOTE_ADDR=remote_addr, **headers)).status_code
+
+    @override_settings(DEBUG=True, METRICS_TOKEN='', METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_allowlist_ignores_forwarded_for(self):
+        self.assertEqual(self.get('127.0.0.1'), 200)
+        self.assertEqual(self.get('203.0.113.9'), 403)
+        self.assertEqual(self.get('203.0.113.9', HTTP_X_FORWARDED_FOR='127.0.0.1'), 403)
+
+    @override_settings(DEBUG=False, METRICS_TOKEN='', METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_requires_token_outside_debug(self):
+        self.assertEqual(self.get('127.0.0.1'), 403)
+
+    @override_settings(DEBUG=False, METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=[])
+    def test_token(self):
+        self.assertEqual(self.get('203.0.113.9', HTTP_AUTHORIZATION='Bearer secret'), 200)
+        self.assertEqual(self.get('203.0.113.9', HTTP_AUTHORIZATION='Bearer wrong'), 403)
+
+
+class ServerTimingTests(SimpleTestCase):
+    def timing(self, user):
+        request = RequestFactory().get('/api/files/')
+        request.user = user
+        return QueryProfileMiddleware(lambda request: HttpResponse())(request).get('Server-Timing')
+
+    @override_settings(SQL_PROFILE_SERVER_TIMING=True)
+    def test_only_staff_get_timings(self):
+        self.assertIsNone(self.timing(AnonymousUser()))
+        self.assertIsNone(self.timing(get_user_model()(is_staff=False)))
+        self.assertIn('db;dur=', self.timing(get_user_model()(is_staff=True)))
+
+    @override_settings(SQL_PROFILE_SERVER_TIMING=False)
+    def test_disabled(self):
+        self.assertIsNone(self.timing(get_user_model()(is_staff=True)))
+
+
+class StoredImageDimensionTests(SimpleTestCase):
+    def jpeg(self, size, exif_padding=0):
+        from PIL import Image
+
+        output = BytesIO()
+        exif = b'Exif\x00\x00MM\x00*\x00\x00\x00\x08\x00\x00' + b'\x00' * exif_padding
+        Image.new('RGB', size).save(output, 'JPEG', exif=exif)
+        return output.getvalue()
+
+    def validate(self, data):
+        validate_stored_image_dimensions(lambda length: data[:length], len(data), data[:8 * 1024])
+
+    @override_settings(IMAGE_MAX_DIMENSION=10000)
+    def test_dimensions_past_the_first_read(self):
+        # A large EXIF block pushes the frame header past the first 8 KB
+        with self.assertRaises(ValidationError):
+            self.validate(self.jpeg((13000, 100), exif_padding=30000))
+        self.validate(self.jpeg((1000, 100), exif_padding=30000))
+
+    def test_unreadable_image(self):
+        with self.assertRaises(ValidationError):
+            self.validate(b'\xff\xd8\xff' + b'\x00' * 20000)
+
+    @override_settings(IMAGE_MAX_DIMENSION=10000)
+    def test_stored_files_are_not_reopened(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        upload = SimpleUploadedFile('big.jpg', self.jpeg((13000, 100)))
+        with self.assertRaises(ValidationError):
+            validate_image_dimensions(upload)
+
+        stored = mock.Mock(_committed=True)
+        validate_image_dimensions(stored)
+        stored.open.assert_not_called()
+        stored.read.assert_not_called()
+
+
+class AuditCaptureTests(TestCase):
+    def test_rolled_back_savepoint_discards_its_entries(self):
+        User = get_user_model()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                User.objects.create_user('kept', email='kept@example.com', password='x')
+                try:
+                    with transaction.atomic():
+                        User.objects.create_user('rolled-back', email='rolled-back@example.com', password='x')
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                User.objects.create_user('kept-too', email='kept-too@example.com', password='x')
+
+        created = User.objects.filter(email__startswith='kept').values_list('pk', flat=True)
+        self.assertEqual(
+            set(AuditLog.objects.filter(entity='user', action='create').values_list('entity_id', flat=True)),
+            {str(pk) for pk in created},
+        )
+
+    def test_batch_writes_committed_entries_together(self):
+        User = get_user_model()
+        with mock.patch('utils.audit.write_entries') as write_entries:
+            with audit_batch():
+                with self.captureOnCommitCallbacks(execute=True):
+                    User.objects.create_user('first', email='first@example.com', password='x')
+                    User.objects.create_user('second', email='second@example.com', password='x')
+                write_entries.assert_not_called()
+        write_entries.assert_called_once()
+        self.assertEqual([entry['action'] for entry in write_entries.call_args.args[0]], ['create', 'create'])
+
+
+@override_settings(API_REQUEST_LOG_ENABLED=False, EXPORT_CHUNK_SIZE=2)
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user('exporter', email='exporter@example.com', password='x', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        for index, description in enumerate(['=HYPERLINK("http://example.com")', 'Plain', 'Zoë']):
+            AuditLog.objects.create(
+                action='update', entity='file', entity_id=str(index), description=description,
+                changes={'title': ['old', 'new']}, performed_by=self.admin,
+            )
+        AuditLog.objects.create(action='delete', entity='file', entity_id='9', description='Deleted')
+
+    def export(self, export_format, **params):
+        response = self.client.get('/api/utils/audit-logs/', {'format': export_format, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn(f'.{export_format}"', response['Content-Disposition'])
+        chunks = list(response.streaming_content)
+        return chunks, b''.join(chunks).decode()
+
+    def test_csv_applies_filters_and_ordering(self):
+        chunks, body = self.export('csv', action='update', ordering='created_at')
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0][:6], ['id', 'created_at', 'action', 'entity', 'entity_id', 'performed_by__email'])
+        self.assertEqual([row[4] for row in rows[1:]], ['0', '1', '2'])
+        self.assertEqual([row[5] for row in rows[1:]], ['exporter@example.com'] * 3)
+        # Formulas are neutralized and JSON columns stay JSON
+        self.assertEqual(rows[1][8], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(rows[3][8], 'Zoë')
+        self.assertEqual(json.loads(rows[1][9]), {'title': ['old', 'new']})
+        # A header chunk, then rows EXPORT_CHUNK_SIZE at a time
+        self.assertEqual(len(chunks), 3)
+
+    def test_ndjson_rows(self):
+        _, body = self.export('ndjson', action='delete')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([(row['action'], row['entity_id'], row['performed_by__email']) for row in rows],
+                         [('delete', '9', None)])
+
+    def test_exports_are_for_admins_only(self):
+        self.client.force_authenticate(get_user_model().objects.create_user('reader', email='r@example.com'))
+        self.assertEqual(self.client.get('/api/utils/audit-logs/', {'format': 'csv'}).status_code, 403)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'The search trigger is PostgreSQL only')
+@override_settings(API_REQUEST_LOG_ENABLED=False)
+class AuditSearchTests(TestCase):
+    def setUp(self):
+        admin = get_user_model().objects.create_user('auditor', email='auditor@example.com', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        self.renamed = AuditLog.objects.create(
+            action='update', entity='file', entity_id='1', description='Renamed the invoice',
+            changes={'title': ['a', 'b']},
+        )
+        self.failed = AuditLog.objects.create(
+            action='delete', entity='file', entity_id='2', description='Delete failed', is_successful=False,
+            error_message='Permission denied for invoice',
+        )
+        # Batched writes go through bulk_create, which the trigger covers too
+        write_entries([{
+            'action': 'update', 'entity': 'system_setting', 'entity_id': '3', 'payload': {'invoice': True},
+        }])
+        self.batched = AuditLog.objects.get(entity='system_setting')
+
+    def search(self, **params):
+        response = self.client.get('/api/utils/audit-logs/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['data']['results']['results']]
+
+    def test_trigger_covers_every_searched_column(self):
+        self.assertEqual(self.search(q='title'), [str(self.renamed.pk)])
+        self.assertEqual(self.search(q='permission denied'), [str(self.failed.pk)])
+        self.assertEqual(self.search(q='system_setting'), [str(self.batched.pk)])
+
+        AuditLog.objects.filter(pk=self.renamed.pk).update(description='Moved the receipt')
+        self.assertEqual(self.search(q='receipt'), [str(self.renamed.pk)])
+        self.assertEqual(self.search(q='renamed'), [])
+
+    def test_query_is_ranked_and_combines_with_filters(self):
+        # Description (A) outranks error message (B) outranks payload keys (C)
+        self.assertEqual(
+            self.search(q='invoice'), [str(self.renamed.pk), str(self.failed.pk), str(self.batched.pk)]
+        )
+        self.assertEqual(self.search(q='invoice -renamed', action='update'), [str(self.batched.pk)])
+        # ?search= keeps its substring matching
+        self.assertEqual(self.search(search='nvoic'), [str(self.renamed.pk)])
@@ -3,6 +3,7 @@ import time
 import psutil
 from datetime import timedelta
 from django.db import connection, models
+from django.db.models.functions import Coalesce
 from django.core.cache import cache
 from django.utils import timezone
 from django.conf import settings
@@ -14,6 +15,10 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 
 
+from .analytics import api_summary
+from .export import StreamingExportMixin
+from .metrics import record_cache
+from .search import RankedQueryFilter
 from .models import AuditLog, SystemSetting, HealthCheck, APIRequestLog
 from .serializers import (
     AuditLogListSerializer, AuditLogDetailSerializer,
@@ -23,14 +28,21 @@ from .serializers import (
 )
 
 
-class AuditLogListView(generics.ListAPIView):
+class AuditLogListView(StreamingExportMixin, generics.ListAPIView):
     serializer_class = AuditLogListSerializer
     permission_classes = [permissions.IsAdminUser]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # ?q= is ranked full-text search over the indexed search_vector
+    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter, RankedQueryFilter]
     filterset_fields = ['action', 'entity', 'severity', 'is_successful']
     search_fields = ['description', 'entity_id', 'performed_by__email']
+    search_vector_field = 'search_vector'
     ordering_fields = ['created_at', 'severity']
     ordering = ['-created_at']
+    export_fields = [
+        'id', 'created_at', 'action', 'entity', 'entity_id', 'performed_by__email', 'user_ip',
+        'user_agent', 'description', 'changes', 'payload', 'severity', 'is_successful', 'error_message',
+    ]
+    export_filename = 'audit-logs'
 
     def get_queryset(self):
         return AuditLog.objects.all().select_related('performed_by')
@@ -86,8 +98,8 @@ class SystemSettingView(generics.RetrieveUpdateAPIView):
 @permission_classes([permissions.AllowAny])
 def system_info(request):
     """Public system information endpoint"""
-    settings = SystemSetting.get_instance()
-    serializer = SystemSettingPublicSerializer(settings)
+    system_settings = SystemSetting.get_instance()
+    serializer = SystemSettingPublicSerializer(system_settings)
     
     # Add basic system info
     system_info = {
@@ -208,7 +220,7 @@ def system_stats(request):
     from blog.models import Article
     from portfolio.models import PortfolioItem
     from contact.models import ContactMessage
-    from files.models import File
+    from files.models import File, StorageUsage
     
     User = get_user_model()
     
@@ -221,8 +233,10 @@ def system_stats(request):
         'published_portfolio_items': PortfolioItem.objects.filter(is_published=True).count(),
         'total_contact_messages': ContactMessage.objects.count(),
         'unread_messages': ContactMessage.objects.filter(status='new').count(),
-        'total_files': File.objects.count(),
-        'total_file_size': File.objects.aggregate(total_size=models.Sum('file_size'))['total_size'] or 0,
+        **StorageUsage.objects.aggregate(
+            total_files=Coalesce(models.Sum('file_count'), 0),
+            total_file_size=Coalesce(models.Sum('total_size'), 0),
+        ),
         'total_audit_logs': AuditLog.objects.count(),
         'total_api_requests': APIRequestLog.objects.count(),
     }
@@ -264,7 +278,7 @@ def system_stats(request):
     })
 
 
-class APIRequestLogListView(generics.ListAPIView):
+class APIRequestLogListView(StreamingExportMixin, generics.ListAPIView):
     serializer_class = APIRequestLogSerializer
     permission_classes = [permissions.IsAdminUser]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -272,6 +286,12 @@ class APIRequestLogListView(generics.ListAPIView):
     search_fields = ['path', 'user__email', 'ip_address']
     ordering_fields = ['created_at', 'response_time', 'status_code']
     ordering = ['-created_at']
+    export_fields = [
+        'id', 'created_at', 'method', 'path', 'query_params', 'status_code', 'response_time',
+        'response_size', 'user__email', 'is_authenticated', 'ip_address', 'user_agent',
+        'exception_type', 'error_message',
+    ]
+    export_filename = 'api-requests'
 
     def get_queryset(self):
         return APIRequestLog.objects.all().select_related('user')
@@ -291,54 +311,20 @@ class APIRequestLogListView(generics.ListAPIView):
 @permission_classes([permissions.IsAdminUser])
 def api_analytics(request):
     """Get API analytics and metrics"""
-    # Time range for analytics (last 30 days)
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    
-    # Basic metrics
-    total_requests = APIRequestLog.objects.filter(created_at__gte=thirty_days_ago).count()
-    successful_requests = APIRequestLog.objects.filter(
-        created_at__gte=thirty_days_ago, status_code__lt=400
-    ).count()
-    error_requests = APIRequestLog.objects.filter(
-        created_at__gte=thirty_days_ago, status_code__gte=400
-    ).count()
-    
-    # Response time statistics
-    response_times = APIRequestLog.objects.filter(
-        created_at__gte=thirty_days_ago
-    ).aggregate(
-        avg_response_time=models.Avg('response_time'),
-        max_response_time=models.Max('response_time'),
-        min_response_time=models.Min('response_time')
-    )
-    
-    # Most frequent endpoints
-    frequent_endpoints = APIRequestLog.objects.filter(
-        created_at__gte=thirty_days_ago
-    ).values('path', 'method').annotate(
-        count=models.Count('id'),
-        avg_time=models.Avg('response_time')
-    ).order_by('-count')[:10]
-    
-    # Error breakdown
-    error_breakdown = APIRequestLog.objects.filter(
-        created_at__gte=thirty_days_ago, status_code__gte=400
-    ).values('status_code').annotate(count=models.Count('id')).order_by('-count')
-    
-    analytics = {
-        'time_period': 'last_30_days',
-        'total_requests': total_requests,
-        'successful_requests': successful_requests,
-        'error_requests': error_requests,
-        'success_rate': round((successful_requests / total_requests * 100), 2) if total_requests > 0 else 0,
-        'response_times': {
-            'average': round(response_times['avg_response_time'] or 0, 2),
-            'max': round(response_times['max_response_time'] or 0, 2),
-            'min': round(response_times['min_response_time'] or 0, 2),
-        },
-        'frequent_endpoints': list(frequent_endpoints),
-        'error_breakdown': list(error_breakdown),
-    }
+    # Rollups only change once a minute, so share the result briefly
+    analytics = cache.get('api-analytics:30d')
+    record_cache('api-analytics', analytics is not None)
+    if analytics is None:
+        # Time range for analytics (last 30 days), read from the hourly rollups
+        thirty_days_ago = timezone.now() - timedelta(days=30)
+        summary = api_summary(thirty_days_ago)
+        total_requests = summary['total_requests']
+        analytics = {
+            'time_period': 'last_30_days',
+            **summary,
+            'success_rate': round((summary['successful_requests'] / total_requests * 100), 2) if total_requests > 0 else 0,
+        }
+        cache.set('api-analytics:30d', analytics, settings.API_ANALYTICS_CACHE_SECONDS)
     
     return Response({
         'status': 'success',